@@ -1,10 +1,31 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from config.database import supabase
+from fastapi.responses import JSONResponse, PlainTextResponse
+from config.database import supabase_config
+from config.health import health_monitor
+from config.metrics import MetricsMiddleware, registry, slow_requests
 from auth.routes import router as auth_router
+from auth.tokens import token_verifier
+from sessions.cache import result_cache
+from sessions.spool import ingest_spool
+from sessions.archive import session_archive
 from sessions.routes import router as sessions_router
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # La sonde tourne en fond : le démarrage n'attend pas Supabase
+    health_monitor.start()
+    # Relecture du spool d'ingestion et flush en fond (si INGEST_SPOOL_DIR est défini)
+    ingest_spool.start()
+    # Archive locale des sessions terminées (SENSOR_STORAGE=archive ou offline)
+    session_archive.open()
+    yield
+    await ingest_spool.stop()
+    await session_archive.stop()
+    await health_monitor.stop()
+
+app = FastAPI(lifespan=lifespan)
 
 # Configuration CORS
 app.add_middleware(
@@ -15,21 +36,50 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Mesures par route ; ajouté en dernier, il englobe aussi CORS
+app.add_middleware(MetricsMiddleware)
+
+# Compteurs internes recopiés à chaque export /metrics
+component_stats = registry.gauge("mokart_component_stat", "Compteurs internes (cache, regroupement, tokens)",
+                                 ("component", "stat"))
+upstream_up = registry.gauge("mokart_upstream_up", "Dernière sonde Supabase réussie et récente (1) ou non (0)")
+
+@registry.collector
+def collect_components():
+    for component, stats in (("result_cache", result_cache.stats()),
+                             ("singleflight", supabase_config.singleflight.stats()),
+                             ("token_verifier", token_verifier.stats()),
+                             ("ingest_spool", ingest_spool.stats()),
+                             ("session_archive", session_archive.stats())):
+        for stat, value in stats.items():
+            component_stats.set(value, component=component, stat=stat)
+    upstream_up.set(1 if health_monitor.ready else 0)
+
 # Inclure les routers
 app.include_router(auth_router)
 app.include_router(sessions_router)
 
 @app.get("/")
 async def main():
-    return {"message": "Mokart API", "status": "running", "supabase": supabase is not None}
+    return {"message": "Mokart API", "status": "running", "supabase": health_monitor.supabase}
 
 @app.get("/health")
 async def health_check():
-    if supabase:
-        try:
-            response = supabase.table('sessions').select('*').limit(1).execute()
-            return {"status": "healthy", "supabase": "connected"}
-        except Exception as e:
-            return {"status": "healthy", "supabase": "disconnected", "error": str(e)}
-    else:
-        return {"status": "healthy", "supabase": "not_configured"}
+    """Vivacité : le processus répond ; l'état amont vient de la dernière sonde"""
+    return {"status": "healthy", **health_monitor.snapshot()}
+
+@app.get("/ready")
+async def readiness_check():
+    """Disponibilité : 503 tant que la dernière sonde Supabase n'est pas récente et réussie"""
+    body = {"ready": health_monitor.ready, **health_monitor.snapshot()}
+    return JSONResponse(body, status_code=200 if health_monitor.ready else 503)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Métriques au format texte Prometheus"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/metrics/slow")
+async def slow_request_profiles():
+    """Dernières requêtes au-delà de PROFILE_SLOW_MS, avec la durée de chaque étape"""
+    return list(slow_requests)
@@ -1,3 +1,4 @@
 from .routes import router
+from .dependencies import current_user, optional_user
 
-__all__ = ["router"]
+__all__ = ["router", "current_user", "optional_user"]
@@ -0,0 +1,94 @@
+import os
+from collections import OrderedDict
+from typing import Iterable, Optional
+from fastapi import Depends, HTTPException, WebSocketException, status
+from fastapi.requests import HTTPConnection
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from auth.tokens import InvalidToken, token_verifier
+from config.database import supabase_config, UpstreamTimeout
+from models.auth import AuthUser
+
+bearer = HTTPBearer(auto_error=False)
+
+# Propriétaires de sessions déjà lus (ils ne changent pas), LRU borné
+OWNER_CACHE_SIZE = int(os.getenv("AUTH_OWNER_CACHE_SIZE", "4096"))
+_owners: "OrderedDict[str, Optional[str]]" = OrderedDict()
+
+async def user_from_token(token: str) -> AuthUser:
+    try:
+        claims = await token_verifier.verify(token)
+    except InvalidToken as e:
+        raise HTTPException(status_code=401, detail=f"Token invalide: {e}", headers={"WWW-Authenticate": "Bearer"})
+    return AuthUser(
+        id=claims['sub'],
+        email=claims.get('email'),
+        role=claims.get('role'),
+        user_metadata=claims.get('user_metadata') or {},
+        app_metadata=claims.get('app_metadata') or {},
+        expires_at=claims.get('exp')
+    )
+
+async def optional_user(credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer)) -> Optional[AuthUser]:
+    """Utilisateur du token Bearer, None sans en-tête Authorization (401 si le token est invalide)"""
+    if credentials is None:
+        return None
+    return await user_from_token(credentials.credentials)
+
+async def current_user(user: Optional[AuthUser] = Depends(optional_user)) -> AuthUser:
+    """Utilisateur authentifié, vérifié localement sans appel à Supabase"""
+    if user is None:
+        raise HTTPException(status_code=401, detail="Non authentifié", headers={"WWW-Authenticate": "Bearer"})
+    return user
+
+async def connection_user(connection: HTTPConnection) -> Optional[AuthUser]:
+    """Comme optional_user, en acceptant aussi ?access_token= : EventSource et WebSocket
+    ne peuvent pas envoyer d'en-tête Authorization depuis un navigateur"""
+    scheme, _, token = connection.headers.get('authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not token:
+        token = connection.query_params.get('access_token')
+    return await user_from_token(token) if token else None
+
+async def check_session_owner(session_ids: Iterable[str], user: Optional[AuthUser]):
+    """401/403 si une des sessions appartient à un autre utilisateur que celui du token
+
+    Les sessions sans propriétaire restent publiques ; une session inconnue est
+    laissée au handler (404). Hors ligne, il n'y a pas de table sessions à consulter.
+    """
+    if supabase_config.offline:
+        return
+    session_ids = list(dict.fromkeys(session_ids))
+    unknown = [session_id for session_id in session_ids if session_id not in _owners]
+    if unknown:
+        client = supabase_config.get_client()
+        if not client:
+            raise HTTPException(status_code=500, detail="Supabase non connecté")
+        try:
+            response = await supabase_config.execute(client.table('sessions').select('id,user_id').in_('id', unknown))
+        except UpstreamTimeout as e:
+            raise HTTPException(status_code=504, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        for row in response.data or []:
+            _owners[row['id']] = row.get('user_id')
+            while len(_owners) > OWNER_CACHE_SIZE:
+                _owners.popitem(last=False)
+    for session_id in session_ids:
+        if session_id not in _owners:
+            continue
+        _owners.move_to_end(session_id)
+        owner = _owners[session_id]
+        if owner is None:
+            continue
+        if user is None:
+            raise HTTPException(status_code=401, detail="Non authentifié", headers={"WWW-Authenticate": "Bearer"})
+        if user.id != owner:
+            raise HTTPException(status_code=403, detail=f"Session {session_id} d'un autre utilisateur")
+
+async def session_owner_guard(session_id: str, connection: HTTPConnection):
+    """Dépendance des routes /{session_id}/… : seul le propriétaire accède à une session privée"""
+    try:
+        await check_session_owner([session_id], await connection_user(connection))
+    except HTTPException as e:
+        if connection.scope['type'] == 'websocket':
+            raise WebSocketException(code=status.WS_1008_POLICY_VIOLATION, reason=str(e.detail))
+        raise
@@ -1,7 +1,8 @@
-from fastapi import APIRouter, HTTPException
-from supabase import create_client
-from config.database import supabase_config
-from models.auth import LoginRequest, RegisterRequest, AuthResponse
+from fastapi import APIRouter, Depends, HTTPException
+from config.database import supabase_config, UpstreamTimeout
+from models.auth import LoginRequest, RegisterRequest, RefreshRequest, AuthResponse, AuthUser
+from auth.dependencies import current_user
+from auth.tokens import token_verifier
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
@@ -9,8 +10,8 @@ router = APIRouter(prefix="/auth", tags=["auth"])
 async def login(request: LoginRequest):
     print(f"🔐 Tentative de connexion pour: {request.email}")
 
-    # Mode démo pour contourner les problèmes Supabase
-    if request.email == "demo@mokart.com" and request.password == "demo123456":
+    # Mode démo pour contourner les problèmes Supabase (AUTH_DEMO_MODE=1, comme le jeton qu'il délivre)
+    if token_verifier.demo_mode and request.email == "demo@mokart.com" and request.password == "demo123456":
         fake_user = {
             "id": "demo-user-123",
             "email": "demo@mokart.com",
@@ -27,15 +28,13 @@ async def login(request: LoginRequest):
         )
 
     # Pour les autres emails, essayer Supabase
-    client = supabase_config.get_client()
+    client = supabase_config.get_auth_client()
     if not client:
         raise HTTPException(status_code=500, detail="Supabase non connecté")
 
     try:
-        # Créer une nouvelle instance du client pour éviter les problèmes d'état
-        client = create_client(supabase_config.supabase_url, supabase_config.supabase_key)
         print("📤 Appel à supabase.auth.sign_in_with_password...")
-        response = client.auth.sign_in_with_password({
+        response = await supabase_config.run(client.auth.sign_in_with_password, {
             "email": request.email,
             "password": request.password
         })
@@ -53,6 +52,10 @@ async def login(request: LoginRequest):
         else:
             raise HTTPException(status_code=401, detail="Identifiants invalides")
 
+    except HTTPException:
+        raise
+    except UpstreamTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         print(f"❌ Erreur complète: {repr(e)}")
         print(f"📝 Type d'erreur: {type(e)}")
@@ -62,8 +65,7 @@ async def login(request: LoginRequest):
             print("🔄 Tentative de création automatique...")
             try:
                 # Créer l'utilisateur automatiquement
-                client = create_client(supabase_config.supabase_url, supabase_config.supabase_key)
-                signup_response = client.auth.sign_up({
+                signup_response = await supabase_config.run(client.auth.sign_up, {
                     "email": request.email,
                     "password": request.password,
                     "options": {
@@ -74,9 +76,16 @@ async def login(request: LoginRequest):
 
                 print(f"✅ Inscription: {signup_response.user}")
 
-                if signup_response.user:
+                if signup_response.user and signup_response.session:
+                    # Confirmation email désactivée : l'inscription ouvre déjà la session
+                    return AuthResponse(
+                        user=signup_response.user.model_dump(),
+                        session=signup_response.session.model_dump(),
+                        message="Compte créé et connexion réussie"
+                    )
+                elif signup_response.user:
                     # Connecter automatiquement après l'inscription
-                    login_response = client.auth.sign_in_with_password({
+                    login_response = await supabase_config.run(client.auth.sign_in_with_password, {
                         "email": request.email,
                         "password": request.password
                     })
@@ -88,6 +97,10 @@ async def login(request: LoginRequest):
                     )
                 else:
                     raise HTTPException(status_code=400, detail="Erreur lors de la création du compte")
+            except HTTPException:
+                raise
+            except UpstreamTimeout as timeout_error:
+                raise HTTPException(status_code=504, detail=str(timeout_error))
             except Exception as signup_error:
                 print(f"❌ Erreur inscription: {repr(signup_error)}")
                 # Si l'email n'est pas confirmé, on retourne un message spécial
@@ -103,13 +116,13 @@ async def login(request: LoginRequest):
 
 @router.post("/register", response_model=AuthResponse)
 async def register(request: RegisterRequest):
-    client = supabase_config.get_client()
+    client = supabase_config.get_auth_client()
     if not client:
         raise HTTPException(status_code=500, detail="Supabase non connecté")
 
     try:
         # Créer l'utilisateur
-        response = client.auth.sign_up({
+        response = await supabase_config.run(client.auth.sign_up, {
             "email": request.email,
             "password": request.password,
             "options": {
@@ -128,37 +141,60 @@ async def register(request: RegisterRequest):
         else:
             raise HTTPException(status_code=400, detail="Erreur lors de la création du compte")
 
+    except HTTPException:
+        raise
+    except UpstreamTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Erreur d'inscription: {str(e)}")
 
-@router.post("/logout")
-async def logout():
-    return {"message": "Déconnexion réussie"}
-
-@router.get("/me")
-async def get_current_user():
-    client = supabase_config.get_client()
+@router.post("/refresh", response_model=AuthResponse)
+async def refresh(request: RefreshRequest):
+    """Nouvel access token à partir du refresh token"""
+    client = supabase_config.get_auth_client()
     if not client:
         raise HTTPException(status_code=500, detail="Supabase non connecté")
 
     try:
-        response = client.auth.get_user()
-        if response.user:
-            return {"user": response.user.model_dump()}
+        response = await supabase_config.run(client.auth.refresh_session, request.refresh_token)
+        if response.user and response.session:
+            return AuthResponse(
+                user=response.user.model_dump(),
+                session=response.session.model_dump(),
+                message="Session rafraîchie"
+            )
         else:
-            raise HTTPException(status_code=401, detail="Non authentifié")
+            raise HTTPException(status_code=401, detail="Refresh token invalide")
+    except HTTPException:
+        raise
+    except UpstreamTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=401, detail=f"Erreur d'authentification: {str(e)}")
+        raise HTTPException(status_code=401, detail=f"Erreur de rafraîchissement: {str(e)}")
+
+@router.post("/logout")
+async def logout():
+    return {"message": "Déconnexion réussie"}
+
+@router.get("/me")
+async def get_current_user(user: AuthUser = Depends(current_user)):
+    """Utilisateur du token Bearer, vérifié localement (aucun appel à Supabase)"""
+    return {"user": user.model_dump()}
+
+@router.get("/tokens")
+async def get_token_cache_stats():
+    """Compteurs du cache de vérification des tokens"""
+    return token_verifier.stats()
 
 @router.get("/test")
 async def test_auth():
-    client = supabase_config.get_client()
+    client = supabase_config.get_auth_client()
     if not client:
         raise HTTPException(status_code=500, detail="Supabase non connecté")
 
     try:
         # Créer un utilisateur de test
-        response = client.auth.sign_up({
+        response = await supabase_config.run(client.auth.sign_up, {
             "email": "demo@mokart.com",
             "password": "demo123456",
             "options": {
@@ -0,0 +1,150 @@
+"""Vérification locale des access tokens Supabase
+
+Les tokens sont vérifiés sur place, sans appel à Supabase : secret HS256 du
+projet (SUPABASE_JWT_SECRET) ou clés publiques du JWKS du projet, gardées en
+mémoire et rechargées seulement quand un `kid` inconnu apparaît. Les claims
+décodés sont gardés dans un LRU jusqu'à l'expiration du token.
+PyJWT (et cryptography) ne sont importés qu'à la première vérification.
+"""
+import asyncio
+import functools
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from config.database import supabase_config
+
+JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+JWT_AUDIENCE = os.getenv("SUPABASE_JWT_AUDIENCE", "authenticated")
+JWKS_URL = os.getenv("SUPABASE_JWKS_URL", f"{supabase_config.supabase_url}/auth/v1/.well-known/jwks.json")
+# Un kid inconnu ne déclenche pas plus d'un rechargement du JWKS par intervalle
+JWKS_MIN_REFRESH = float(os.getenv("SUPABASE_JWKS_MIN_REFRESH", "60"))
+CLAIMS_CACHE_SIZE = int(os.getenv("AUTH_CLAIMS_CACHE_SIZE", "4096"))
+# Tolérance (s) sur exp/iat pour les horloges légèrement décalées
+LEEWAY = 10
+
+# Jeton du mode démo de /auth/login, accepté seulement avec AUTH_DEMO_MODE=1
+DEMO_MODE = os.getenv("AUTH_DEMO_MODE", "0") == "1"
+DEMO_TOKEN = "demo-token"
+DEMO_CLAIMS = {
+    "sub": "demo-user-123",
+    "email": "demo@mokart.com",
+    "role": "authenticated",
+    "user_metadata": {"vehicle_model": "Demo Kart"},
+}
+
+ASYMMETRIC_ALGORITHMS = ["RS256", "ES256", "EdDSA"]
+
+
+class InvalidToken(Exception):
+    """Token absent, mal formé, expiré ou à la signature invalide"""
+
+
+class TokenVerifier:
+    def __init__(self, secret: Optional[str] = JWT_SECRET, jwks_url: Optional[str] = JWKS_URL,
+                 audience: Optional[str] = JWT_AUDIENCE, cache_size: int = CLAIMS_CACHE_SIZE,
+                 demo_mode: bool = DEMO_MODE):
+        self.secret = secret
+        self.jwks_url = jwks_url
+        self.audience = audience
+        self.cache_size = cache_size
+        self.demo_mode = demo_mode
+        self._claims: "OrderedDict[str, dict]" = OrderedDict()
+        self._keys: Dict[str, "jwt.PyJWK"] = {}
+        self._jwks_loaded_at = 0.0
+        self._jwks_loading: Optional[asyncio.Future] = None
+        self.hits = 0
+        self.misses = 0
+        self.jwks_fetches = 0
+
+    async def verify(self, token: str) -> dict:
+        """Claims du token, depuis le cache tant qu'il n'a pas expiré"""
+        if self.demo_mode and token == DEMO_TOKEN:
+            return DEMO_CLAIMS
+
+        claims = self._claims.get(token)
+        if claims is not None:
+            if claims.get('exp', 0) + LEEWAY > time.time():
+                self._claims.move_to_end(token)
+                self.hits += 1
+                return claims
+            del self._claims[token]
+
+        self.misses += 1
+        claims = self._decode(token, await self._key_for(token))
+        self._claims[token] = claims
+        while len(self._claims) > self.cache_size:
+            self._claims.popitem(last=False)
+        return claims
+
+    async def _key_for(self, token: str):
+        import jwt
+        try:
+            header = jwt.get_unverified_header(token)
+        except jwt.PyJWTError as e:
+            raise InvalidToken(f"Token mal formé: {e}")
+
+        algorithm = header.get('alg')
+        if algorithm == 'HS256':
+            if not self.secret:
+                raise InvalidToken("Token HS256 mais SUPABASE_JWT_SECRET n'est pas configuré")
+            return self.secret, algorithm
+        if algorithm not in ASYMMETRIC_ALGORITHMS:
+            raise InvalidToken(f"Algorithme non accepté: {algorithm}")
+
+        kid = header.get('kid')
+        key = self._keys.get(kid)
+        if key is None:
+            await self._refresh_jwks()
+            key = self._keys.get(kid)
+        if key is None:
+            raise InvalidToken(f"Clé de signature inconnue: {kid}")
+        return key.key, algorithm
+
+    async def _refresh_jwks(self):
+        """Un seul rechargement à la fois ; les requêtes simultanées attendent le même"""
+        if self._jwks_loading is None:
+            if time.monotonic() - self._jwks_loaded_at < JWKS_MIN_REFRESH:
+                return
+            self._jwks_loading = asyncio.ensure_future(self._load_jwks())
+        loading = self._jwks_loading
+        try:
+            await asyncio.shield(loading)
+        finally:
+            if self._jwks_loading is loading and loading.done():
+                self._jwks_loading = None
+
+    async def _load_jwks(self):
+        """Recharger les clés publiques du projet (seul appel réseau de la vérification)"""
+        import httpx
+        import jwt
+        self._jwks_loaded_at = time.monotonic()
+        self.jwks_fetches += 1
+        try:
+            fetch = functools.partial(httpx.get, self.jwks_url, timeout=supabase_config.query_timeout)
+            response = await supabase_config.run(fetch)
+            response.raise_for_status()
+            keys = jwt.PyJWKSet.from_dict(response.json()).keys
+        except Exception as e:
+            print(f"⚠️ Chargement du JWKS impossible: {e}")
+            return
+        self._keys = {key.key_id: key for key in keys}
+
+    def _decode(self, token: str, key) -> dict:
+        import jwt
+        secret, algorithm = key
+        try:
+            return jwt.decode(
+                token, secret, algorithms=[algorithm], audience=self.audience, leeway=LEEWAY,
+                options={"require": ["exp", "sub"], "verify_aud": self.audience is not None}
+            )
+        except jwt.PyJWTError as e:
+            raise InvalidToken(str(e))
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "cached": len(self._claims),
+                "jwks_fetches": self.jwks_fetches, "signing_keys": len(self._keys)}
+
+
+token_verifier = TokenVerifier()
@@ -0,0 +1,71 @@
+"""Lectures d'une session terminée : pages PostgREST vs archive SQLite locale
+
+Supabase est simulé (benchmarks.fake_supabase) avec une latence par page ;
+l'archive est un fichier temporaire. Mesure la fenêtre entière en colonnes
+(stats, trajectoire, cartes de chaleur) et une page de données brutes.
+
+Usage: python -m benchmarks.archive_reads [nb_lignes] [latence_ms]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.fake_supabase import FakeClient
+from benchmarks.load import synthetic_rows
+from sessions.archive import SessionArchive
+from sessions.paging import SENSOR_COLUMNS, fetch_arrays, fetch_page, upstream_pages
+from sessions.stats import STATS_COLUMNS
+import sessions.paging as paging
+
+SESSION_ID = "bench-archive"
+RUNS = 5
+
+
+async def timed(fn, runs: int = RUNS) -> float:
+    """Meilleur temps (ms) sur `runs` exécutions"""
+    best = float('inf')
+    for _ in range(runs):
+        start = time.perf_counter()
+        await fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+async def run(n_rows: int, latency_ms: float):
+    client = FakeClient(latency=latency_ms / 1000)
+    client.tables['sensor_data'] = synthetic_rows(SESSION_ID, 0, n_rows, 0)
+
+    with tempfile.TemporaryDirectory() as directory:
+        archive = SessionArchive(os.path.join(directory, "archive.sqlite3"), mode="archive", delay=0)
+        archive.open()
+        paging.session_archive = archive
+
+        upstream_frame = await timed(lambda: fetch_arrays(client, SESSION_ID, STATS_COLUMNS), runs=1)
+        upstream_row_page = await timed(lambda: fetch_page(client, SESSION_ID, SENSOR_COLUMNS, cursor=n_rows * 5))
+
+        start = time.perf_counter()
+        await archive.snapshot(SESSION_ID, upstream_pages(client, SESSION_ID, SENSOR_COLUMNS))
+        snapshot_s = time.perf_counter() - start
+
+        local_frame = await timed(lambda: fetch_arrays(client, SESSION_ID, STATS_COLUMNS))
+        local_row_page = await timed(lambda: fetch_page(client, SESSION_ID, SENSOR_COLUMNS, cursor=n_rows * 5))
+        size = os.path.getsize(archive.path)
+        await archive.stop()
+
+    print(f"{n_rows} lignes, latence amont {latency_ms} ms par page")
+    print(f"copie vers l'archive : {snapshot_s * 1000:.0f} ms, {size / 1024 / 1024:.1f} Mo sur disque")
+    print(f"fenêtre entière (stats) : Supabase {upstream_frame:8.1f} ms | archive {local_frame:7.1f} ms "
+          f"(x{upstream_frame / local_frame:.0f})")
+    print(f"page de 1000 lignes     : Supabase {upstream_row_page:8.1f} ms | archive {local_row_page:7.1f} ms")
+
+
+def main():
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    latency_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 20
+    asyncio.run(run(n_rows, latency_ms))
+
+
+if __name__ == "__main__":
+    main()
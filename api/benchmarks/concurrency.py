@@ -0,0 +1,96 @@
+"""Latence de queue sous charge mixte : appels Supabase bloquants vs pool de threads
+
+Des requêtes lentes (stats, table sensor_data) tournent en parallèle de requêtes
+rapides (liste des sessions). Avec des appels synchrones dans les handlers async,
+chaque requête lente gèle la boucle et les requêtes rapides héritent de sa latence.
+
+Les requêtes « pool » passent par l'application ASGI (httpx.ASGITransport).
+
+Usage: python -m benchmarks.concurrency [nb_rapides] [nb_lentes] [latence_lente_ms]
+"""
+import asyncio
+import contextlib
+import os
+import sys
+import time
+
+import httpx
+
+from benchmarks.fake_supabase import FakeClient
+from config.database import supabase_config
+
+SESSION_ID = "bench-session"
+
+
+async def blocking_get_sessions():
+    # Comportement historique : .execute() appelé directement dans le handler async
+    return supabase_config.get_client().table('sessions').select('*').execute().data
+
+
+async def blocking_get_session_stats(session_id):
+    return supabase_config.get_client().table('sensor_data').select('*').eq('session_id', session_id).execute().data
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))]
+
+
+async def timed(coro, arrival, latencies):
+    # Latence mesurée depuis l'arrivée de la requête, attente dans la boucle comprise
+    await coro
+    latencies.append((time.perf_counter() - arrival) * 1000)
+
+
+async def mixed_load(fast_fn, slow_fn, n_fast, n_slow):
+    fast, slow = [], []
+    start = time.perf_counter()
+    tasks = [timed(slow_fn(SESSION_ID), start, slow) for _ in range(n_slow)]
+    tasks += [timed(fast_fn(), start, fast) for _ in range(n_fast)]
+    await asyncio.gather(*tasks)
+    return fast, slow, time.perf_counter() - start
+
+
+async def pooled_load(app, n_fast, n_slow):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as http:
+        async def get_sessions():
+            (await http.get("/sessions/")).raise_for_status()
+
+        async def get_session_stats(session_id):
+            (await http.get(f"/sessions/{session_id}/stats")).raise_for_status()
+
+        # Les handlers journalisent à chaque requête : coût conservé, sortie masquée
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            return await mixed_load(get_sessions, get_session_stats, n_fast, n_slow)
+
+
+def report(label, fast, slow, elapsed):
+    print(f"{label:<9} rapides p50={percentile(fast, 50):7.1f} ms  p99={percentile(fast, 99):7.1f} ms  |  "
+          f"lentes p99={percentile(slow, 99):7.1f} ms  |  total {elapsed:.2f} s")
+
+
+def main():
+    n_fast = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    n_slow = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    slow_latency = float(sys.argv[3]) / 1000 if len(sys.argv) > 3 else 0.2
+
+    client = FakeClient(latency=0.005, table_latency={'sensor_data': slow_latency})
+    client.tables['sessions'] = [{"id": SESSION_ID}]
+    client.tables['sensor_data'] = [
+        {"session_id": SESSION_ID, "timestamp": i * 10, "uwb_x": float(i), "uwb_y": float(i),
+         "imu_ax": 0.0, "steering_angle": 0.0}
+        for i in range(100)
+    ]
+    supabase_config.client = client
+    supabase_config._connected = True
+
+    # Import après l'installation du faux client : l'application ne se connecte jamais
+    from app import app
+
+    report("bloquant", *asyncio.run(mixed_load(blocking_get_sessions, blocking_get_session_stats, n_fast, n_slow)))
+    report("pool", *asyncio.run(pooled_load(app, n_fast, n_slow)))
+
+
+if __name__ == "__main__":
+    main()
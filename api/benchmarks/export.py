@@ -0,0 +1,54 @@
+"""Export multi-sessions : sessions lues une à une vs en parallèle
+
+Supabase est simulé (benchmarks.fake_supabase) avec une latence par page ; le
+filtrage du faux client coûte du CPU, d'où des sessions courtes par défaut.
+Le CSV est produit puis jeté ; mesure la durée et le pic mémoire (tracemalloc)
+pour vérifier qu'il ne dépend pas du volume exporté.
+
+Usage: python -m benchmarks.export [nb_sessions] [lignes_par_session] [latence_ms]
+"""
+import asyncio
+import sys
+import time
+import tracemalloc
+
+from benchmarks.fake_supabase import FakeClient
+from benchmarks.load import synthetic_rows
+from sessions.export import CsvExport, export_frames, parse_columns
+
+
+async def export(client, session_ids, concurrency: int) -> tuple[int, float, int]:
+    exporter = CsvExport(parse_columns(None))
+    size = 0
+    tracemalloc.start()
+    start = time.perf_counter()
+    async for frame in export_frames(client, session_ids, exporter.columns, concurrency=concurrency):
+        size += len(exporter.write(frame))
+    size += len(exporter.close())
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, elapsed, peak
+
+
+async def run(n_sessions: int, n_rows: int, latency_ms: float):
+    client = FakeClient(latency=latency_ms / 1000)
+    session_ids = [f"bench-export-{i}" for i in range(n_sessions)]
+    client.tables['sensor_data'] = [row for i, session_id in enumerate(session_ids)
+                                    for row in synthetic_rows(session_id, 0, n_rows, i)]
+    print(f"{n_sessions} sessions de {n_rows} lignes, latence amont {latency_ms} ms par page")
+    for concurrency in (1, 4, 8):
+        size, elapsed, peak = await export(client, session_ids, concurrency)
+        print(f"parallélisme {concurrency} : {elapsed * 1000:8.0f} ms, {size / 1024 / 1024:6.1f} Mo de CSV, "
+              f"pic mémoire {peak / 1024 / 1024:5.1f} Mo")
+
+
+def main():
+    n_sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    n_rows = int(sys.argv[2]) if len(sys.argv) > 2 else 5_000
+    latency_ms = float(sys.argv[3]) if len(sys.argv) > 3 else 100
+    asyncio.run(run(n_sessions, n_rows, latency_ms))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""Client Supabase en mémoire pour les benchmarks (aucun accès réseau)
+
+Tables PostgREST (lectures filtrées, triées, insertions, mises à jour) et
+auth (inscription, connexion, refresh), chaque appel payant une latence
+réseau simulée.
+"""
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+        self.count = None
+
+
+class FakeQuery:
+    def __init__(self, db, table):
+        self.db = db
+        self.table = table
+        self.action = 'select'
+        self.payload = None
+        self.filters = []
+        self.session_id = None
+        self.params = []
+        self.row_limit = None
+        self.order_by = None
+
+    def select(self, *columns, **kwargs):
+        self.action = 'select'
+        self.params.append(('select', columns))
+        return self
+
+    @property
+    def request(self):
+        # Même identité que les requêtes postgrest-py, pour le regroupement des lectures
+        method = 'GET' if self.action == 'select' else 'POST'
+        return SimpleNamespace(http_method=method, path=self.table, params=tuple(self.params), headers={})
+
+    def insert(self, json, **kwargs):
+        self.action = 'insert'
+        self.payload = json if isinstance(json, list) else [json]
+        self.returning = kwargs.get('returning', 'representation')
+        return self
+
+    def update(self, json, **kwargs):
+        self.action = 'update'
+        self.payload = json
+        return self
+
+    def limit(self, size, **kwargs):
+        self.params.append(('limit', size))
+        self.row_limit = size
+        return self
+
+    def eq(self, column, value):
+        self.params.append(('eq', column, value))
+        if column == 'session_id':
+            self.session_id = value
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def in_(self, column, values):
+        values = list(values)
+        self.params.append(('in', column, tuple(values)))
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def gt(self, column, value):
+        self.params.append(('gt', column, value))
+        self.filters.append(lambda row: row.get(column) is not None and row[column] > value)
+        return self
+
+    def gte(self, column, value):
+        self.params.append(('gte', column, value))
+        self.filters.append(lambda row: row.get(column) is not None and row[column] >= value)
+        return self
+
+    def lte(self, column, value):
+        self.params.append(('lte', column, value))
+        self.filters.append(lambda row: row.get(column) is not None and row[column] <= value)
+        return self
+
+    def order(self, column, desc=False, **kwargs):
+        self.params.append(('order', column, desc))
+        self.order_by = (column, desc)
+        return self
+
+    def execute(self):
+        # Un aller-retour réseau simulé par requête, quelle que soit sa taille
+        time.sleep(self.db.table_latency.get(self.table, self.db.latency))
+        self.db.calls += 1
+        rows = self.db.tables.setdefault(self.table, [])
+        if self.action == 'insert':
+            rows.extend(self.payload)
+            return FakeResponse([] if self.returning == 'minimal' else list(self.payload))
+        if self.session_id is not None:
+            # Index par session : le coût d'une lecture ne dépend pas de la taille de la table
+            rows = self.db.session_rows(self.table, self.session_id)
+        matched = [row for row in rows if all(f(row) for f in self.filters)]
+        if self.order_by:
+            column, desc = self.order_by
+            matched.sort(key=lambda row: row[column], reverse=desc)
+        if self.action == 'update':
+            for row in matched:
+                row.update(self.payload)
+        return FakeResponse(matched[:self.row_limit])
+
+
+class FakeModel(SimpleNamespace):
+    """Objet réponse de l'auth (User, Session), sérialisable comme les modèles du SDK"""
+
+    def model_dump(self):
+        return dict(vars(self))
+
+
+class FakeAuth:
+    def __init__(self, db):
+        self.db = db
+        self.users = {}
+        self.refresh_tokens = {}
+
+    def _session(self, user: FakeModel) -> FakeModel:
+        refresh_token = uuid.uuid4().hex
+        self.refresh_tokens[refresh_token] = user
+        return FakeModel(access_token=uuid.uuid4().hex, refresh_token=refresh_token,
+                         token_type="bearer", expires_in=3600, user=user.model_dump())
+
+    def _call(self):
+        time.sleep(self.db.table_latency.get('auth', self.db.latency))
+        self.db.calls += 1
+
+    def sign_up(self, credentials):
+        self._call()
+        email = credentials['email']
+        if email in self.users:
+            raise Exception("User already registered")
+        metadata = credentials.get('options', {}).get('data', {})
+        user = FakeModel(id=str(uuid.uuid4()), email=email, role="authenticated", user_metadata=metadata)
+        self.users[email] = (user, credentials['password'])
+        return FakeModel(user=user, session=self._session(user))
+
+    def sign_in_with_password(self, credentials):
+        self._call()
+        user, password = self.users.get(credentials['email'], (None, None))
+        if user is None or password != credentials['password']:
+            raise Exception("Invalid login credentials")
+        return FakeModel(user=user, session=self._session(user))
+
+    def refresh_session(self, refresh_token):
+        self._call()
+        user = self.refresh_tokens.pop(refresh_token, None)
+        if user is None:
+            raise Exception("Invalid Refresh Token")
+        return FakeModel(user=user, session=self._session(user))
+
+
+class FakeClient:
+    def __init__(self, latency: float = 0.002, table_latency: dict = None):
+        self.latency = latency
+        self.table_latency = table_latency or {}
+        self.tables = {}
+        self.calls = 0
+        self.auth = FakeAuth(self)
+        self._partitions = {}
+        self._lock = threading.Lock()
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+    def session_rows(self, table, session_id):
+        """Lignes d'une session, index complété au fil des insertions (tables en ajout seul)"""
+        with self._lock:
+            rows = self.tables.setdefault(table, [])
+            indexed, partitions = self._partitions.get(table, (0, {}))
+            for row in rows[indexed:]:
+                partitions.setdefault(row.get('session_id'), []).append(row)
+            self._partitions[table] = (len(rows), partitions)
+            return list(partitions.get(session_id, []))
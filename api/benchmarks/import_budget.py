@@ -0,0 +1,60 @@
+"""Budget de temps d'import de l'API
+
+Importe `app` dans des processus neufs et vérifie que l'import reste sous le
+budget et ne crée aucun client Supabase (ni n'importe le SDK). Code de sortie
+non nul en cas de dépassement : lancé en CI (job import-budget).
+
+Usage: python -m benchmarks.import_budget [budget_ms] [essais]
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+IMPORT_BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", "1000"))
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import app
+elapsed = (time.perf_counter() - start) * 1000
+from config.database import supabase_config
+print(json.dumps({
+    "ms": elapsed,
+    "client": supabase_config.client is not None,
+    "sdk": "supabase" in sys.modules,
+}))
+"""
+
+
+def measure() -> dict:
+    api_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run([sys.executable, "-c", PROBE], cwd=api_dir, capture_output=True, text=True, check=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def main():
+    budget = float(sys.argv[1]) if len(sys.argv) > 1 else IMPORT_BUDGET_MS
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    results = [measure() for _ in range(runs)]
+    times = [result["ms"] for result in results]
+    median = statistics.median(times)
+    print(f"import app : médiane {median:.0f} ms, min {min(times):.0f} ms, max {max(times):.0f} ms (budget {budget:.0f} ms)")
+
+    failures = []
+    if median > budget:
+        failures.append(f"import trop lent ({median:.0f} ms > {budget:.0f} ms)")
+    if any(result["client"] for result in results):
+        failures.append("un client Supabase est créé à l'import")
+    if any(result["sdk"] for result in results):
+        failures.append("le SDK supabase est importé à l'import")
+    for failure in failures:
+        print(f"❌ {failure}")
+    if failures:
+        sys.exit(1)
+    print("✅ Budget respecté")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Comparer l'ingestion ligne par ligne et l'ingestion batch
+
+Les requêtes passent par l'application ASGI (httpx.ASGITransport) : routage,
+validation et sérialisation sont mesurés comme en production.
+
+Usage: python -m benchmarks.ingest_throughput [nb_lignes] [latence_ms]
+"""
+import asyncio
+import contextlib
+import math
+import os
+import sys
+import time
+
+import httpx
+
+from benchmarks.fake_supabase import FakeClient
+from config.database import supabase_config
+from sessions.ingest import MAX_BATCH_ROWS
+
+SESSION_ID = "bench-session"
+
+
+def make_rows(n: int) -> list[dict]:
+    return [
+        dict(
+            session_id=SESSION_ID,
+            timestamp=i * 10,
+            uwb_x=20 * math.cos(i / 100), uwb_y=20 * math.sin(i / 100), uwb_z=0.0,
+            imu_ax=0.0, imu_ay=1.25, imu_az=9.81,
+            imu_gx=0.0, imu_gy=0.0, imu_gz=0.25,
+            steering_angle=14.0
+        )
+        for i in range(n)
+    ]
+
+
+async def bench_single(http, rows):
+    for row in rows:
+        response = await http.post(f"/sessions/{SESSION_ID}/sensor-data", json=row)
+        response.raise_for_status()
+
+
+async def bench_batch(http, rows):
+    for start in range(0, len(rows), MAX_BATCH_ROWS):
+        response = await http.post(f"/sessions/{SESSION_ID}/sensor-data/batch",
+                                   json=rows[start:start + MAX_BATCH_ROWS])
+        response.raise_for_status()
+
+
+async def timed(app, bench_fn, rows) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as http:
+        # Les handlers journalisent à chaque requête : coût conservé, sortie masquée
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            await bench_fn(http, rows)
+            return time.perf_counter() - start
+
+
+def run(app, label, bench_fn, rows, latency):
+    client = FakeClient(latency=latency)
+    supabase_config.client = client
+    supabase_config._connected = True
+    elapsed = asyncio.run(timed(app, bench_fn, rows))
+    stored = len(client.tables.get('sensor_data', []))
+    print(f"{label:<8} {len(rows):>7} lignes  {elapsed:8.3f} s  {len(rows) / elapsed:12.0f} lignes/s  ({stored} stockées)")
+    return elapsed
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    latency = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.002
+    rows = make_rows(n)
+
+    # Import après l'installation du faux client : l'application ne se connecte jamais
+    supabase_config.client = FakeClient()
+    supabase_config._connected = True
+    from app import app
+
+    single = run(app, "single", bench_single, rows, latency)
+    batch = run(app, "batch", bench_batch, rows, latency)
+    print(f"speedup  x{single / batch:.1f}")
+
+
+if __name__ == "__main__":
+    main()
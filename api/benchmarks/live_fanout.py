@@ -0,0 +1,79 @@
+"""Diffusion en direct : coût de publication et latence de livraison par spectateur
+
+Un kart publie des deltas de points ; des centaines d'abonnés les consomment,
+dont une part volontairement lente (leur file déborde et applique sa
+politique). Aucun accès base : seul le hub est mesuré.
+
+Usage: python -m benchmarks.live_fanout [nb_spectateurs] [nb_deltas] [points_par_delta]
+"""
+import asyncio
+import sys
+import time
+
+from sessions.live import LiveHub
+
+SESSION_ID = "bench-live"
+# Un spectateur sur SLOW_EVERY met SLOW_DELAY secondes à traiter chaque message
+SLOW_EVERY = 10
+SLOW_DELAY = 0.2
+
+
+def make_rows(start: int, n: int) -> list[dict]:
+    return [{"session_id": SESSION_ID, "timestamp": i * 10, "uwb_x": float(i), "uwb_y": float(-i),
+             "steering_angle": 0.0} for i in range(start, start + n)]
+
+
+async def consume(subscriber, slow: bool, published_at: dict, lags: list, received: list):
+    while True:
+        message = await subscriber.next_message()
+        if message is None:
+            return
+        # Délai entre la publication du point le plus récent du message et sa réception
+        last_ts = int(message.rsplit('"timestamp":', 1)[1].split(',', 1)[0])
+        if not slow:
+            lags.append((time.perf_counter() - published_at[last_ts]) * 1000)
+        received[0] += message.count('"timestamp"')
+        if slow:
+            await asyncio.sleep(SLOW_DELAY)
+
+
+async def run(n_viewers: int, n_deltas: int, points: int, policy: str, interval_ms):
+    hub = LiveHub(backlog_points=0)
+    subscribers = [hub.subscribe(SESSION_ID, interval_ms, policy, max_points=256) for _ in range(n_viewers)]
+    received = [[0] for _ in subscribers]
+    published_at, lags = {}, []
+    consumers = [asyncio.create_task(consume(subscriber, i % SLOW_EVERY == 0, published_at, lags, received[i]))
+                 for i, subscriber in enumerate(subscribers)]
+
+    publish_ms = []
+    for k in range(n_deltas):
+        rows = make_rows(k * points, points)
+        start = time.perf_counter()
+        published_at.update((row['timestamp'], start) for row in rows)
+        hub.publish(SESSION_ID, rows)
+        publish_ms.append((time.perf_counter() - start) * 1000)
+        # Laisser les spectateurs rapides vider leur file avant le delta suivant
+        await asyncio.sleep(0)
+    hub.close(SESSION_ID)
+    await asyncio.gather(*consumers)
+
+    publish_ms.sort()
+    lags.sort()
+    fast = [r[0] for i, r in enumerate(received) if i % SLOW_EVERY]
+    slow = [r[0] for i, r in enumerate(received) if not i % SLOW_EVERY]
+    print(f"{policy:<12} intervalle={interval_ms or '-':<5} publication p50={publish_ms[len(publish_ms) // 2]:.3f} ms "
+          f"p99={publish_ms[int(len(publish_ms) * 0.99)]:.3f} ms | livraison p99={lags[int(len(lags) * 0.99)]:.2f} ms | "
+          f"points reçus rapides={min(fast)} lents={min(slow)}..{max(slow)}")
+
+
+def main():
+    n_viewers = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    n_deltas = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    points = int(sys.argv[3]) if len(sys.argv) > 3 else 10
+    print(f"{n_viewers} spectateurs, {n_deltas} deltas de {points} points")
+    for policy, interval_ms in (('drop-oldest', None), ('conflate', None), ('drop-oldest', 100)):
+        asyncio.run(run(n_viewers, n_deltas, points, policy, interval_ms))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""Charge reproductible sur l'API complète, contre le Supabase en mémoire
+
+Les requêtes passent par l'application ASGI entière (middlewares, validation,
+sérialisation) via httpx, sans réseau : la base et l'auth sont le FakeClient,
+amorcé de sessions synthétiques. Chaque scénario envoie un nombre fixe de
+requêtes avec une concurrence donnée ; le rapport JSON donne débit, erreurs
+et latences p50/p95/p99. Avec --baseline, un p95 en hausse de plus de
+--tolerance par rapport à un rapport précédent fait échouer la commande.
+
+Usage: python -m benchmarks.load [--scenarios list,stats] [--concurrency 16]
+       [--requests 200] [--output rapport.json] [--baseline ancien.json]
+"""
+import argparse
+import asyncio
+import contextlib
+import itertools
+import json
+import math
+import os
+import platform
+import random
+import sys
+import time
+
+import httpx
+
+from benchmarks.fake_supabase import FakeClient
+from config.database import supabase_config
+from auth.tokens import DEMO_CLAIMS, DEMO_TOKEN, token_verifier
+
+SCENARIOS = ['list', 'ingest_single', 'ingest_batch', 'stats', 'trajectory', 'login']
+PASSWORD = "bench-password"
+# Une requête de chauffe par scénario et par worker, hors mesures
+WARMUP = 1
+
+
+def synthetic_rows(session_id: str, start: int, n: int, seed: int) -> list[dict]:
+    """Tours d'un ovale bruité à 100 Hz, IMU comprise"""
+    rng = random.Random(seed)
+    rows = []
+    for i in range(start, start + n):
+        angle = i / 400 * 2 * math.pi
+        rows.append({
+            "session_id": session_id, "timestamp": i * 10,
+            "uwb_x": 40 * math.cos(angle) + rng.gauss(0, 0.05),
+            "uwb_y": 20 * math.sin(angle) + rng.gauss(0, 0.05), "uwb_z": 0.0,
+            "imu_ax": rng.gauss(0, 0.3), "imu_ay": 3.0 + rng.gauss(0, 0.3), "imu_az": 9.81,
+            "imu_gx": 0.0, "imu_gy": 0.0, "imu_gz": 0.4 + rng.gauss(0, 0.02),
+            "steering_angle": 12.0 + rng.gauss(0, 1.0),
+        })
+    return rows
+
+
+def seed(client: FakeClient, n_sessions: int, n_points: int, n_users: int) -> dict:
+    """Sessions de lecture (avec points), sessions d'écriture (vides), comptes de connexion"""
+    read_ids = [f"bench-read-{i}" for i in range(n_sessions)]
+    write_ids = [f"bench-write-{i}" for i in range(n_sessions)]
+    client.tables['sessions'] = [
+        {"id": session_id, "user_id": DEMO_CLAIMS['sub'], "vehicle_model": "Bench Kart",
+         "created_at": f"2026-01-01T00:{i // 60:02d}:{i % 60:02d}+00:00", "ended_at": None}
+        for i, session_id in enumerate(read_ids + write_ids)
+    ]
+    client.tables['sensor_data'] = [
+        row for i, session_id in enumerate(read_ids) for row in synthetic_rows(session_id, 0, n_points, i)
+    ]
+    emails = [f"pilot{i}@bench.local" for i in range(n_users)]
+    for email in emails:
+        client.auth.sign_up({"email": email, "password": PASSWORD})
+    return {"read": read_ids, "write": write_ids, "emails": emails}
+
+
+class Scenarios:
+    """Une requête par appel, réparties en tourniquet sur les sessions amorcées"""
+
+    def __init__(self, http: httpx.AsyncClient, fixtures: dict, args):
+        self.http = http
+        self.fixtures = fixtures
+        self.args = args
+        self._turn = itertools.count()
+        # Timestamps d'écriture uniques par session, après les points déjà amorcés
+        self._next_ts = {session_id: itertools.count(0, 1) for session_id in fixtures['write']}
+
+    def _pick(self, kind: str) -> str:
+        ids = self.fixtures[kind]
+        return ids[next(self._turn) % len(ids)]
+
+    def _params(self, **params) -> dict:
+        if not self.args.warm:
+            # Paramètre inconnu de l'API mais présent dans la clé du cache : chaque requête le manque
+            params['_'] = next(self._turn)
+        return params
+
+    async def list(self):
+        return await self.http.get("/sessions/")
+
+    async def ingest_single(self):
+        session_id = self._pick('write')
+        row = synthetic_rows(session_id, next(self._next_ts[session_id]), 1, 0)[0]
+        return await self.http.post(f"/sessions/{session_id}/sensor-data", json=row)
+
+    async def ingest_batch(self):
+        session_id = self._pick('write')
+        start = next(self._next_ts[session_id])
+        # Réserver la plage de timestamps du lot
+        for _ in range(self.args.batch_size - 1):
+            next(self._next_ts[session_id])
+        rows = synthetic_rows(session_id, start, self.args.batch_size, start)
+        return await self.http.post(f"/sessions/{session_id}/sensor-data/batch", json=rows)
+
+    async def stats(self):
+        return await self.http.get(f"/sessions/{self._pick('read')}/stats", params=self._params())
+
+    async def trajectory(self):
+        return await self.http.get(f"/sessions/{self._pick('read')}/trajectory",
+                                   params=self._params(max_points=self.args.max_points))
+
+    async def login(self):
+        email = self.fixtures['emails'][next(self._turn) % len(self.fixtures['emails'])]
+        return await self.http.post("/auth/login", json={"email": email, "password": PASSWORD})
+
+
+def percentile(ordered: list[float], q: float) -> float:
+    """Centile par interpolation linéaire sur des valeurs triées"""
+    if not ordered:
+        return float('nan')
+    position = (len(ordered) - 1) * q / 100
+    lo = int(position)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (position - lo)
+
+
+async def run_scenario(call, n_requests: int, concurrency: int) -> dict:
+    latencies, statuses = [], {}
+    remaining = itertools.count()
+
+    async def worker():
+        for _ in range(WARMUP):
+            await call()
+        while next(remaining) < n_requests:
+            start = time.perf_counter()
+            try:
+                status = (await call()).status_code
+            except Exception as e:
+                status = type(e).__name__
+            latencies.append((time.perf_counter() - start) * 1000)
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    errors = sum(count for status, count in statuses.items() if not status.startswith('2'))
+    return {
+        "requests": len(latencies),
+        "concurrency": concurrency,
+        "errors": errors,
+        "statuses": statuses,
+        "duration_s": round(elapsed, 4),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50), 3),
+            "p95": round(percentile(latencies, 95), 3),
+            "p99": round(percentile(latencies, 99), 3),
+            "mean": round(sum(latencies) / len(latencies), 3) if latencies else None,
+            "max": round(latencies[-1], 3) if latencies else None,
+        },
+    }
+
+
+async def run(args) -> dict:
+    random.seed(args.seed)
+    client = FakeClient(latency=args.latency_ms / 1000)
+    fixtures = seed(client, args.sessions, args.points, args.users)
+    supabase_config.client = client
+    supabase_config._auth_client = client
+    supabase_config._connected = True
+    # Les sessions amorcées appartiennent au compte démo : toutes les requêtes portent son jeton
+    token_verifier.demo_mode = True
+
+    # Import après l'installation du faux client : l'application ne se connecte jamais
+    from app import app
+
+    report = {
+        "config": {key: value for key, value in vars(args).items() if key not in ('output', 'baseline')},
+        "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                        "cpus": os.cpu_count(), "max_workers": supabase_config.max_workers},
+        "scenarios": {},
+    }
+    transport = httpx.ASGITransport(app=app)
+    headers = {"Authorization": f"Bearer {DEMO_TOKEN}"}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", headers=headers, timeout=None) as http:
+        scenarios = Scenarios(http, fixtures, args)
+        for name in args.scenarios:
+            # Les handlers journalisent à chaque requête : coût conservé, sortie masquée
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                result = await run_scenario(getattr(scenarios, name), args.requests, args.concurrency)
+            report["scenarios"][name] = result
+            latency = result["latency_ms"]
+            print(f"{name:<14} {result['throughput_rps']:>9.1f} req/s  p50={latency['p50']:8.2f} ms  "
+                  f"p95={latency['p95']:8.2f} ms  p99={latency['p99']:8.2f} ms  erreurs={result['errors']}",
+                  file=sys.stderr)
+    return report
+
+
+def regressions(report: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Scénarios dont le p95 dépasse celui du rapport de référence de plus de `tolerance`"""
+    found = []
+    for name, result in report["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if before is None:
+            continue
+        old, new = before["latency_ms"]["p95"], result["latency_ms"]["p95"]
+        if old and new > old * (1 + tolerance):
+            found.append(f"{name}: p95 {old:.2f} ms -> {new:.2f} ms (+{(new / old - 1) * 100:.0f}%)")
+        if result["errors"] > before["errors"]:
+            found.append(f"{name}: erreurs {before['errors']} -> {result['errors']}")
+    return found
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", default=','.join(SCENARIOS),
+                        type=lambda value: [name.strip() for name in value.split(',') if name.strip()])
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200, help="requêtes mesurées par scénario")
+    parser.add_argument("--sessions", type=int, default=8, help="sessions amorcées (lecture et écriture)")
+    parser.add_argument("--points", type=int, default=5000, help="points par session de lecture")
+    parser.add_argument("--users", type=int, default=16, help="comptes pour le scénario login")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--max-points", type=int, default=1000)
+    parser.add_argument("--latency-ms", type=float, default=2.0, help="latence simulée par appel Supabase")
+    parser.add_argument("--warm", action="store_true", help="laisser le cache de réponses servir les lectures")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="fichier du rapport JSON (sinon stdout)")
+    parser.add_argument("--baseline", help="rapport JSON de référence à comparer")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="hausse de p95 tolérée (0.2 = +20%%)")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"scénarios inconnus: {', '.join(unknown)} (disponibles: {', '.join(SCENARIOS)})")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = asyncio.run(run(args))
+    body = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(body + '\n')
+    else:
+        print(body)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(report, json.load(f), args.tolerance)
+        for line in found:
+            print(f"❌ Régression {line}", file=sys.stderr)
+        if found:
+            sys.exit(1)
+        print("✅ Aucune régression par rapport à la référence", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
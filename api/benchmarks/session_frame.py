@@ -0,0 +1,101 @@
+"""Mémoire et temps : session en dicts PostgREST vs SessionFrame colonnaire
+
+Les pages arrivent une à une (comme iter_pages). Chemin dicts : toutes les
+lignes sont gardées (response.data), puis stats et trajectoire en
+TrajectoryPoint pydantic. Chemin frame : chaque page est convertie puis
+libérée, stats et trajectoire sont calculées sur les colonnes.
+Temps mesuré sur des pages déjà générées ; pic mémoire mesuré à part avec
+tracemalloc (allocations Python et numpy), pages générées au fil de l'eau.
+
+Usage: python -m benchmarks.session_frame [nb_lignes] [taille_page]
+"""
+import json
+import math
+import random
+import sys
+import time
+import tracemalloc
+
+from models.session import TrajectoryPoint
+from sessions.cache import encode_json
+from sessions.frame import SessionFrame
+from sessions.paging import SENSOR_COLUMNS
+from sessions.stats import STATS_COLUMNS, compute_stats, to_arrays
+from sessions.trajectory import Trajectory
+
+SESSION_ID = "bench-session"
+
+
+def pages(n_rows: int, page_size: int):
+    """Pages de lignes telles que PostgREST les renvoie (14 clés, quelques nulls)"""
+    rng = random.Random(0)
+    for start in range(0, n_rows, page_size):
+        page = []
+        for i in range(start, min(start + page_size, n_rows)):
+            angle = i / 400 * 2 * math.pi
+            fix = i % 50 != 0
+            page.append({
+                "id": i, "session_id": SESSION_ID, "created_at": "2026-01-01T00:00:00+00:00",
+                "timestamp": i * 10,
+                "uwb_x": 40 * math.cos(angle) + rng.gauss(0, 0.05) if fix else None,
+                "uwb_y": 20 * math.sin(angle) + rng.gauss(0, 0.05) if fix else None, "uwb_z": 0.0,
+                "imu_ax": rng.gauss(0, 0.3), "imu_ay": rng.gauss(3, 0.3), "imu_az": 9.81,
+                "imu_gx": 0.0, "imu_gy": 0.0, "imu_gz": rng.gauss(0.4, 0.02),
+                "steering_angle": rng.gauss(12, 1.0),
+            })
+        yield page
+
+
+def dict_path(source):
+    rows = []
+    for page in source:
+        rows.extend(page)
+    stats = compute_stats(SESSION_ID, to_arrays(rows, STATS_COLUMNS))
+    points = [
+        TrajectoryPoint(x=row['uwb_x'], y=row['uwb_y'], timestamp=row['timestamp'], steering_angle=row['steering_angle'])
+        for row in rows if row['uwb_x'] is not None and row['uwb_y'] is not None
+    ]
+    body = json.dumps([point.model_dump() for point in points]).encode()
+    return stats, body
+
+
+def frame_path(source):
+    frame = SessionFrame.concat([SessionFrame.from_rows(page, SENSOR_COLUMNS, SESSION_ID) for page in source])
+    stats = compute_stats(SESSION_ID, frame)
+    body = encode_json(Trajectory.from_arrays(frame).to_points())
+    return stats, body, frame
+
+
+def measure(fn, n_rows: int, page_size: int):
+    generated = list(pages(n_rows, page_size))
+    start = time.perf_counter()
+    result = fn(generated)
+    elapsed = time.perf_counter() - start
+    del generated
+
+    tracemalloc.start()
+    fn(pages(n_rows, page_size))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main():
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    page_size = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+
+    (dict_stats, dict_body), dict_s, dict_peak = measure(dict_path, n_rows, page_size)
+    (frame_stats, frame_body, frame), frame_s, frame_peak = measure(frame_path, n_rows, page_size)
+
+    assert dict_stats == frame_stats, "statistiques différentes entre les deux chemins"
+    assert len(json.loads(dict_body)) == len(json.loads(frame_body))
+    mb = 1024 * 1024
+    print(f"{n_rows} lignes, pages de {page_size}")
+    print(f"dicts + pydantic : {dict_s * 1000:8.1f} ms  pic {dict_peak / mb:7.1f} Mo")
+    print(f"SessionFrame     : {frame_s * 1000:8.1f} ms  pic {frame_peak / mb:7.1f} Mo  "
+          f"(colonnes {frame.nbytes / mb:.1f} Mo)")
+    print(f"gain : x{dict_s / frame_s:.1f} en temps, x{dict_peak / frame_peak:.1f} en mémoire")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Taille et temps d'encodage/décodage : JSON vs colonnaire binaire vs MessagePack
+
+Usage: python -m benchmarks.wire_format [nb_lignes]
+"""
+import json
+import sys
+import time
+
+import numpy as np
+
+from models.session import SensorData
+from sessions.codec import encode_columns, decode_columns, encode_msgpack, decode_msgpack
+from sessions.ingest import BINARY_COLUMNS
+
+
+def make_columns(n: int) -> dict:
+    rng = np.random.default_rng(0)
+    t = np.arange(n)
+    columns = {"timestamp": (t * 10).astype(np.int64)}
+    for name in BINARY_COLUMNS[1:]:
+        columns[name] = rng.normal(size=n)
+    # UWB absent un échantillon sur cinq, comme en piste
+    for name in ("uwb_x", "uwb_y", "uwb_z"):
+        columns[name][t % 5 == 0] = np.nan
+    return columns
+
+
+def make_rows(columns: dict) -> list:
+    names = list(columns)
+    rows = []
+    for values in zip(*(columns[name].tolist() for name in names)):
+        row = {"session_id": "d2040cf2-a982-4b6c-a1b9-290a968d552b"}
+        row.update((name, value) for name, value in zip(names, values) if value == value)
+        rows.append(row)
+    return rows
+
+
+def timed(fn, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return result, best * 1000
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    columns = make_columns(n)
+    rows = make_rows(columns)
+
+    results = []
+    payload, encode_ms = timed(lambda: json.dumps(rows).encode())
+    _, decode_ms = timed(lambda: [SensorData(**row) for row in json.loads(payload)])
+    results.append(("json", len(payload), encode_ms, decode_ms))
+
+    payload, encode_ms = timed(lambda: encode_columns(columns))
+    _, decode_ms = timed(lambda: decode_columns(payload))
+    results.append(("columnar", len(payload), encode_ms, decode_ms))
+
+    payload, encode_ms = timed(lambda: encode_msgpack(columns))
+    _, decode_ms = timed(lambda: decode_msgpack(payload))
+    results.append(("msgpack", len(payload), encode_ms, decode_ms))
+
+    print(f"{n} lignes, {len(columns)} colonnes")
+    for label, size, encode_ms, decode_ms in results:
+        print(f"{label:<9} {size:>10} o  {size / n:7.1f} o/ligne  encode {encode_ms:8.2f} ms  decode {decode_ms:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,119 @@
-from supabase import create_client, Client
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+import asyncio
+import functools
 import os
+import threading
+import time
 from dotenv import load_dotenv
+from config.metrics import instrument_http, span, upstream_duration, upstream_errors, upstream_rows
+
+if TYPE_CHECKING:
+    from supabase import Client
 
 load_dotenv()
 
+class UpstreamTimeout(Exception):
+    """L'appel Supabase a dépassé le délai imparti"""
+
+class SingleFlight:
+    """Regroupe les appels identiques simultanés en un seul appel amont
+
+    Le premier appelant lance l'appel ; les suivants attendent le même résultat
+    (ou la même exception) au lieu de refaire la requête. Rien n'est gardé une
+    fois l'appel terminé : ce n'est pas un cache.
+    """
+
+    def __init__(self):
+        self._inflight: dict = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key, fn, timeout: float):
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(fn())
+            self._inflight[key] = future
+            future.add_done_callback(functools.partial(self._done, key))
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+        # shield : un appelant qui abandonne n'annule pas l'appel des autres
+        return await asyncio.wait_for(asyncio.shield(future), timeout)
+
+    def _done(self, key, future):
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        if not future.cancelled():
+            future.exception()
+
+    def stats(self) -> dict:
+        return {"leaders": self.leaders, "coalesced": self.coalesced, "in_flight": len(self._inflight)}
+
+def query_key(query):
+    """Identité d'une requête PostgREST de lecture, None si elle ne doit pas être partagée"""
+    request = getattr(query, 'request', None)
+    if request is None or request.http_method not in ('GET', 'HEAD'):
+        return None
+    return (request.http_method, str(request.path), str(request.params), request.headers.get('prefer'))
+
+def query_operation(query) -> str:
+    """Libellé de métrique d'une requête PostgREST : "GET sensor_data", "POST sessions"..."""
+    request = getattr(query, 'request', None)
+    if request is None:
+        return 'query'
+    return f"{request.http_method} {str(request.path).rstrip('/').rsplit('/', 1)[-1]}"
+
+def call_operation(fn) -> str:
+    """Libellé de métrique d'un appel bloquant : nom de la fonction (partial déroulé)"""
+    while isinstance(fn, functools.partial):
+        fn = fn.func
+    return getattr(fn, '__name__', type(fn).__name__)
+
+def instrument_client(client):
+    """Compter les octets reçus par les clients HTTP de données et d'auth d'un client Supabase"""
+    instrument_http(client.postgrest.session)
+    instrument_http(getattr(client.auth, '_http_client', None))
+
 class SupabaseConfig:
     def __init__(self):
         self.supabase_url = os.getenv("SUPABASE_URL", "https://qqjzcohrjhcambgulhae.supabase.co")
         self.supabase_key = os.getenv("SUPABASE_KEY_SECRET")
-        self.client: Client = None
-        self._connect()
+        self.query_timeout = float(os.getenv("SUPABASE_QUERY_TIMEOUT", "10"))
+        self.max_workers = int(os.getenv("SUPABASE_MAX_WORKERS", "16"))
+        # Lectures sensor_data : "supabase", "archive" (sessions terminées copiées en local)
+        # ou "offline" (archive locale seule, aucun appel réseau) ; voir sessions/archive.py
+        self.storage = os.getenv("SENSOR_STORAGE", "supabase")
+        self.client: "Client" = None
+        self._auth_client: "Client" = None
+        self._executor: ThreadPoolExecutor = None
+        self.singleflight = SingleFlight()
+        # Connexion au premier usage : importer ce module ne touche pas au réseau
+        self._connected = False
+        self._connect_lock = threading.Lock()
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.supabase_key and self.supabase_url)
+
+    @property
+    def offline(self) -> bool:
+        return self.storage == "offline"
 
     def _connect(self):
         """Initialiser la connexion Supabase"""
-        if self.supabase_key and self.supabase_url:
+        if self.offline:
+            print("📴 Mode hors ligne : lectures servies par l'archive locale, aucun client Supabase")
+            self.client = None
+        elif self.supabase_key and self.supabase_url:
             try:
-                self.client = create_client(self.supabase_url, self.supabase_key)
+                # Import différé : le SDK Supabase pèse l'essentiel du temps d'import de l'API
+                from supabase import create_client
+                from supabase.lib.client_options import SyncClientOptions
+                # Le client HTTP/2 partagé multiplexe les requêtes sur une connexion réutilisée
+                options = SyncClientOptions(postgrest_client_timeout=self.query_timeout)
+                self.client = create_client(self.supabase_url, self.supabase_key, options=options)
+                instrument_client(self.client)
                 print("✅ Supabase connecté")
                 print(f"🔑 URL: {self.supabase_url}")
                 print(f"🔑 Key type: {type(self.supabase_key)}")
@@ -27,10 +125,79 @@ class SupabaseConfig:
             print("⚠️ SUPABASE_KEY_SECRET ou SUPABASE_URL non configuré")
             self.client = None
 
-    def get_client(self) -> Client:
-        """Retourner le client Supabase"""
+    def get_client(self) -> "Client":
+        """Retourner le client Supabase, créé au premier appel"""
+        if self.client is None and not self._connected:
+            with self._connect_lock:
+                if not self._connected:
+                    self._connect()
+                    self._connected = True
         return self.client
 
-# Instance globale
+    def get_auth_client(self) -> "Client":
+        """Client dédié aux appels d'authentification (login, inscription, refresh)
+
+        Créé une seule fois. Sans session persistée ni rafraîchissement
+        automatique : un login ne change jamais l'identité sous laquelle le
+        client de données interroge la base.
+        """
+        if self._auth_client is None and self.configured and not self.offline:
+            with self._connect_lock:
+                if self._auth_client is None:
+                    from supabase import create_client
+                    from supabase.lib.client_options import SyncClientOptions
+                    options = SyncClientOptions(persist_session=False, auto_refresh_token=False,
+                                                postgrest_client_timeout=self.query_timeout)
+                    self._auth_client = create_client(self.supabase_url, self.supabase_key, options=options)
+                    instrument_client(self._auth_client)
+        return self._auth_client
+
+    def get_executor(self) -> ThreadPoolExecutor:
+        """Pool de threads borné dédié aux appels Supabase bloquants"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="supabase")
+        return self._executor
+
+    async def _timed(self, operation: str, call, timeout: float):
+        """Appel dans le pool, mesuré : durée, lignes renvoyées, erreurs par opération"""
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(loop.run_in_executor(self.get_executor(), call), timeout)
+        except asyncio.TimeoutError:
+            upstream_errors.inc(operation=operation, error='timeout')
+            raise UpstreamTimeout(f"Supabase n'a pas répondu en {timeout}s")
+        except Exception as e:
+            upstream_errors.inc(operation=operation, error=type(e).__name__)
+            raise
+        finally:
+            upstream_duration.observe(time.perf_counter() - start, operation=operation)
+        data = getattr(result, 'data', None)
+        if isinstance(data, list):
+            upstream_rows.inc(len(data), operation=operation)
+        return result
+
+    async def run(self, fn, *args, timeout: float = None, operation: str = None, **kwargs):
+        """Exécuter un appel bloquant hors de la boucle d'événements, avec timeout"""
+        operation = operation or call_operation(fn)
+        with span(f"supabase {operation}"):
+            return await self._timed(operation, functools.partial(fn, *args, **kwargs), timeout or self.query_timeout)
+
+    async def execute(self, query, timeout: float = None, coalesce: bool = True):
+        """Exécuter une requête PostgREST construite (`client.table(...)...`) sans bloquer
+
+        Les lectures identiques simultanées partagent un seul appel amont.
+        """
+        operation = query_operation(query)
+        timeout = timeout or self.query_timeout
+        key = query_key(query) if coalesce else None
+        with span(f"supabase {operation}"):
+            if key is None:
+                return await self._timed(operation, query.execute, timeout)
+            try:
+                return await self.singleflight.do(key, lambda: self._timed(operation, query.execute, timeout), timeout)
+            except asyncio.TimeoutError:
+                raise UpstreamTimeout(f"Supabase n'a pas répondu en {timeout}s")
+
+# Instance globale (le client est créé au premier get_client())
 supabase_config = SupabaseConfig()
-supabase = supabase_config.get_client()
@@ -0,0 +1,96 @@
+"""Sonde de santé en tâche de fond
+
+Une tâche interroge Supabase à intervalle régulier et garde le résultat :
+/health et /ready répondent depuis cet état, sans jamais toucher à la base,
+quelle que soit la fréquence des sondes de l'orchestrateur.
+"""
+import asyncio
+import os
+import time
+from typing import Optional
+
+from config.database import supabase_config
+
+HEALTH_INTERVAL = float(os.getenv("HEALTH_PROBE_INTERVAL", "10"))
+HEALTH_TIMEOUT = float(os.getenv("HEALTH_PROBE_TIMEOUT", "2"))
+# Au-delà de STALE_INTERVALS intervalles sans sonde réussie, l'état est périmé
+STALE_INTERVALS = 3
+
+
+class HealthMonitor:
+    def __init__(self, interval: float = HEALTH_INTERVAL, timeout: float = HEALTH_TIMEOUT):
+        self.interval = interval
+        self.timeout = timeout
+        self.supabase = "unknown"
+        self.checked_at: Optional[float] = None
+        self.latency_ms: Optional[float] = None
+        self.error: Optional[str] = None
+        self.consecutive_failures = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def probe(self):
+        """Une vérification amont : création du client au besoin, puis une lecture minimale"""
+        if supabase_config.offline:
+            self.supabase, self.error = "offline", None
+            self.checked_at = time.time()
+            return
+        if not supabase_config.configured:
+            self.supabase, self.error = "not_configured", None
+            self.checked_at = time.time()
+            return
+
+        start = time.perf_counter()
+        try:
+            # Première sonde : la création du client (import du SDK) se fait hors de la boucle
+            client = await supabase_config.run(supabase_config.get_client)
+            if client is None:
+                raise RuntimeError("Client Supabase non initialisé")
+            await supabase_config.execute(client.table('sessions').select('id').limit(1),
+                                          timeout=self.timeout, coalesce=False)
+            self.supabase, self.error = "connected", None
+            self.consecutive_failures = 0
+        except Exception as e:
+            self.supabase, self.error = "disconnected", str(e)
+            self.consecutive_failures += 1
+        self.latency_ms = (time.perf_counter() - start) * 1000
+        self.checked_at = time.time()
+
+    async def _run(self):
+        while True:
+            await self.probe()
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    @property
+    def stale(self) -> bool:
+        return self.checked_at is None or time.time() - self.checked_at > STALE_INTERVALS * self.interval
+
+    @property
+    def ready(self) -> bool:
+        """Prêt à servir : dernière sonde récente et réussie (toujours prêt hors ligne)"""
+        return self.supabase in ("connected", "offline") and not self.stale
+
+    def snapshot(self) -> dict:
+        return {
+            "supabase": self.supabase,
+            "checked_at": self.checked_at,
+            "latency_ms": self.latency_ms,
+            "error": self.error,
+            "consecutive_failures": self.consecutive_failures,
+            "stale": self.stale,
+        }
+
+
+health_monitor = HealthMonitor()
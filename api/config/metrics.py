@@ -0,0 +1,309 @@
+"""Métriques de latence et de débit, exposées au format texte Prometheus
+
+Compteurs, jauges et histogrammes en mémoire du processus, sans dépendance :
+durée, statut et taille des corps de requête par route (middleware ASGI), durée, lignes, erreurs et
+octets par appel Supabase. Le profilage par requête est optionnel
+(PROFILE_SLOW_MS) : chaque requête accumule la durée de ses étapes (appels
+amont, validation, sérialisation) et celles qui dépassent le seuil sont
+journalisées avec leur décomposition.
+"""
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Bornes (s) par défaut des histogrammes de durée
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Bornes (octets) des histogrammes de taille : de 256 o à 64 Mo
+SIZE_BUCKETS = tuple(256 * 4 ** i for i in range(10))
+# Seuil (ms) au-delà duquel une requête est profilée et journalisée ; désactivé si absent
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "0")) or None
+SLOW_REQUESTS_KEPT = int(os.getenv("PROFILE_SLOW_KEPT", "100"))
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names: Tuple[str, ...], values: tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value: float) -> str:
+    if isinstance(value, bool):
+        return str(int(value))
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values: dict = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, '') for name in self.label_names)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._samples(key, value))
+        return lines
+
+    def _samples(self, key: tuple, value) -> List[str]:
+        return [f"{self.name}{_labels(self.label_names, key)} {_number(value)}"]
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Effectifs par classe (non cumulés), somme, effectif total
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def _samples(self, key: tuple, state) -> List[str]:
+        counts, total, count = state
+        lines, cumulative = [], 0
+        for bound, n in zip(self.buckets, counts):
+            cumulative += n
+            le = f'le="{_number(bound)}"'
+            lines.append(f"{self.name}_bucket{_labels(self.label_names, key, le)} {cumulative}")
+        labels = _labels(self.label_names, key)
+        lines.append(f"{self.name}_sum{labels} {_number(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Tuple[str, ...] = ()) -> Gauge:
+        return self.register(Gauge(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Tuple[str, ...] = (),
+                  buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def collector(self, fn: Callable[[], None]) -> Callable[[], None]:
+        """Fonction appelée avant chaque export, pour recopier un état existant dans des jauges"""
+        self._collectors.append(fn)
+        return fn
+
+    def render(self) -> str:
+        for collect in self._collectors:
+            try:
+                collect()
+            except Exception as e:
+                print(f"⚠️ Collecte de métriques impossible: {e}")
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+http_requests = registry.counter(
+    "mokart_http_requests_total", "Requêtes HTTP traitées", ("method", "route", "status"))
+http_duration = registry.histogram(
+    "mokart_http_request_duration_seconds", "Durée des requêtes HTTP", ("method", "route"))
+http_request_bytes = registry.histogram(
+    "mokart_http_request_body_bytes", "Taille des corps de requête reçus (lots d'ingestion)", ("method", "route"),
+    buckets=SIZE_BUCKETS)
+http_in_flight = registry.gauge(
+    "mokart_http_requests_in_flight", "Requêtes HTTP en cours")
+upstream_duration = registry.histogram(
+    "mokart_upstream_duration_seconds", "Durée des appels Supabase", ("operation",))
+upstream_errors = registry.counter(
+    "mokart_upstream_errors_total", "Appels Supabase en échec", ("operation", "error"))
+upstream_rows = registry.counter(
+    "mokart_upstream_rows_total", "Lignes renvoyées par les appels Supabase", ("operation",))
+upstream_bytes = registry.counter(
+    "mokart_upstream_response_bytes_total", "Octets reçus de Supabase", ("method", "resource"))
+
+
+def upstream_resource(path: str) -> str:
+    """"/rest/v1/sensor_data" -> "sensor_data", "/auth/v1/token" -> "auth/token\""""
+    parts = [part for part in str(path).split('/') if part]
+    if len(parts) >= 3 and parts[-3] == 'rest':
+        return parts[-1]
+    if 'auth' in parts:
+        return 'auth/' + '/'.join(parts[parts.index('auth') + 2:])
+    return parts[-1] if parts else ''
+
+
+def record_response(response):
+    """Hook httpx : octets reçus par méthode et ressource (table ou endpoint d'auth)"""
+    # Les clients Supabase ne lisent pas en flux : le corps est de toute façon chargé
+    response.read()
+    upstream_bytes.inc(len(response.content), method=response.request.method,
+                       resource=upstream_resource(response.request.url.path))
+
+
+def instrument_http(http_client):
+    """Attacher le hook de comptage d'octets à un httpx.Client (une seule fois)"""
+    hooks = getattr(http_client, 'event_hooks', None)
+    if hooks is not None and record_response not in hooks['response']:
+        hooks['response'] = [*hooks['response'], record_response]
+
+
+class RequestProfile:
+    """Durées cumulées par étape d'une requête"""
+
+    __slots__ = ('method', 'path', 'started', 'spans')
+
+    def __init__(self, method: str, path: str):
+        self.method = method
+        self.path = path
+        self.started = time.perf_counter()
+        self.spans: Dict[str, List[float]] = {}
+
+    def add(self, name: str, seconds: float):
+        span = self.spans.setdefault(name, [0, 0.0])
+        span[0] += 1
+        span[1] += seconds
+
+    def report(self, route: str, status: int, seconds: float) -> dict:
+        return {
+            "method": self.method, "path": self.path, "route": route, "status": status,
+            "duration_ms": round(seconds * 1000, 3),
+            "spans": {name: {"calls": calls, "ms": round(total * 1000, 3)}
+                      for name, (calls, total) in sorted(self.spans.items(), key=lambda item: -item[1][1])},
+        }
+
+
+_profile: contextvars.ContextVar[Optional[RequestProfile]] = contextvars.ContextVar('request_profile', default=None)
+slow_requests: deque = deque(maxlen=SLOW_REQUESTS_KEPT)
+
+
+@contextmanager
+def span(name: str):
+    """Mesurer une étape de la requête en cours ; sans effet hors profilage"""
+    profile = _profile.get()
+    if profile is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add(name, time.perf_counter() - start)
+
+
+class MetricsMiddleware:
+    """Middleware ASGI : durée, statut, taille du corps reçu et requêtes en cours par route
+
+    La route est le gabarit (/sessions/{session_id}/trajectory), pas le chemin
+    demandé : une série par endpoint, quel que soit le nombre de sessions.
+    Les réponses en flux sont mesurées jusqu'au dernier octet envoyé. La
+    taille du corps est celle des octets effectivement lus (envoi chunked
+    compris), pas l'en-tête Content-Length.
+    """
+
+    def __init__(self, app, slow_ms: Optional[float] = PROFILE_SLOW_MS):
+        self.app = app
+        self.slow_ms = slow_ms
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        profile = RequestProfile(scope['method'], scope['path']) if self.slow_ms else None
+        token = _profile.set(profile)
+
+        received = 0
+
+        async def receive_counted():
+            nonlocal received
+            message = await receive()
+            if message['type'] == 'http.request':
+                received += len(message.get('body', b''))
+            return message
+
+        async def send_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        http_in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive_counted, send_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            http_in_flight.dec()
+            _profile.reset(token)
+            route = getattr(scope.get('route'), 'path', '<unmatched>')
+            http_requests.inc(method=scope['method'], route=route, status=status)
+            http_duration.observe(elapsed, method=scope['method'], route=route)
+            if received:
+                http_request_bytes.observe(received, method=scope['method'], route=route)
+            if profile is not None and elapsed * 1000 >= self.slow_ms:
+                report = profile.report(route, status, elapsed)
+                slow_requests.append(report)
+                breakdown = ', '.join(f"{name} {span['ms']:.1f}ms×{span['calls']}"
+                                      for name, span in report['spans'].items())
+                print(f"🐢 {scope['method']} {scope['path']} {report['duration_ms']:.1f}ms ({status}) : {breakdown or 'aucune étape mesurée'}")
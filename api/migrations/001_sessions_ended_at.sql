@@ -0,0 +1,3 @@
+-- Fin de session : renseignée par POST /sessions/{id}/finish
+-- Tant que la colonne est absente, aucune session n'est considérée terminée
+alter table sessions add column if not exists ended_at timestamptz;
@@ -1,11 +1,30 @@
-from .session import Session, SensorData, TrajectoryPoint
-from .auth import LoginRequest, RegisterRequest, AuthResponse
+from .session import Session, SensorData, SensorDataPage, TrajectoryPoint, ChunkResult, BatchIngestResult
+from .auth import LoginRequest, RegisterRequest, RefreshRequest, AuthResponse, AuthUser
+from .lap import Gate, TrackLayout, LapTime, LapSummary
+from .compare import TrajectorySelection, ComparisonRequest, ComparisonPoint, Comparison, ComparisonResult
+from .heatmap import HeatmapCell, Heatmap
 
 __all__ = [
     "Session",
     "SensorData", 
+    "SensorDataPage",
     "TrajectoryPoint",
+    "ChunkResult",
+    "BatchIngestResult",
     "LoginRequest",
     "RegisterRequest",
-    "AuthResponse"
+    "RefreshRequest",
+    "AuthResponse",
+    "AuthUser",
+    "Gate",
+    "TrackLayout",
+    "LapTime",
+    "LapSummary",
+    "TrajectorySelection",
+    "ComparisonRequest",
+    "ComparisonPoint",
+    "Comparison",
+    "ComparisonResult",
+    "HeatmapCell",
+    "Heatmap"
 ]
@@ -14,3 +14,14 @@ class AuthResponse(BaseModel):
     user: dict
     session: Optional[dict] = None
     message: str
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+class AuthUser(BaseModel):
+    id: str
+    email: Optional[str] = None
+    role: Optional[str] = None
+    user_metadata: dict = {}
+    app_metadata: dict = {}
+    expires_at: Optional[int] = None
@@ -0,0 +1,33 @@
+from typing import List, Literal, Optional, Union
+from pydantic import BaseModel, Field
+
+class TrajectorySelection(BaseModel):
+    session_id: str
+    lap: Optional[Union[int, Literal['best']]] = None
+    from_ts: Optional[int] = None
+    to_ts: Optional[int] = None
+
+class ComparisonRequest(BaseModel):
+    reference: TrajectorySelection
+    sessions: List[TrajectorySelection]
+    # Points par trajectoire comparée (au moins les deux extrémités)
+    max_points: Optional[int] = Field(None, ge=2, le=10000)
+
+class ComparisonPoint(BaseModel):
+    timestamp: int
+    distance: float
+    lateral_offset: float
+    time_delta: float
+
+class Comparison(BaseModel):
+    session_id: str
+    lap: Optional[int] = None
+    points: List[ComparisonPoint]
+    final_delta: Optional[float] = None
+    mean_abs_offset: Optional[float] = None
+    max_abs_offset: Optional[float] = None
+
+class ComparisonResult(BaseModel):
+    reference: TrajectorySelection
+    reference_length: float
+    comparisons: List[Comparison]
@@ -0,0 +1,16 @@
+from typing import Dict, List, Optional
+from pydantic import BaseModel
+
+class HeatmapCell(BaseModel):
+    x: float
+    y: float
+    count: int
+    mean: Optional[float] = None
+    max: Optional[float] = None
+    percentiles: Dict[str, Optional[float]] = {}
+
+class Heatmap(BaseModel):
+    metric: str
+    cell_size: float
+    sessions: List[str]
+    cells: List[HeatmapCell]
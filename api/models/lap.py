@@ -0,0 +1,25 @@
+from typing import List, Optional
+from pydantic import BaseModel
+
+class Gate(BaseModel):
+    x1: float
+    y1: float
+    x2: float
+    y2: float
+
+class TrackLayout(BaseModel):
+    start_line: Gate
+    sectors: List[Gate] = []
+
+class LapTime(BaseModel):
+    lap: int
+    start: float
+    end: float
+    duration_ms: float
+    sectors: Optional[List[float]] = None
+
+class LapSummary(BaseModel):
+    session_id: str
+    laps: List[LapTime]
+    best_lap: Optional[LapTime] = None
+    current_lap_start: Optional[float] = None
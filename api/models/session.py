@@ -7,6 +7,7 @@ class Session(BaseModel):
     user_id: Optional[str] = None
     vehicle_model: Optional[str] = None
     created_at: Optional[datetime] = None
+    ended_at: Optional[datetime] = None
 
 class SensorData(BaseModel):
     session_id: str
@@ -22,8 +23,34 @@ class SensorData(BaseModel):
     imu_gz: Optional[float] = None
     steering_angle: Optional[float] = None
 
+class SensorDataPage(BaseModel):
+    data: List[SensorData]
+    next_cursor: Optional[int] = None
+
+class ChunkResult(BaseModel):
+    index: int
+    start: int
+    size: int
+    inserted: int
+    error: Optional[str] = None
+
+class BatchIngestResult(BaseModel):
+    session_id: str
+    received: int
+    inserted: int
+    failed: int
+    # Lignes acquittées par le spool durable, insérées en fond
+    spooled: int = 0
+    chunks: List[ChunkResult]
+
 class TrajectoryPoint(BaseModel):
     x: float
     y: float
     timestamp: int
     steering_angle: Optional[float] = None
+    # Canaux dérivés, présents seulement si demandés (?channels=)
+    speed: Optional[float] = None
+    long_accel: Optional[float] = None
+    lat_accel: Optional[float] = None
+    combined_g: Optional[float] = None
+    yaw_rate: Optional[float] = None
@@ -0,0 +1,14 @@
+"""Commandes hors serveur : python -m sessions <commande> [arguments]
+
+archive <session_id>...  copier des sessions dans l'archive locale (SENSOR_STORAGE=archive)
+export [options] <session_id>...  exporter sensor_data en CSV, Parquet ou Arrow
+"""
+import sys
+
+from sessions import archive, export
+
+COMMANDS = {"archive": archive.main, "export": export.main}
+
+if len(sys.argv) < 2 or sys.argv[1] not in COMMANDS:
+    raise SystemExit(__doc__)
+COMMANDS[sys.argv[1]](sys.argv[2:])
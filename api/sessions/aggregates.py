@@ -0,0 +1,172 @@
+import os
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from sessions.stats import to_arrays
+
+# Tous les canaux de SensorData suivis en continu
+CHANNELS = [
+    'uwb_x', 'uwb_y', 'uwb_z',
+    'imu_ax', 'imu_ay', 'imu_az',
+    'imu_gx', 'imu_gy', 'imu_gz',
+    'steering_angle'
+]
+AGGREGATE_COLUMNS = ['timestamp'] + CHANNELS
+
+# Nombre de sessions gardées en mémoire, les plus anciennes sont reconstruites à la demande
+MAX_SESSIONS = int(os.getenv("AGGREGATES_MAX_SESSIONS", "1024"))
+
+
+class ChannelAggregate:
+    """Compteur, bornes, moyenne et variance (Welford / Chan) d'un canal"""
+
+    __slots__ = ('count', 'mean', 'm2', 'min', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def update(self, values: np.ndarray):
+        values = values[~np.isnan(values)]
+        n_b = len(values)
+        if n_b == 0:
+            return
+        mean_b = float(values.mean())
+        m2_b = float(((values - mean_b) ** 2).sum())
+
+        # Fusion de deux moments (Chan et al.), exacte quel que soit l'ordre des lots
+        n = self.count + n_b
+        delta = mean_b - self.mean
+        self.mean += delta * n_b / n
+        self.m2 += m2_b + delta * delta * self.count * n_b / n
+        self.count = n
+
+        low, high = float(values.min()), float(values.max())
+        self.min = low if self.min is None else min(self.min, low)
+        self.max = high if self.max is None else max(self.max, high)
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "mean": self.mean if self.count else None,
+            "variance": self.m2 / self.count if self.count else None,
+            "min": self.min,
+            "max": self.max,
+        }
+
+
+class SessionAggregate:
+    """Agrégats courants d'une session, mis à jour à chaque ingestion"""
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.total_points = 0
+        self.first_timestamp: Optional[int] = None
+        self.last_timestamp: Optional[int] = None
+        self.channels = {channel: ChannelAggregate() for channel in CHANNELS}
+
+    def update(self, rows: List[dict]):
+        if rows:
+            self.update_arrays(to_arrays(rows, AGGREGATE_COLUMNS))
+
+    def update_arrays(self, arrays: dict):
+        timestamps = arrays['timestamp']
+        self.total_points += len(timestamps)
+        first, last = int(timestamps[0]), int(timestamps[-1])
+        self.first_timestamp = first if self.first_timestamp is None else min(self.first_timestamp, first)
+        self.last_timestamp = last if self.last_timestamp is None else max(self.last_timestamp, last)
+        for channel, aggregate in self.channels.items():
+            aggregate.update(arrays[channel])
+
+    def _coverage(self, channel: str) -> float:
+        return self.channels[channel].count / self.total_points * 100 if self.total_points else 0.0
+
+    def to_stats(self) -> dict:
+        """Mêmes clés de base que /stats, plus le détail par canal"""
+        x, y = self.channels['uwb_x'], self.channels['uwb_y']
+        return {
+            "session_id": self.session_id,
+            "total_points": self.total_points,
+            "duration_ms": self.last_timestamp - self.first_timestamp if self.total_points > 1 else 0,
+            "uwb_coverage": self._coverage('uwb_x'),
+            "imu_coverage": self._coverage('imu_ax'),
+            "steering_coverage": self._coverage('steering_angle'),
+            "bounds": {
+                "min_x": x.min,
+                "max_x": x.max,
+                "min_y": y.min,
+                "max_y": y.max
+            },
+            "first_timestamp": self.first_timestamp,
+            "last_timestamp": self.last_timestamp,
+            "channels": {channel: aggregate.to_dict() for channel, aggregate in self.channels.items()},
+        }
+
+
+class AggregateStore:
+    """Agrégats par session en mémoire du worker (LRU borné)
+
+    Une session absente (worker redémarré, éviction, ingestion par un autre
+    worker) doit être reconstruite depuis sensor_data avant d'être servie.
+    Les lignes ingérées pendant la lecture d'une reconstruction sont gardées
+    de côté puis fusionnées, sauf celles que la lecture a déjà vues.
+    """
+
+    def __init__(self, max_sessions: int = MAX_SESSIONS):
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, SessionAggregate]" = OrderedDict()
+        self._rebuilding: Dict[str, List[List[dict]]] = {}
+
+    def get(self, session_id: str) -> Optional[SessionAggregate]:
+        aggregate = self._sessions.get(session_id)
+        if aggregate is not None:
+            self._sessions.move_to_end(session_id)
+        return aggregate
+
+    def put(self, aggregate: SessionAggregate):
+        self._sessions[aggregate.session_id] = aggregate
+        self._sessions.move_to_end(aggregate.session_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+    def record(self, session_id: str, rows: List[dict]):
+        """Appelé par l'ingestion ; ignoré tant que la session n'a pas été construite,
+        sinon les agrégats ne couvriraient que les lignes vues par ce worker"""
+        for buffer in self._rebuilding.get(session_id, ()):
+            buffer.extend(rows)
+        aggregate = self.get(session_id)
+        if aggregate is not None:
+            aggregate.update(rows)
+
+    def begin_rebuild(self, session_id: str) -> List[dict]:
+        """Tampon des lignes ingérées jusqu'à end_rebuild, à passer à rebuild"""
+        buffer: List[dict] = []
+        self._rebuilding.setdefault(session_id, []).append(buffer)
+        return buffer
+
+    def end_rebuild(self, session_id: str, buffer: List[dict]):
+        buffers = self._rebuilding.get(session_id)
+        if buffers is None:
+            return
+        buffers[:] = [pending for pending in buffers if pending is not buffer]
+        if not buffers:
+            del self._rebuilding[session_id]
+
+    def rebuild(self, session_id: str, arrays: dict, buffer: Optional[List[dict]] = None) -> SessionAggregate:
+        aggregate = SessionAggregate(session_id)
+        aggregate.update_arrays(arrays)
+        if buffer:
+            # Timestamps uniques par session (pagination par clé) : une ligne déjà lue n'est pas recomptée
+            seen = set(arrays['timestamp'].tolist())
+            aggregate.update(sorted((row for row in buffer if row.get('timestamp') not in seen),
+                                    key=lambda row: row['timestamp']))
+        self.put(aggregate)
+        return aggregate
+
+
+aggregate_store = AggregateStore()
@@ -0,0 +1,330 @@
+"""Archive locale des sessions terminées : sensor_data copié dans SQLite, lu en mmap
+
+Activée par SENSOR_STORAGE (voir SupabaseConfig) :
+- "supabase" (défaut) : pas d'archive, toutes les lectures vont à PostgREST ;
+- "archive" : à la fin d'une session, ses lignes sont copiées dans un
+  fichier SQLite local ; stats, trajectoire, cartes de chaleur... lisent
+  ensuite le disque local au lieu de la base hébergée ;
+- "offline" : l'archive seule, sans aucun appel réseau (développement,
+  tests). Une session absente de l'archive est une session vide.
+
+Une table sans rowid de clé (session_id, timestamp) : les lignes d'une
+session sont contiguës et triées sur disque, une fenêtre est un parcours
+d'intervalle de la clé. Les lectures passent par mmap (SENSOR_ARCHIVE_MMAP_MB),
+sans copie par read() dans le cache de pages de SQLite.
+
+La copie attend SENSOR_ARCHIVE_DELAY secondes après la fin (le spool
+d'ingestion peut encore insérer des lignes). Une session ne sert depuis
+l'archive qu'une fois copiée entièrement ; une écriture tardive la retire et
+relance la copie.
+
+Peupler une archive pour le mode hors ligne :
+    SENSOR_STORAGE=archive python -m sessions archive <session_id>...
+"""
+import asyncio
+import os
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Dict, List, Optional
+
+import numpy as np
+
+from config.database import supabase_config
+from config.metrics import registry
+from sessions.frame import FRAME_COLUMNS, SessionFrame, column_dtype
+
+ARCHIVE_PATH = os.getenv("SENSOR_ARCHIVE_PATH", "data/sensor_archive.sqlite3")
+ARCHIVE_MMAP_BYTES = int(os.getenv("SENSOR_ARCHIVE_MMAP_MB", "1024")) * 1024 * 1024
+ARCHIVE_DELAY = float(os.getenv("SENSOR_ARCHIVE_DELAY", "5"))
+ARCHIVE_READERS = int(os.getenv("SENSOR_ARCHIVE_READERS", "4"))
+
+# Colonnes de valeurs (timestamp et session_id forment la clé)
+VALUE_COLUMNS = [column for column in FRAME_COLUMNS if column != 'timestamp']
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS sensor_data (
+    session_id TEXT NOT NULL,
+    timestamp INTEGER NOT NULL,
+    {', '.join(f'{column} REAL' for column in VALUE_COLUMNS)},
+    PRIMARY KEY (session_id, timestamp)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS archived_sessions (
+    session_id TEXT PRIMARY KEY,
+    n_rows INTEGER NOT NULL,
+    archived_at REAL NOT NULL
+);
+"""
+
+archive_reads = registry.counter(
+    "mokart_archive_reads_total", "Lectures servies par l'archive locale", ("kind",))
+archive_read_duration = registry.histogram(
+    "mokart_archive_read_duration_seconds", "Durée des lectures de l'archive locale", ("kind",))
+archive_snapshots = registry.counter(
+    "mokart_archive_snapshots_total", "Copies de sessions vers l'archive locale", ("result",))
+
+
+def _window(session_id: str, from_ts: Optional[int], to_ts: Optional[int], after: Optional[int]) -> tuple[str, list]:
+    clauses, params = ["session_id = ?"], [session_id]
+    for clause, value in (("timestamp >= ?", from_ts), ("timestamp <= ?", to_ts), ("timestamp > ?", after)):
+        if value is not None:
+            clauses.append(clause)
+            params.append(value)
+    return ' AND '.join(clauses), params
+
+
+class SessionArchive:
+    def __init__(self, path: str = ARCHIVE_PATH, mode: str = None, mmap_bytes: int = ARCHIVE_MMAP_BYTES,
+                 delay: float = ARCHIVE_DELAY):
+        self.path = path
+        self.mode = mode
+        self.mmap_bytes = mmap_bytes
+        self.delay = delay
+        self.enabled = False
+        self._archived: Dict[str, int] = {}
+        # Incrémenté à chaque écriture tardive : une copie commencée avant est périmée
+        self._generation: Dict[str, int] = {}
+        self._scheduled: Dict[str, asyncio.Task] = {}
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.snapshots = 0
+        self.snapshot_errors = 0
+
+    @property
+    def offline(self) -> bool:
+        return self.enabled and self.mode == "offline"
+
+    # Ouverture, connexions
+
+    def open(self):
+        """Créer le schéma et charger la liste des sessions archivées (sans réseau)"""
+        mode = self.mode or supabase_config.storage
+        if self.enabled or mode not in ("archive", "offline"):
+            return
+        self.mode = mode
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = self._connection()
+        connection.executescript(SCHEMA)
+        self._archived = dict(connection.execute("SELECT session_id, n_rows FROM archived_sessions"))
+        self._executor = ThreadPoolExecutor(max_workers=ARCHIVE_READERS, thread_name_prefix="archive")
+        self.enabled = True
+        print(f"🗄️ Archive locale {self.path} ({self.mode}) : {len(self._archived)} sessions")
+
+    def _connection(self) -> sqlite3.Connection:
+        """Une connexion par thread (les connexions SQLite ne se partagent pas entre threads)"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, isolation_level=None)
+            # WAL : les lectures ne bloquent pas pendant une copie
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(f"PRAGMA mmap_size={self.mmap_bytes}")
+            self._local.connection = connection
+        return connection
+
+    async def _call(self, kind: str, fn, *args):
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            return await loop.run_in_executor(self._executor, fn, *args)
+        finally:
+            archive_reads.inc(kind=kind)
+            archive_read_duration.observe(time.perf_counter() - start, kind=kind)
+
+    async def stop(self):
+        for task in self._scheduled.values():
+            task.cancel()
+        await asyncio.gather(*self._scheduled.values(), return_exceptions=True)
+        self._scheduled.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self.enabled = False
+
+    # Lecture
+
+    def has(self, session_id: str) -> bool:
+        return self.enabled and session_id in self._archived
+
+    def serves(self, session_id: str) -> bool:
+        """Les lectures de cette session passent par l'archive (copiée, ou mode hors ligne)"""
+        return self.has(session_id) or self.offline
+
+    def _select(self, session_id: str, columns: List[str], from_ts: Optional[int], to_ts: Optional[int],
+                after: Optional[int] = None, limit: Optional[int] = None) -> tuple[List[str], list]:
+        # Dans l'ordre demandé, comme le select PostgREST (timestamp ajouté en tête s'il manque)
+        names = [column for column in columns if column == 'timestamp' or column in VALUE_COLUMNS]
+        if 'timestamp' not in names:
+            names.insert(0, 'timestamp')
+        where, params = _window(session_id, from_ts, to_ts, after)
+        sql = f"SELECT {', '.join(names)} FROM sensor_data WHERE {where} ORDER BY timestamp"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        return names, self._connection().execute(sql, params).fetchall()
+
+    def _page(self, session_id: str, columns: List[str], from_ts, to_ts, after, limit) -> List[dict]:
+        names, rows = self._select(session_id, columns, from_ts, to_ts, after, limit)
+        if 'session_id' in columns:
+            # session_id n'est pas relu : inséré à sa place dans chaque ligne
+            i = min(columns.index('session_id'), len(names))
+            names = names[:i] + ['session_id'] + names[i:]
+            rows = [row[:i] + (session_id,) + row[i:] for row in rows]
+        return [dict(zip(names, row)) for row in rows]
+
+    def _frame(self, session_id: str, columns: List[str], from_ts, to_ts) -> Optional[SessionFrame]:
+        names, rows = self._select(session_id, columns, from_ts, to_ts)
+        if not rows:
+            return None
+        # Lignes déjà triées par la clé : colonnes construites directement, sans dicts
+        arrays = {name: np.array(values, dtype=column_dtype(name)) for name, values in zip(names, zip(*rows))}
+        return SessionFrame(arrays, session_id)
+
+    async def page(self, session_id: str, columns: List[str], from_ts: Optional[int] = None,
+                   to_ts: Optional[int] = None, cursor: Optional[int] = None,
+                   limit: int = 1000) -> tuple[List[dict], Optional[int]]:
+        """Même contrat que paging.fetch_page : lignes et curseur suivant"""
+        rows = await self._call('page', self._page, session_id, columns, from_ts, to_ts, cursor, limit)
+        next_cursor = rows[-1]['timestamp'] if len(rows) == limit else None
+        return rows, next_cursor
+
+    async def frame(self, session_id: str, columns: List[str], from_ts: Optional[int] = None,
+                    to_ts: Optional[int] = None) -> Optional[SessionFrame]:
+        """Toute la fenêtre en une lecture, None si elle est vide"""
+        return await self._call('frame', self._frame, session_id, columns, from_ts, to_ts)
+
+    # Copie
+
+    def _write(self, session_id: str, rows: List[dict], first: bool):
+        columns = ['session_id', 'timestamp'] + VALUE_COLUMNS
+        sql = f"INSERT OR REPLACE INTO sensor_data ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+        values = [(session_id, row['timestamp'], *[row.get(column) for column in VALUE_COLUMNS]) for row in rows]
+        with self._write_lock:
+            connection = self._connection()
+            connection.execute("BEGIN")
+            if first:
+                connection.execute("DELETE FROM sensor_data WHERE session_id = ?", (session_id,))
+            connection.executemany(sql, values)
+            connection.execute("COMMIT")
+
+    def _commit(self, session_id: str, n_rows: int):
+        with self._write_lock:
+            connection = self._connection()
+            connection.execute("INSERT OR REPLACE INTO archived_sessions VALUES (?, ?, ?)",
+                               (session_id, n_rows, time.time()))
+            # Les pages copiées quittent le WAL pour le fichier principal, lu en mmap
+            connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def _drop(self, session_id: str):
+        with self._write_lock:
+            connection = self._connection()
+            connection.execute("BEGIN")
+            connection.execute("DELETE FROM archived_sessions WHERE session_id = ?", (session_id,))
+            connection.execute("DELETE FROM sensor_data WHERE session_id = ?", (session_id,))
+            connection.execute("COMMIT")
+
+    async def snapshot(self, session_id: str, pages: AsyncIterator[List[dict]]) -> bool:
+        """Copier une session page par page ; False si une écriture tardive l'a rendue périmée"""
+        generation = self._generation.get(session_id, 0)
+        loop = asyncio.get_running_loop()
+        n_rows, first = 0, True
+        async for rows in pages:
+            await loop.run_in_executor(self._executor, self._write, session_id, rows, first)
+            n_rows += len(rows)
+            first = False
+        if self._generation.get(session_id, 0) != generation:
+            return False
+        if first:
+            # Session vide : rien à servir localement
+            return False
+        await loop.run_in_executor(self._executor, self._commit, session_id, n_rows)
+        self._archived[session_id] = n_rows
+        return True
+
+    async def _snapshot_later(self, session_id: str):
+        # Import local : paging consulte l'archive pour chaque lecture
+        from sessions.paging import SENSOR_COLUMNS, upstream_pages
+        try:
+            await asyncio.sleep(self.delay)
+            client = supabase_config.get_client()
+            if client is None:
+                return
+            archived = await self.snapshot(session_id, upstream_pages(client, session_id, SENSOR_COLUMNS))
+            archive_snapshots.inc(result='ok' if archived else 'stale')
+            if archived:
+                self.snapshots += 1
+                print(f"🗄️ Session {session_id} archivée ({self._archived[session_id]} lignes)")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.snapshot_errors += 1
+            archive_snapshots.inc(result='error')
+            print(f"⚠️ Archivage de la session {session_id} impossible: {e}")
+        finally:
+            if self._scheduled.get(session_id) is asyncio.current_task():
+                del self._scheduled[session_id]
+
+    def schedule(self, session_id: str):
+        """Programmer la copie d'une session terminée (une seule en attente par session)"""
+        if not self.enabled or self.offline:
+            return
+        previous = self._scheduled.pop(session_id, None)
+        if previous is not None:
+            previous.cancel()
+        self._scheduled[session_id] = asyncio.get_running_loop().create_task(self._snapshot_later(session_id))
+
+    def invalidate(self, session_id: str):
+        """Écriture tardive : la copie est périmée, les lectures repassent par Supabase"""
+        if not self.enabled or self.offline:
+            return
+        if session_id not in self._archived and session_id not in self._scheduled:
+            return
+        self._generation[session_id] = self._generation.get(session_id, 0) + 1
+        if self._archived.pop(session_id, None) is not None:
+            self._executor.submit(self._drop, session_id)
+        self.schedule(session_id)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "offline": self.offline,
+            "sessions": len(self._archived),
+            "rows": sum(self._archived.values()),
+            "scheduled": len(self._scheduled),
+            "snapshots": self.snapshots,
+            "snapshot_errors": self.snapshot_errors,
+        }
+
+
+session_archive = SessionArchive()
+
+
+async def _archive_sessions(session_ids: List[str]):
+    from sessions.paging import SENSOR_COLUMNS, upstream_pages
+    session_archive.open()
+    if not session_archive.enabled or session_archive.offline:
+        print("⚠️ SENSOR_STORAGE=archive requis pour copier des sessions depuis Supabase")
+        return
+    client = await supabase_config.run(supabase_config.get_client)
+    if client is None:
+        return
+    try:
+        for session_id in session_ids:
+            if await session_archive.snapshot(session_id, upstream_pages(client, session_id, SENSOR_COLUMNS)):
+                print(f"🗄️ {session_id} : {session_archive._archived[session_id]} lignes")
+            else:
+                print(f"⚠️ {session_id} : aucune donnée")
+    finally:
+        await session_archive.stop()
+
+
+def main(argv: Optional[List[str]] = None):
+    session_ids = sys.argv[1:] if argv is None else argv
+    if not session_ids:
+        raise SystemExit("Usage: python -m sessions archive <session_id>...")
+    asyncio.run(_archive_sessions(session_ids))
@@ -0,0 +1,187 @@
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from fastapi import Request, Response
+
+# Budget mémoire des réponses en cache, et débordement disque optionnel
+CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CACHE_SPILL_DIR = os.getenv("RESULT_CACHE_SPILL_DIR")
+CACHE_SPILL_MAX_BYTES = int(os.getenv("RESULT_CACHE_SPILL_MAX_BYTES", str(512 * 1024 * 1024)))
+# Une session en cours peut être alimentée par un autre worker : entrées de courte durée
+LIVE_TTL = float(os.getenv("RESULT_CACHE_LIVE_TTL", "5"))
+FINISHED_MAX_AGE = int(os.getenv("RESULT_CACHE_FINISHED_MAX_AGE", "3600"))
+SPILL_PREFIX = "mokart-cache-"
+
+
+class CacheEntry:
+    __slots__ = ('session_id', 'body', 'media_type', 'etag', 'finished', 'headers', 'created_at')
+
+    def __init__(self, session_id: str, body: bytes, media_type: str, finished: bool,
+                 headers: Optional[dict] = None, etag: Optional[str] = None, created_at: Optional[float] = None):
+        self.session_id = session_id
+        self.body = body
+        self.media_type = media_type
+        self.finished = finished
+        self.headers = headers or {}
+        self.etag = etag or '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+        self.created_at = created_at or time.monotonic()
+
+    @property
+    def expired(self) -> bool:
+        return not self.finished and time.monotonic() - self.created_at > LIVE_TTL
+
+    def respond(self, request: Request) -> Response:
+        """200 avec le corps, ou 304 si le client a déjà cette version"""
+        cache_control = f"public, max-age={FINISHED_MAX_AGE}" if self.finished else "no-cache"
+        # Le format dépend de Accept : un cache partagé ne doit pas servir un format à la place d'un autre
+        headers = {**self.headers, "ETag": self.etag, "Cache-Control": cache_control, "Vary": "Accept"}
+        if_none_match = request.headers.get('if-none-match')
+        if if_none_match and (if_none_match.strip() == '*' or self.etag in [tag.strip() for tag in if_none_match.split(',')]):
+            return Response(status_code=304, headers=headers)
+        return Response(content=self.body, media_type=self.media_type, headers=headers)
+
+
+def cache_key(request: Request, session_id: str, variant: str = '') -> tuple:
+    """Clé : session, route, paramètres de requête triés, format négocié"""
+    return (session_id, request.url.path, tuple(sorted(request.query_params.multi_items())), variant)
+
+
+def encode_json(payload) -> bytes:
+    return json.dumps(payload, separators=(',', ':')).encode()
+
+
+class ResultCache:
+    """Cache LRU des réponses sérialisées, borné en octets
+
+    Les entrées évincées de la mémoire sont écrites sur disque si
+    RESULT_CACHE_SPILL_DIR est défini. Toute écriture sur une session invalide
+    ses entrées (mémoire et disque) sur ce worker.
+    """
+
+    def __init__(self, max_bytes: int = CACHE_MAX_BYTES, spill_dir: Optional[str] = CACHE_SPILL_DIR,
+                 spill_max_bytes: int = CACHE_SPILL_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.spill_max_bytes = spill_max_bytes
+        self._entries: "OrderedDict[tuple, CacheEntry]" = OrderedDict()
+        self._spilled: "OrderedDict[tuple, tuple[str, int]]" = OrderedDict()
+        self._bytes = 0
+        self._spilled_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.spills = 0
+        self.disk_hits = 0
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+            # L'index est en mémoire : les fichiers d'un processus précédent sont orphelins
+            for name in os.listdir(spill_dir):
+                if name.startswith(SPILL_PREFIX):
+                    os.remove(os.path.join(spill_dir, name))
+
+    def get(self, key: tuple) -> Optional[CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is None and key in self._spilled:
+            entry = self._load_spilled(key)
+            if entry is not None:
+                self.disk_hits += 1
+                self._store(key, entry)
+        if entry is None or entry.expired:
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key: tuple, entry: CacheEntry) -> CacheEntry:
+        self._remove(key)
+        if len(entry.body) <= self.max_bytes:
+            self._store(key, entry)
+        return entry
+
+    def invalidate(self, session_id: str):
+        for key in [key for key in self._entries if key[0] == session_id]:
+            self._remove(key)
+        for key in [key for key in self._spilled if key[0] == session_id]:
+            self._drop_spilled(key)
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "spills": self.spills,
+            "disk_hits": self.disk_hits,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "spilled_entries": len(self._spilled),
+            "spilled_bytes": self._spilled_bytes,
+        }
+
+    def _store(self, key: tuple, entry: CacheEntry):
+        self._entries[key] = entry
+        self._bytes += len(entry.body)
+        while self._bytes > self.max_bytes and self._entries:
+            old_key, old_entry = self._entries.popitem(last=False)
+            self._bytes -= len(old_entry.body)
+            self.evictions += 1
+            if self.spill_dir and old_entry.finished:
+                self._spill(old_key, old_entry)
+
+    def _remove(self, key: tuple):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry.body)
+
+    # Débordement disque : uniquement les sessions terminées, qui ne changent plus
+
+    def _spill_path(self, key: tuple) -> str:
+        return os.path.join(self.spill_dir, SPILL_PREFIX + hashlib.sha1(repr(key).encode()).hexdigest())
+
+    def _spill(self, key: tuple, entry: CacheEntry):
+        path = self._spill_path(key)
+        meta = json.dumps({"session_id": entry.session_id, "media_type": entry.media_type,
+                           "etag": entry.etag, "headers": entry.headers}).encode()
+        try:
+            with open(path, 'wb') as f:
+                f.write(len(meta).to_bytes(4, 'little') + meta + entry.body)
+        except OSError:
+            return
+        size = len(entry.body)
+        self._spilled[key] = (path, size)
+        self._spilled_bytes += size
+        self.spills += 1
+        while self._spilled_bytes > self.spill_max_bytes and self._spilled:
+            self._drop_spilled(next(iter(self._spilled)))
+
+    def _load_spilled(self, key: tuple) -> Optional[CacheEntry]:
+        path, _ = self._spilled[key]
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            self._drop_spilled(key)
+            return None
+        self._drop_spilled(key)
+        meta_size = int.from_bytes(data[:4], 'little')
+        meta = json.loads(data[4:4 + meta_size])
+        return CacheEntry(meta['session_id'], data[4 + meta_size:], meta['media_type'], True,
+                          headers=meta['headers'], etag=meta['etag'])
+
+    def _drop_spilled(self, key: tuple):
+        path, size = self._spilled.pop(key)
+        self._spilled_bytes -= size
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+result_cache = ResultCache()
@@ -0,0 +1,203 @@
+"""Format binaire colonnaire pour la télémétrie
+
+Disposition (little-endian) :
+
+    en-tête   : magic b"MKC1" | version u16 | nb colonnes u16 | nb lignes u32
+    colonnes  : pour chacune, longueur du nom u8 | nom ascii | type u8 | flags u8
+    données   : pour chaque colonne, dans l'ordre, bitmap des valeurs présentes
+                (si flag NULLS, 1 bit par ligne, bit à 1 = présent, ordre LSB)
+                puis les valeurs ; chaque bloc est aligné sur 8 octets.
+
+Types : 1 = float32, 2 = int64. Les valeurs absentes sont stockées à 0.
+"""
+import struct
+from typing import Dict, List, Optional, Tuple
+
+import msgpack
+import numpy as np
+
+COLUMNAR_MEDIA_TYPE = "application/vnd.mokart.columnar"
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+
+MAGIC = b"MKC1"
+VERSION = 1
+HEADER = struct.Struct("<4sHHI")
+
+FLOAT32, INT64 = 1, 2
+DTYPES = {FLOAT32: np.dtype("<f4"), INT64: np.dtype("<i8")}
+FLAG_NULLS = 1
+
+
+class CodecError(ValueError):
+    """Charge utile binaire invalide"""
+
+
+def _pad(size: int) -> int:
+    return -size % 8
+
+
+def parse_accept(accept: str) -> Dict[str, float]:
+    """En-tête Accept -> {plage de types: q} ; q mal formé = 1, hors [0, 1] borné"""
+    ranges = {}
+    for part in accept.split(','):
+        media_range, *params = [item.strip() for item in part.split(';')]
+        if not media_range:
+            continue
+        q = 1.0
+        for param in params:
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    q = min(max(float(value), 0.0), 1.0)
+                except ValueError:
+                    pass
+        ranges[media_range.lower()] = q
+    return ranges
+
+
+def _quality(ranges: Dict[str, float], media_type: str, wildcards: bool) -> float:
+    """q de la plage la plus précise qui couvre `media_type` (0 si aucune)"""
+    if media_type in ranges:
+        return ranges[media_type]
+    if wildcards:
+        for media_range in (media_type.split('/')[0] + '/*', '*/*'):
+            if media_range in ranges:
+                return ranges[media_range]
+    return 0.0
+
+
+def negotiate(accept: Optional[str]) -> Optional[str]:
+    """Format binaire demandé par l'en-tête Accept, None pour du JSON
+
+    Un format binaire doit être nommé explicitement (*/* reste du JSON) avec
+    q > 0 ; il l'emporte sur JSON à q égal, le colonnaire sur MessagePack.
+    """
+    if not accept:
+        return None
+    ranges = parse_accept(accept)
+    json_q = _quality(ranges, 'application/json', wildcards=True)
+    best, best_q = None, 0.0
+    for media_type in (COLUMNAR_MEDIA_TYPE, MSGPACK_MEDIA_TYPE):
+        q = _quality(ranges, media_type, wildcards=False)
+        if q > best_q:
+            best, best_q = media_type, q
+    return best if best is not None and best_q >= json_q else None
+
+
+def encode_columns(columns: Dict[str, np.ndarray]) -> bytes:
+    """Encoder des colonnes de même longueur ; NaN dans une colonne flottante = absent"""
+    n_rows = len(next(iter(columns.values()))) if columns else 0
+    descriptors, blocks = [], []
+    for name, values in columns.items():
+        if np.issubdtype(values.dtype, np.integer):
+            code, flags, valid = INT64, 0, None
+        else:
+            code = FLOAT32
+            valid = ~np.isnan(values)
+            flags = 0 if valid.all() else FLAG_NULLS
+        encoded_name = name.encode("ascii")
+        descriptors.append(struct.pack("<B", len(encoded_name)) + encoded_name + struct.pack("<BB", code, flags))
+
+        if flags & FLAG_NULLS:
+            bitmap = np.packbits(valid, bitorder="little").tobytes()
+            blocks.append(bitmap + b"\0" * _pad(len(bitmap)))
+            values = np.where(valid, values, 0)
+        data = values.astype(DTYPES[code], copy=False).tobytes()
+        blocks.append(data + b"\0" * _pad(len(data)))
+
+    header = HEADER.pack(MAGIC, VERSION, len(columns), n_rows) + b"".join(descriptors)
+    return header + b"\0" * _pad(len(header)) + b"".join(blocks)
+
+
+def decode_columns(buffer: bytes) -> Tuple[int, Dict[str, Tuple[np.ndarray, Optional[np.ndarray]]]]:
+    """Décoder en (nb lignes, {nom: (valeurs, masque des présents ou None)})
+
+    Les valeurs sont des vues en lecture seule sur `buffer`, sans copie.
+    """
+    try:
+        magic, version, n_columns, n_rows = HEADER.unpack_from(buffer, 0)
+    except struct.error:
+        raise CodecError("En-tête tronqué")
+    if magic != MAGIC or version != VERSION:
+        raise CodecError("Format colonnaire inconnu")
+
+    offset = HEADER.size
+    descriptors = []
+    try:
+        for _ in range(n_columns):
+            (name_length,) = struct.unpack_from("<B", buffer, offset)
+            name = bytes(buffer[offset + 1:offset + 1 + name_length]).decode("ascii")
+            code, flags = struct.unpack_from("<BB", buffer, offset + 1 + name_length)
+            if code not in DTYPES:
+                raise CodecError(f"Type inconnu pour la colonne {name}")
+            descriptors.append((name, code, flags))
+            offset += 3 + name_length
+    except struct.error:
+        raise CodecError("Descripteurs de colonnes tronqués")
+    offset += _pad(offset)
+
+    columns = {}
+    bitmap_size = (n_rows + 7) // 8
+    for name, code, flags in descriptors:
+        valid = None
+        if flags & FLAG_NULLS:
+            if offset + bitmap_size > len(buffer):
+                raise CodecError(f"Bitmap tronqué pour la colonne {name}")
+            bitmap = np.frombuffer(buffer, dtype=np.uint8, count=bitmap_size, offset=offset)
+            valid = np.unpackbits(bitmap, count=n_rows, bitorder="little").astype(bool)
+            offset += bitmap_size + _pad(bitmap_size)
+        dtype = DTYPES[code]
+        size = n_rows * dtype.itemsize
+        if offset + size > len(buffer):
+            raise CodecError(f"Valeurs tronquées pour la colonne {name}")
+        columns[name] = (np.frombuffer(buffer, dtype=dtype, count=n_rows, offset=offset), valid)
+        offset += size + _pad(size)
+    return n_rows, columns
+
+
+def columns_to_rows(session_id: str, n_rows: int, columns: Dict[str, Tuple[np.ndarray, Optional[np.ndarray]]],
+                    kinds: Dict[str, str]) -> List[dict]:
+    """Lignes prêtes pour l'insertion PostgREST, sans les valeurs absentes
+
+    `kinds` donne le type attendu de chaque colonne acceptée ('i' : int64,
+    'f' : float32) ; une valeur flottante présente doit être finie.
+    """
+    if 'timestamp' not in columns:
+        raise CodecError("Colonne timestamp (int64) manquante")
+    unknown = set(columns) - set(kinds)
+    if unknown:
+        raise CodecError(f"Colonnes inconnues: {', '.join(sorted(unknown))}")
+    for name, (values, valid) in columns.items():
+        if values.dtype.kind != kinds[name]:
+            expected = "int64" if kinds[name] == 'i' else "float32"
+            raise CodecError(f"Colonne {name} : {expected} attendu, {values.dtype.name} reçu")
+        if values.dtype.kind == 'f':
+            finite = np.isfinite(values)
+            if not (finite.all() if valid is None else finite[valid].all()):
+                raise CodecError(f"Colonne {name} : valeur non finie (les absentes passent par le bitmap)")
+
+    rows = [{'session_id': session_id} for _ in range(n_rows)]
+    for name, (values, valid) in columns.items():
+        if valid is None:
+            for row, value in zip(rows, values.tolist()):
+                row[name] = value
+        else:
+            for row, value, present in zip(rows, values.tolist(), valid.tolist()):
+                if present:
+                    row[name] = value
+    return rows
+
+
+def encode_msgpack(columns: Dict[str, np.ndarray]) -> bytes:
+    """MessagePack colonnaire : {nom: [valeurs]}, None pour les absents"""
+    payload = {}
+    for name, values in columns.items():
+        if np.issubdtype(values.dtype, np.integer):
+            payload[name] = values.tolist()
+        else:
+            payload[name] = [None if value != value else value for value in values.tolist()]
+    return msgpack.packb(payload)
+
+
+def decode_msgpack(buffer: bytes):
+    return msgpack.unpackb(buffer)
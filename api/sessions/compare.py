@@ -0,0 +1,260 @@
+"""Comparaison de trajectoires contre une ligne de référence
+
+Chaque point comparé est projeté sur la polyligne de référence : la distance le
+long de la référence aligne les trajectoires, l'écart signé donne le décalage
+latéral (positif à gauche du sens de roulage) et le temps de référence à cette
+distance donne le delta cumulé (positif = plus lent que la référence).
+
+La recherche du segment le plus proche passe par une grille uniforme : seuls
+les segments des cellules voisines sont testés, en lot pour tous les points.
+"""
+import math
+import os
+from typing import Optional, Tuple
+
+import numpy as np
+from fastapi import HTTPException
+
+from models.compare import TrajectorySelection, Comparison, ComparisonPoint
+from sessions.laps import lap_trackers
+from sessions.lifecycle import is_finished
+from sessions.materialize import materialized
+from sessions.paging import fetch_arrays
+from sessions.trajectory import TRAJECTORY_COLUMNS, Trajectory
+
+# Côté minimal (m) d'une cellule de la grille
+CELL_SIZE = float(os.getenv("COMPARE_CELL_SIZE", "2.0"))
+# Espacement minimal (m) des sommets de la référence : une référence échantillonnée
+# très finement remplirait chaque cellule de centaines de segments
+REFERENCE_SPACING = float(os.getenv("COMPARE_REFERENCE_SPACING", "0.25"))
+# Nombre maximal de cellules : la grille grossit au-delà
+MAX_CELLS = 1 << 22
+
+
+def thin(x: np.ndarray, y: np.ndarray, spacing: float) -> np.ndarray:
+    """Indices des sommets gardés : chacun à au moins `spacing` du précédent, plus le dernier
+
+    Le bruit UWB d'une trajectoire très échantillonnée disparaît avec les
+    sommets intermédiaires, sa longueur redevient celle de la piste.
+    """
+    keep = [0]
+    last_x, last_y = float(x[0]), float(y[0])
+    limit = spacing * spacing
+    for i, (px, py) in enumerate(zip(x.tolist(), y.tolist())):
+        if (px - last_x) ** 2 + (py - last_y) ** 2 >= limit:
+            keep.append(i)
+            last_x, last_y = px, py
+    if keep[-1] != len(x) - 1:
+        keep.append(len(x) - 1)
+    return np.array(keep)
+
+
+class ReferenceLine:
+    """Polyligne de référence indexée par une grille de segments (CSR)"""
+
+    def __init__(self, trajectory: Trajectory, cell_size: float = CELL_SIZE, spacing: float = REFERENCE_SPACING):
+        if spacing > 0 and len(trajectory) > 2:
+            trajectory = trajectory.take(thin(trajectory.x, trajectory.y, spacing))
+        self.t = trajectory.timestamp.astype(np.float64)
+        self.x, self.y = trajectory.x, trajectory.y
+        self.dx, self.dy = np.diff(self.x), np.diff(self.y)
+        self.seg_length = np.hypot(self.dx, self.dy)
+        self.distance = np.concatenate(([0.0], np.cumsum(self.seg_length)))
+        self.length = float(self.distance[-1])
+
+        # Une cellule au moins aussi grande que la quasi-totalité des segments :
+        # chaque segment tient alors dans un bloc de 2x2 cellules
+        typical = float(np.percentile(self.seg_length, 99)) if len(self.seg_length) else 0.0
+        self.cell_size = max(cell_size, typical, 1e-6)
+        self.x0, self.y0 = float(self.x.min()), float(self.y.min())
+        while True:
+            self.nx = int((float(self.x.max()) - self.x0) // self.cell_size) + 1
+            self.ny = int((float(self.y.max()) - self.y0) // self.cell_size) + 1
+            if self.nx * self.ny <= MAX_CELLS:
+                break
+            self.cell_size *= 2
+
+        # Boucle fermée : fin de la référence à moins de deux cellules du départ
+        gap = math.hypot(float(self.x[-1] - self.x[0]), float(self.y[-1] - self.y[0]))
+        self.closed = len(self.seg_length) > 2 and gap <= 2 * self.cell_size
+        self._build_grid()
+
+    def _cell(self, x: np.ndarray, y: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        cx = np.clip(((x - self.x0) // self.cell_size).astype(np.int64), 0, self.nx - 1)
+        cy = np.clip(((y - self.y0) // self.cell_size).astype(np.int64), 0, self.ny - 1)
+        return cx, cy
+
+    def _build_grid(self):
+        ax, ay = self._cell(self.x[:-1], self.y[:-1])
+        bx, by = self._cell(self.x[1:], self.y[1:])
+        lo_x, hi_x = np.minimum(ax, bx), np.maximum(ax, bx)
+        lo_y, hi_y = np.minimum(ay, by), np.maximum(ay, by)
+
+        segments, cells = [], []
+        short = ((hi_x - lo_x) <= 1) & ((hi_y - lo_y) <= 1)
+        index = np.flatnonzero(short)
+        for cx, cy in ((lo_x, lo_y), (hi_x, lo_y), (lo_x, hi_y), (hi_x, hi_y)):
+            segments.append(index)
+            cells.append(cx[index] * self.ny + cy[index])
+        # Segments plus longs (trous UWB) : toutes les cellules de leur boîte englobante
+        for i in np.flatnonzero(~short).tolist():
+            gx, gy = np.meshgrid(np.arange(lo_x[i], hi_x[i] + 1), np.arange(lo_y[i], hi_y[i] + 1))
+            cell_ids = (gx * self.ny + gy).ravel()
+            segments.append(np.full(len(cell_ids), i))
+            cells.append(cell_ids)
+
+        segments, cells = np.concatenate(segments), np.concatenate(cells)
+        pairs = np.unique(cells * len(self.seg_length) + segments)
+        cells, segments = np.divmod(pairs, len(self.seg_length))
+        self.cell_segments = segments
+        self.cell_start = np.searchsorted(cells, np.arange(self.nx * self.ny + 1))
+
+    def _candidates(self, cx: np.ndarray, cy: np.ndarray, radius: int,
+                    ring_only: bool = False) -> Tuple[np.ndarray, np.ndarray]:
+        """(indice de point, indice de segment) pour les cellules à distance <= radius"""
+        offsets = [(ox, oy) for ox in range(-radius, radius + 1) for oy in range(-radius, radius + 1)
+                   if not ring_only or max(abs(ox), abs(oy)) == radius]
+        ox = np.array([o[0] for o in offsets])
+        oy = np.array([o[1] for o in offsets])
+        gx, gy = cx[:, None] + ox, cy[:, None] + oy
+        inside = (gx >= 0) & (gx < self.nx) & (gy >= 0) & (gy < self.ny)
+        cell_ids = np.where(inside, gx * self.ny + gy, 0)
+        counts = np.where(inside, self.cell_start[cell_ids + 1] - self.cell_start[cell_ids], 0).ravel()
+        total = int(counts.sum())
+        owner = np.repeat(np.arange(counts.size) // len(offsets), counts)
+        group_start = np.cumsum(counts) - counts
+        flat = np.arange(total) - np.repeat(group_start - self.cell_start[cell_ids].ravel(), counts)
+        return owner, self.cell_segments[flat]
+
+    def _distances(self, px: np.ndarray, py: np.ndarray, seg: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Distance² au segment et paramètre de projection dans [0, 1]"""
+        wx, wy = px - self.x[seg], py - self.y[seg]
+        length2 = self.seg_length[seg] ** 2
+        u = np.clip(np.divide(wx * self.dx[seg] + wy * self.dy[seg], length2,
+                              out=np.zeros_like(length2), where=length2 > 0), 0.0, 1.0)
+        ex, ey = wx - u * self.dx[seg], wy - u * self.dy[seg]
+        return ex * ex + ey * ey, u
+
+    def project(self, px: np.ndarray, py: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """(distance le long de la référence, écart latéral signé) pour chaque point"""
+        n = len(px)
+        seg = np.zeros(n, dtype=np.int64)
+        u = np.zeros(n)
+        best = np.full(n, np.inf)
+        cx, cy = self._cell(px, py)
+
+        # Voisinage 3x3 pour tous les points, puis anneaux croissants pour ceux
+        # dont le segment le plus proche peut encore se trouver plus loin
+        pending = np.arange(n)
+        radius = 1
+        while len(pending):
+            owner, candidates = self._candidates(cx[pending], cy[pending], radius, ring_only=radius > 1)
+            if len(candidates):
+                d2, cu = self._distances(px[pending][owner], py[pending][owner], candidates)
+                order = np.lexsort((d2, owner))
+                first = order[np.unique(owner[order], return_index=True)[1]]
+                points = pending[owner[first]]
+                closer = d2[first] < best[points]
+                points, first = points[closer], first[closer]
+                seg[points], u[points], best[points] = candidates[first], cu[first], d2[first]
+            # Les cellules au-delà de l'anneau courant sont à plus de radius cellules
+            pending = pending[best[pending] > (radius * self.cell_size) ** 2]
+            radius += 1
+            if radius > max(self.nx, self.ny):
+                break
+
+        along = self.distance[seg] + u * self.seg_length[seg]
+        side = np.sign(self.dx[seg] * (py - self.y[seg]) - self.dy[seg] * (px - self.x[seg]))
+        ex = px - self.x[seg] - u * self.dx[seg]
+        ey = py - self.y[seg] - u * self.dy[seg]
+        return along, side * np.hypot(ex, ey)
+
+    def time_at(self, distance: np.ndarray) -> np.ndarray:
+        """Temps de référence (ms depuis son départ) à une distance donnée
+
+        Sur une boucle fermée, une distance hors de [0, longueur] compte des
+        tours entiers de référence en plus ou en moins.
+        """
+        elapsed = self.t - self.t[0]
+        if not self.closed or self.length <= 0:
+            return np.interp(distance, self.distance, elapsed)
+        laps, within = np.divmod(distance, self.length)
+        return laps * elapsed[-1] + np.interp(within, self.distance, elapsed)
+
+    def compare(self, trajectory: Trajectory) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(distance, écart latéral, delta de temps cumulé en ms) pour chaque point"""
+        along, offset = self.project(trajectory.x, trajectory.y)
+        if self.closed and self.length > 0:
+            # Passage de la ligne : la distance projetée repart de 0, on la déroule
+            along = np.unwrap(along, period=self.length)
+            if along[0] > self.length / 2:
+                along = along - self.length
+        elapsed = (trajectory.timestamp - trajectory.timestamp[0]).astype(np.float64)
+        reference = self.time_at(along)
+        return along, offset, elapsed - (reference - reference[0])
+
+
+def lap_window(selection: TrajectorySelection) -> Tuple[Optional[int], Optional[int], Optional[int]]:
+    """Fenêtre (from_ts, to_ts) et numéro du tour demandé"""
+    if selection.lap is None:
+        return selection.from_ts, selection.to_ts, None
+    tracker = lap_trackers.get(selection.session_id)
+    if tracker is None:
+        raise HTTPException(status_code=404, detail=f"Aucun tracé déclaré pour la session {selection.session_id}")
+    summary = tracker.summary()
+    lap = summary.best_lap if selection.lap == 'best' else next(
+        (lap for lap in summary.laps if lap.lap == selection.lap), None)
+    if lap is None:
+        raise HTTPException(status_code=404, detail=f"Tour {selection.lap} introuvable pour la session {selection.session_id}")
+    return math.floor(lap.start), math.ceil(lap.end), lap.lap
+
+
+async def load_trajectory(client, session_id: str, from_ts: Optional[int], to_ts: Optional[int]) -> Trajectory:
+    arrays = await fetch_arrays(client, session_id, TRAJECTORY_COLUMNS, from_ts, to_ts)
+    trajectory = Trajectory.from_arrays(arrays) if arrays is not None else None
+    if trajectory is None or len(trajectory) < 2:
+        raise HTTPException(status_code=404, detail=f"Trajectoire vide pour la session {session_id}")
+    return trajectory
+
+
+async def reference_line(client, selection: TrajectorySelection) -> ReferenceLine:
+    """Ligne de référence indexée, gardée dans le store matérialisé
+
+    Un tour terminé ou une session terminée ne change plus : l'index est
+    réutilisé par toutes les comparaisons suivantes contre la même référence.
+    """
+    from_ts, to_ts, lap = lap_window(selection)
+    params = (from_ts, to_ts)
+    line = materialized.get('reference-line', selection.session_id, params)
+    if line is None:
+        trajectory = await load_trajectory(client, selection.session_id, from_ts, to_ts)
+        line = ReferenceLine(trajectory)
+        if lap is not None or await is_finished(client, selection.session_id):
+            materialized.put('reference-line', selection.session_id, line, params)
+    return line
+
+
+async def compare_selection(client, reference: ReferenceLine, selection: TrajectorySelection,
+                            max_points: Optional[int] = None) -> Comparison:
+    from_ts, to_ts, lap = lap_window(selection)
+    trajectory = await load_trajectory(client, selection.session_id, from_ts, to_ts)
+    along, offset, delta = reference.compare(trajectory)
+    abs_offset = np.abs(offset)
+
+    indices = np.arange(len(trajectory))
+    if max_points is not None and len(indices) > max_points:
+        indices = np.unique(np.linspace(0, len(indices) - 1, max_points).round().astype(np.int64))
+    points = [
+        ComparisonPoint(timestamp=timestamp, distance=distance, lateral_offset=lateral, time_delta=time_delta)
+        for timestamp, distance, lateral, time_delta in zip(
+            trajectory.timestamp[indices].tolist(), along[indices].tolist(),
+            offset[indices].tolist(), delta[indices].tolist())
+    ]
+    return Comparison(
+        session_id=selection.session_id,
+        lap=lap,
+        points=points,
+        final_delta=float(delta[-1]),
+        mean_abs_offset=float(abs_offset.mean()),
+        max_abs_offset=float(abs_offset.max())
+    )
@@ -0,0 +1,356 @@
+"""Export en masse de sensor_data : CSV, Parquet ou Arrow IPC, en flux
+
+Une ou plusieurs sessions, toutes les colonnes ou une sélection, envoyées
+au fil des pages : la mémoire reste bornée quel que soit le volume. Les
+pages de plusieurs sessions sont récupérées en parallèle (EXPORT_CONCURRENCY
+sessions à la fois, EXPORT_PREFETCH pages d'avance chacune) ; la sortie garde
+l'ordre des sessions demandées, chacune triée par timestamp.
+
+Parquet et Arrow exigent pyarrow (dépendance optionnelle). Compression :
+- CSV : "gzip" sur tout le flux ;
+- Arrow IPC : "lz4" ou "zstd" sur tout le flux ;
+- Parquet : un codec par défaut et des exceptions par colonne,
+  "zstd,timestamp:snappy,steering_angle:none".
+
+En ligne de commande (même source que l'API : Supabase ou archive locale) :
+    python -m sessions export -f parquet -z zstd -o session.parquet <session_id>...
+"""
+import argparse
+import asyncio
+import csv
+import io
+import itertools
+import os
+import sys
+import time
+import zlib
+from typing import AsyncIterator, List, Optional
+
+import numpy as np
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+from config.database import supabase_config
+from sessions.archive import session_archive
+from sessions.frame import FRAME_COLUMNS, SessionFrame
+from sessions.paging import iter_pages
+
+EXPORT_CONCURRENCY = int(os.getenv("EXPORT_CONCURRENCY", "4"))
+EXPORT_PREFETCH = int(os.getenv("EXPORT_PREFETCH", "4"))
+EXPORT_MAX_SESSIONS = int(os.getenv("EXPORT_MAX_SESSIONS", "100"))
+# Lignes par row group Parquet : les pages sont regroupées jusqu'à ce seuil
+EXPORT_ROW_GROUP_ROWS = int(os.getenv("EXPORT_ROW_GROUP_ROWS", "65536"))
+
+# Format -> (type de contenu, extension)
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+}
+CODECS = {
+    "csv": ("none", "gzip"),
+    "parquet": ("none", "snappy", "gzip", "brotli", "zstd", "lz4"),
+    "arrow": ("none", "lz4", "zstd"),
+}
+
+
+def parse_sessions(sessions: str) -> List[str]:
+    session_ids = list(dict.fromkeys(part.strip() for part in sessions.split(',') if part.strip()))
+    if not session_ids:
+        raise ValueError("Aucune session à exporter")
+    if len(session_ids) > EXPORT_MAX_SESSIONS:
+        raise ValueError(f"Au plus {EXPORT_MAX_SESSIONS} sessions par export")
+    return session_ids
+
+
+def parse_columns(columns: Optional[str]) -> List[str]:
+    """Colonnes de valeurs exportées, dans l'ordre de SensorData (toutes par défaut)
+
+    session_id et timestamp sont toujours exportés en tête.
+    """
+    if not columns:
+        return [column for column in FRAME_COLUMNS if column != 'timestamp']
+    requested = {part.strip() for part in columns.split(',') if part.strip()}
+    unknown = requested - set(FRAME_COLUMNS) - {'session_id'}
+    if unknown:
+        raise ValueError(f"Colonnes inconnues : {', '.join(sorted(unknown))} (possibles : {', '.join(FRAME_COLUMNS)})")
+    return [column for column in FRAME_COLUMNS if column in requested and column != 'timestamp']
+
+
+def parse_compression(format: str, compression: Optional[str], columns: List[str]):
+    """"zstd" ou "zstd,uwb_x:snappy" -> codec unique, ou dict par colonne (Parquet)"""
+    columns = ['session_id', 'timestamp'] + columns
+    default, per_column = "none", {}
+    for part in (compression or "").split(','):
+        part = part.strip().lower()
+        if not part:
+            continue
+        column, _, codec = part.rpartition(':')
+        if codec not in CODECS[format]:
+            raise ValueError(f"Compression {codec!r} impossible en {format} (possibles : {', '.join(CODECS[format])})")
+        if not column:
+            default = codec
+        elif column not in columns:
+            raise ValueError(f"Compression pour une colonne non exportée : {column}")
+        else:
+            per_column[column] = codec
+    if per_column and format != "parquet":
+        raise ValueError("La compression par colonne n'existe qu'en Parquet")
+    if per_column:
+        return {column: per_column.get(column, default) for column in columns}
+    return default
+
+
+async def _produce(client, session_id: str, columns: List[str], from_ts: Optional[int], to_ts: Optional[int],
+                   queue: asyncio.Queue):
+    """Pages d'une session converties en frames ; None à la fin, l'exception en cas d'échec"""
+    try:
+        async for rows in iter_pages(client, session_id, columns, from_ts, to_ts):
+            await queue.put(SessionFrame.from_rows(rows, columns, session_id))
+        await queue.put(None)
+    except Exception as e:
+        await queue.put(e)
+
+
+async def export_frames(client, session_ids: List[str], columns: List[str], from_ts: Optional[int] = None,
+                        to_ts: Optional[int] = None, concurrency: int = EXPORT_CONCURRENCY,
+                        prefetch: int = EXPORT_PREFETCH) -> AsyncIterator[SessionFrame]:
+    """Frames de toutes les sessions, dans l'ordre demandé
+
+    Les `concurrency` sessions suivantes sont lues pendant l'envoi de la
+    session courante, chacune avec au plus `prefetch` pages d'avance.
+    """
+    queues: List[asyncio.Queue] = []
+    tasks: List[asyncio.Task] = []
+
+    def start_next():
+        queue = asyncio.Queue(maxsize=prefetch)
+        session_id = session_ids[len(queues)]
+        queues.append(queue)
+        tasks.append(asyncio.create_task(_produce(client, session_id, columns, from_ts, to_ts, queue)))
+
+    try:
+        for _ in range(min(concurrency, len(session_ids))):
+            start_next()
+        for index in range(len(session_ids)):
+            queue = queues[index]
+            while True:
+                frame = await queue.get()
+                if frame is None:
+                    break
+                if isinstance(frame, Exception):
+                    raise frame
+                yield frame
+            if len(queues) < len(session_ids):
+                start_next()
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+class _Sink(io.RawIOBase):
+    """Fichier en écriture seule dont on récupère le contenu au fil de l'eau"""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class CsvExport:
+    def __init__(self, columns: List[str], compression: str = "none"):
+        self.columns = columns
+        self.header = ['session_id', 'timestamp'] + columns
+        self._text = io.StringIO()
+        self._writer = csv.writer(self._text, lineterminator='\n')
+        # wbits 31 : conteneur gzip, lisible par gunzip et pandas
+        self._gzip = zlib.compressobj(6, zlib.DEFLATED, 31) if compression == "gzip" else None
+        self.media_type = "application/gzip" if self._gzip else EXPORT_FORMATS["csv"][0]
+        self.extension = "csv.gz" if self._gzip else "csv"
+        self._writer.writerow(self.header)
+
+    def _take(self) -> bytes:
+        data = self._text.getvalue().encode()
+        self._text.seek(0)
+        self._text.truncate()
+        return self._gzip.compress(data) if self._gzip else data
+
+    def write(self, frame: SessionFrame) -> bytes:
+        values = [frame.column_values(column) for column in ['timestamp'] + self.columns]
+        self._writer.writerows(zip(itertools.repeat(frame.session_id), *values))
+        return self._take()
+
+    def close(self) -> bytes:
+        data = self._take()
+        return data + self._gzip.flush() if self._gzip else data
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        return pyarrow
+    except ImportError:
+        raise ValueError("Export Parquet/Arrow indisponible : pyarrow n'est pas installé")
+
+
+class _ArrowBase:
+    def __init__(self, columns: List[str]):
+        pa = self.pa = _pyarrow()
+        self.columns = columns
+        # session_id en dictionnaire : une seule valeur par page, stockée une fois
+        self.schema = pa.schema([('session_id', pa.dictionary(pa.int32(), pa.string())), ('timestamp', pa.int64())] +
+                                [(column, pa.float64()) for column in columns])
+        self._sink = _Sink()
+
+    def batch(self, frame: SessionFrame):
+        """Colonnes du frame sans copie ; les nulls passent par le masque de validité"""
+        pa = self.pa
+        arrays = [pa.DictionaryArray.from_arrays(np.zeros(frame.n_rows, dtype=np.int32), [frame.session_id]),
+                  pa.array(frame['timestamp'])]
+        for column in self.columns:
+            mask = frame.nulls(column) if frame.null_count(column) else None
+            arrays.append(pa.array(frame[column], mask=mask))
+        return pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+
+
+class ArrowExport(_ArrowBase):
+    media_type, extension = EXPORT_FORMATS["arrow"]
+
+    def __init__(self, columns: List[str], compression: str = "none"):
+        super().__init__(columns)
+        options = self.pa.ipc.IpcWriteOptions(compression=None if compression == "none" else compression)
+        self._writer = self.pa.ipc.new_stream(self._sink, self.schema, options=options)
+
+    def write(self, frame: SessionFrame) -> bytes:
+        self._writer.write_batch(self.batch(frame))
+        return self._sink.drain()
+
+    def close(self) -> bytes:
+        self._writer.close()
+        return self._sink.drain()
+
+
+class ParquetExport(_ArrowBase):
+    media_type, extension = EXPORT_FORMATS["parquet"]
+
+    def __init__(self, columns: List[str], compression="none", row_group_rows: int = EXPORT_ROW_GROUP_ROWS):
+        super().__init__(columns)
+        import pyarrow.parquet as pq
+        self.row_group_rows = row_group_rows
+        self._batches, self._rows = [], 0
+        self._writer = pq.ParquetWriter(self._sink, self.schema, compression=compression)
+
+    def _flush(self) -> bytes:
+        if self._batches:
+            table = self.pa.Table.from_batches(self._batches, self.schema)
+            self._writer.write_table(table, row_group_size=len(table))
+            self._batches, self._rows = [], 0
+        return self._sink.drain()
+
+    def write(self, frame: SessionFrame) -> bytes:
+        # Des row groups de la taille d'une page (1000 lignes) compresseraient mal
+        self._batches.append(self.batch(frame))
+        self._rows += frame.n_rows
+        return self._flush() if self._rows >= self.row_group_rows else b''
+
+    def close(self) -> bytes:
+        data = self._flush()
+        self._writer.close()
+        return data + self._sink.drain()
+
+
+def make_exporter(format: str, columns: List[str], compression: Optional[str] = None):
+    if format not in EXPORT_FORMATS:
+        raise ValueError(f"Format inconnu : {format} (possibles : {', '.join(EXPORT_FORMATS)})")
+    codec = parse_compression(format, compression, columns)
+    if format == "csv":
+        return CsvExport(columns, codec)
+    if format == "arrow":
+        return ArrowExport(columns, codec)
+    return ParquetExport(columns, codec)
+
+
+async def encode_export(frames: AsyncIterator[SessionFrame], exporter, first: Optional[SessionFrame] = None):
+    """Octets du fichier exporté, au fil des frames"""
+    if first is not None:
+        yield exporter.write(first)
+    async for frame in frames:
+        data = exporter.write(frame)
+        if data:
+            yield data
+    yield exporter.close()
+
+
+async def stream_export(frames: AsyncIterator[SessionFrame], exporter, filename: str = "mokart-export") -> StreamingResponse:
+    """Réponse streamée ; la première page est lue avant de répondre pour pouvoir encore renvoyer un 404"""
+    first = await anext(frames, None)
+    if first is None:
+        raise HTTPException(status_code=404, detail="Aucune donnée à exporter")
+    headers = {"Content-Disposition": f'attachment; filename="{filename}.{exporter.extension}"'}
+    return StreamingResponse(encode_export(frames, exporter, first), media_type=exporter.media_type, headers=headers)
+
+
+async def _export_file(args):
+    # Tout valider avant de toucher au fichier de sortie
+    session_ids = parse_sessions(','.join(args.sessions))
+    exporter = make_exporter(args.format, parse_columns(args.columns), args.compression)
+    client = await supabase_config.run(supabase_config.get_client)
+    if client is None and not supabase_config.offline:
+        raise SystemExit("⚠️ Supabase non connecté")
+    start, n_rows = time.perf_counter(), 0
+    session_archive.open()
+    output = None
+    try:
+        output = sys.stdout.buffer if args.output == '-' else open(args.output, 'wb')
+        frames = export_frames(client, session_ids, exporter.columns, args.from_ts, args.to_ts, args.concurrency)
+        async for frame in frames:
+            n_rows += frame.n_rows
+            output.write(exporter.write(frame))
+        output.write(exporter.close())
+    except BaseException:
+        # Pas de fichier tronqué laissé derrière un export en échec
+        if output is not None and output is not sys.stdout.buffer:
+            output.close()
+            os.remove(args.output)
+        raise
+    finally:
+        if output is not None and output is not sys.stdout.buffer:
+            output.close()
+        await session_archive.stop()
+    if args.output != '-':
+        print(f"📦 {n_rows} lignes, {len(session_ids)} sessions -> {args.output} "
+              f"({os.path.getsize(args.output) / 1024 / 1024:.1f} Mo, {time.perf_counter() - start:.1f}s)")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(prog="python -m sessions export", description="Exporter sensor_data")
+    parser.add_argument("sessions", nargs='+', help="identifiants de sessions")
+    parser.add_argument("-f", "--format", choices=list(EXPORT_FORMATS), default="csv")
+    parser.add_argument("-c", "--columns", help="colonnes séparées par des virgules (défaut : toutes)")
+    parser.add_argument("-z", "--compression", help='codec, ou "zstd,uwb_x:snappy" en Parquet')
+    parser.add_argument("-o", "--output", default='-', help="fichier de sortie (défaut : sortie standard)")
+    parser.add_argument("--from-ts", type=int, dest="from_ts")
+    parser.add_argument("--to-ts", type=int, dest="to_ts")
+    parser.add_argument("--concurrency", type=int, default=EXPORT_CONCURRENCY, help="sessions lues en parallèle")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(_export_file(args))
+    except ValueError as e:
+        parser.error(str(e))
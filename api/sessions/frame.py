@@ -0,0 +1,143 @@
+"""Représentation colonnaire d'une session : un tableau typé par champ de SensorData
+
+Une session de 100k lignes en dicts PostgREST (14 clés, objets float
+individuels) pèse des centaines de Mo ; en colonnes, 8 octets par valeur.
+Les pages amont sont converties dès réception et seules les colonnes
+s'accumulent. Les valeurs absentes sont des NaN (le timestamp n'est jamais
+nul) ; le masque des nulls de chaque colonne est calculé une fois à la
+construction et gardé seulement s'il y a des nulls.
+
+Le frame se lit comme un dict {colonne: tableau} : le code qui travaillait sur
+des dicts de tableaux l'accepte tel quel.
+"""
+from collections.abc import Mapping
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from models.session import SensorData
+
+# Champs de SensorData stockés en colonnes (session_id est porté par le frame)
+FRAME_COLUMNS = [name for name in SensorData.model_fields if name != 'session_id']
+INT_COLUMNS = {'timestamp'}
+
+
+def column_dtype(column: str):
+    return np.int64 if column in INT_COLUMNS else np.float64
+
+
+class SessionFrame(Mapping):
+    __slots__ = ('session_id', '_columns', '_nulls')
+
+    def __init__(self, columns: Dict[str, np.ndarray], session_id: Optional[str] = None,
+                 nulls: Optional[Dict[str, np.ndarray]] = None):
+        self.session_id = session_id
+        self._columns = columns
+        if nulls is None:
+            nulls = {}
+            for column, values in columns.items():
+                if values.dtype.kind == 'f':
+                    missing = np.isnan(values)
+                    if missing.any():
+                        nulls[column] = missing
+        self._nulls = nulls
+
+    # Construction
+
+    @classmethod
+    def from_rows(cls, rows: List[dict], columns: Iterable[str] = FRAME_COLUMNS,
+                  session_id: Optional[str] = None) -> "SessionFrame":
+        """Lignes PostgREST -> colonnes typées triées par timestamp (None devient NaN)"""
+        columns = ['timestamp'] + [column for column in columns if column not in ('timestamp', 'session_id')]
+        arrays = {column: np.array([row.get(column) for row in rows], dtype=column_dtype(column)) for column in columns}
+
+        # Supabase ne garantit aucun ordre sans order(), on trie une fois ici
+        order = np.argsort(arrays['timestamp'], kind='stable')
+        if not np.all(order[:-1] < order[1:]):
+            arrays = {column: values[order] for column, values in arrays.items()}
+        return cls(arrays, session_id)
+
+    @classmethod
+    def concat(cls, frames: List["SessionFrame"]) -> "SessionFrame":
+        """Pages successives (déjà dans l'ordre des timestamps) mises bout à bout"""
+        if len(frames) == 1:
+            return frames[0]
+        first = frames[0]
+        columns = {column: np.concatenate([frame._columns[column] for frame in frames]) for column in first}
+        nulls = {}
+        for column in columns:
+            if any(column in frame._nulls for frame in frames):
+                nulls[column] = np.concatenate([frame.nulls(column) for frame in frames])
+        return cls(columns, first.session_id, nulls)
+
+    # Lecture façon dict
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        return self._columns[column]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._columns)
+
+    def __len__(self) -> int:
+        return len(self._columns)
+
+    @property
+    def n_rows(self) -> int:
+        return len(self._columns['timestamp'])
+
+    @property
+    def nbytes(self) -> int:
+        return sum(values.nbytes for values in self._columns.values()) + \
+            sum(mask.nbytes for mask in self._nulls.values())
+
+    def nulls(self, column: str) -> np.ndarray:
+        """Masque des valeurs absentes de la colonne"""
+        mask = self._nulls.get(column)
+        return mask if mask is not None else np.zeros(self.n_rows, dtype=bool)
+
+    def valid(self, column: str) -> np.ndarray:
+        """Masque des valeurs présentes de la colonne"""
+        mask = self._nulls.get(column)
+        return ~mask if mask is not None else np.ones(self.n_rows, dtype=bool)
+
+    def null_count(self, column: str) -> int:
+        mask = self._nulls.get(column)
+        return int(np.count_nonzero(mask)) if mask is not None else 0
+
+    # Sous-ensembles, sans copie pour les tranches
+
+    def take(self, index) -> "SessionFrame":
+        """Lignes désignées par un masque booléen, des indices ou une tranche"""
+        return SessionFrame({column: values[index] for column, values in self._columns.items()}, self.session_id,
+                            {column: mask[index] for column, mask in self._nulls.items()})
+
+    def window(self, from_ts: Optional[int] = None, to_ts: Optional[int] = None) -> "SessionFrame":
+        t = self._columns['timestamp']
+        lo = int(np.searchsorted(t, from_ts, side='left')) if from_ts is not None else 0
+        hi = int(np.searchsorted(t, to_ts, side='right')) if to_ts is not None else len(t)
+        return self.take(slice(lo, hi))
+
+    def select(self, columns: Iterable[str]) -> "SessionFrame":
+        columns = ['timestamp'] + [column for column in columns if column != 'timestamp']
+        return SessionFrame({column: self._columns[column] for column in columns}, self.session_id,
+                            {column: self._nulls[column] for column in columns if column in self._nulls})
+
+    # Sortie
+
+    def column_values(self, column: str) -> list:
+        """Valeurs Python de la colonne, None pour les nulls"""
+        items = self._columns[column].tolist()
+        mask = self._nulls.get(column)
+        if mask is not None:
+            for i in np.flatnonzero(mask).tolist():
+                items[i] = None
+        return items
+
+    def to_rows(self) -> List[dict]:
+        """Lignes dict (None pour les nulls), pour les sorties qui en exigent"""
+        names = list(self._columns)
+        rows = [dict(zip(names, row)) for row in zip(*(self.column_values(column) for column in names))]
+        if self.session_id is not None:
+            for row in rows:
+                row['session_id'] = self.session_id
+        return rows
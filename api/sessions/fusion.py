@@ -0,0 +1,157 @@
+"""Fusion IMU + UWB : trajectoire lissée et trous UWB comblés à l'estime
+
+1. Cap : le gyroscope (imu_gz) intégré donne les hautes fréquences, le cap de
+   route UWB corrige la dérive (filtre complémentaire, entièrement vectorisé).
+2. Les accélérations corps (imu_ax avant, imu_ay gauche) sont tournées dans le
+   repère piste.
+3. Filtre de Kalman position/vitesse par axe piloté par ces accélérations,
+   corrigé par les positions UWB quand elles existent, puis lissage RTS.
+
+x et y partagent dt, bruits et disponibilité des mesures : la covariance et le
+gain ne sont calculés qu'une fois par échantillon pour les deux axes.
+Hypothèses : piste plane, timestamps en ms, accélérations en m/s², gyro en rad/s.
+"""
+import os
+from typing import Optional
+
+import numpy as np
+
+from sessions.trajectory import Trajectory
+
+FUSION_COLUMNS = ['timestamp', 'uwb_x', 'uwb_y', 'imu_ax', 'imu_ay', 'imu_gz', 'steering_angle']
+
+# Écart-type du bruit d'accélération (m/s²) et de la mesure UWB (m)
+ACCEL_NOISE = float(os.getenv("FUSION_ACCEL_NOISE", "0.5"))
+UWB_NOISE = float(os.getenv("FUSION_UWB_NOISE", "0.10"))
+# En dessous de cette vitesse (m/s) le cap de route UWB n'est pas fiable
+MIN_COURSE_SPEED = 1.0
+# Constante de temps (s) du passe-bas appliqué à la correction de cap
+HEADING_TIME_CONSTANT = 2.0
+
+
+def _nan_to_zero(values: np.ndarray) -> np.ndarray:
+    return np.where(np.isnan(values), 0.0, values)
+
+
+def _interp_valid(t: np.ndarray, values: np.ndarray, valid: np.ndarray) -> np.ndarray:
+    """Interpoler linéairement les valeurs manquantes, constantes aux extrémités"""
+    if not valid.any():
+        return np.zeros_like(values)
+    return np.interp(t, t[valid], values[valid])
+
+
+def estimate_heading(t: np.ndarray, x: np.ndarray, y: np.ndarray, gz: np.ndarray) -> np.ndarray:
+    """Cap (rad) : gyro intégré + correction basse fréquence par le cap de route UWB"""
+    dt = np.diff(t, prepend=t[0])
+    gyro_heading = np.cumsum(_nan_to_zero(gz) * dt)
+
+    has_fix = ~(np.isnan(x) | np.isnan(y))
+    fx, fy = _interp_valid(t, x, has_fix), _interp_valid(t, y, has_fix)
+    vx, vy = np.gradient(fx, t), np.gradient(fy, t)
+    course = np.arctan2(vy, vx)
+    reliable = has_fix & (np.hypot(vx, vy) > MIN_COURSE_SPEED)
+    if not reliable.any():
+        return gyro_heading
+
+    # Écart gyro/route ramené dans [-pi, pi] puis déroulé pour pouvoir être lissé
+    offset = np.unwrap(np.angle(np.exp(1j * (course - gyro_heading)))[reliable])
+    offset = np.interp(t, t[reliable], offset)
+
+    # Passe-bas par moyenne glissante sur ~HEADING_TIME_CONSTANT secondes
+    median_dt = float(np.median(np.diff(t))) if len(t) > 1 else 1.0
+    window = max(1, int(HEADING_TIME_CONSTANT / max(median_dt, 1e-3)))
+    if window > 1 and len(offset) > window:
+        kernel = np.ones(window) / window
+        padded = np.pad(offset, (window // 2, window - 1 - window // 2), mode='edge')
+        offset = np.convolve(padded, kernel, mode='valid')
+    return gyro_heading + offset
+
+
+def fuse(arrays: dict, smooth: bool = True,
+         accel_noise: float = ACCEL_NOISE, uwb_noise: float = UWB_NOISE) -> Optional[Trajectory]:
+    """Trajectoire fusionnée, un point par échantillon à partir du premier fix UWB"""
+    t_ms = arrays['timestamp']
+    x_meas, y_meas = arrays['uwb_x'], arrays['uwb_y']
+    has_fix = ~(np.isnan(x_meas) | np.isnan(y_meas))
+    if not has_fix.any():
+        return None
+
+    start = int(np.argmax(has_fix))
+    t_ms = t_ms[start:]
+    t = t_ms / 1000.0
+    x_meas, y_meas, has_fix = x_meas[start:], y_meas[start:], has_fix[start:]
+    steering = arrays['steering_angle'][start:]
+
+    heading = estimate_heading(t, x_meas, y_meas, arrays['imu_gz'][start:])
+    ax_body, ay_body = _nan_to_zero(arrays['imu_ax'][start:]), _nan_to_zero(arrays['imu_ay'][start:])
+    cos_h, sin_h = np.cos(heading), np.sin(heading)
+    ax_world = (ax_body * cos_h - ay_body * sin_h).tolist()
+    ay_world = (ax_body * sin_h + ay_body * cos_h).tolist()
+    dts = np.diff(t, prepend=t[0]).tolist()
+    fixes = has_fix.tolist()
+    zx, zy = _nan_to_zero(x_meas).tolist(), _nan_to_zero(y_meas).tolist()
+
+    n = len(t)
+    q = accel_noise * accel_noise
+    r = uwb_noise * uwb_noise
+
+    # Sorties du filtre avant : états et covariances (p00, p01, p11) filtrés et prédits
+    fpx, fvx, fpy, fvy = [0.0] * n, [0.0] * n, [0.0] * n, [0.0] * n
+    ppx, pvx, ppy, pvy = [0.0] * n, [0.0] * n, [0.0] * n, [0.0] * n
+    f00, f01, f11 = [0.0] * n, [0.0] * n, [0.0] * n
+    pp00, pp01, pp11 = [0.0] * n, [0.0] * n, [0.0] * n
+
+    px, vx, py, vy = zx[0], 0.0, zy[0], 0.0
+    p00, p01, p11 = r, 0.0, 100.0
+    for k in range(n):
+        dt = dts[k]
+        if k:
+            # Prédiction : p += v dt + a dt²/2, v += a dt
+            half = 0.5 * dt * dt
+            px, vx = px + vx * dt + ax_world[k] * half, vx + ax_world[k] * dt
+            py, vy = py + vy * dt + ay_world[k] * half, vy + ay_world[k] * dt
+            # P = F P F' + Q, bruit d'accélération blanc
+            p00, p01, p11 = (
+                p00 + 2 * dt * p01 + dt * dt * p11 + q * half * half,
+                p01 + dt * p11 + q * half * dt,
+                p11 + q * dt * dt,
+            )
+        ppx[k], pvx[k], ppy[k], pvy[k] = px, vx, py, vy
+        pp00[k], pp01[k], pp11[k] = p00, p01, p11
+
+        if fixes[k]:
+            s = p00 + r
+            k0, k1 = p00 / s, p01 / s
+            ex, ey = zx[k] - px, zy[k] - py
+            px, vx = px + k0 * ex, vx + k1 * ex
+            py, vy = py + k0 * ey, vy + k1 * ey
+            p00, p01, p11 = (1 - k0) * p00, (1 - k0) * p01, p11 - k1 * p01
+
+        fpx[k], fvx[k], fpy[k], fvy[k] = px, vx, py, vy
+        f00[k], f01[k], f11[k] = p00, p01, p11
+
+    if smooth:
+        # Lissage Rauch-Tung-Striebel, en arrière
+        spx, svx, spy, svy = fpx[-1], fvx[-1], fpy[-1], fvy[-1]
+        for k in range(n - 2, -1, -1):
+            dt = dts[k + 1]
+            a00, a01, a11 = f00[k], f01[k], f11[k]
+            # C = P_k F' inv(P_pred_{k+1})
+            c00, c01 = a00 + dt * a01, a01
+            c10, c11 = a01 + dt * a11, a11
+            b00, b01, b11 = pp00[k + 1], pp01[k + 1], pp11[k + 1]
+            det = b00 * b11 - b01 * b01
+            if det <= 0:
+                # Covariance dégénérée : l'état filtré est gardé tel quel
+                spx, svx, spy, svy = fpx[k], fvx[k], fpy[k], fvy[k]
+                continue
+            i00, i01, i11 = b11 / det, -b01 / det, b00 / det
+            g00, g01 = c00 * i00 + c01 * i01, c00 * i01 + c01 * i11
+            g10, g11 = c10 * i00 + c11 * i01, c10 * i01 + c11 * i11
+            dx, dvx = spx - ppx[k + 1], svx - pvx[k + 1]
+            dy, dvy = spy - ppy[k + 1], svy - pvy[k + 1]
+            spx, svx = fpx[k] + g00 * dx + g01 * dvx, fvx[k] + g10 * dx + g11 * dvx
+            spy, svy = fpy[k] + g00 * dy + g01 * dvy, fvy[k] + g10 * dy + g11 * dvy
+            fpx[k], fvx[k], fpy[k], fvy[k] = spx, svx, spy, svy
+
+    return Trajectory(t_ms, np.array(fpx), np.array(fpy), steering)
@@ -0,0 +1,199 @@
+"""Agrégation spatiale d'une métrique sur une grille de la piste
+
+La grille est ancrée sur l'origine (cellule = floor(x / cell_size)) : deux
+grilles de même métrique et même taille de cellule se fusionnent sans
+connaître les bornes à l'avance. Chaque cellule garde effectif, somme,
+maximum et un histogramme à bornes fixes par métrique, d'où des centiles
+approchés (à une largeur de classe près) eux aussi fusionnables.
+"""
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from config.database import supabase_config
+from sessions.kinematics import KINEMATICS_COLUMNS, derive
+from sessions.lifecycle import is_finished
+from sessions.materialize import materialized
+from sessions.paging import fetch_arrays
+from sessions.trajectory import TRAJECTORY_COLUMNS
+
+# Bornes des histogrammes par métrique ; les valeurs hors bornes tombent dans les classes extrêmes
+METRIC_RANGES = {
+    'speed': (0.0, 40.0),
+    'long_accel': (-20.0, 20.0),
+    'lat_accel': (-20.0, 20.0),
+    'combined_g': (0.0, 3.0),
+    'yaw_rate': (-3.0, 3.0),
+    'braking': (0.0, 20.0),
+    'steering_angle': (-90.0, 90.0),
+}
+METRICS = list(METRIC_RANGES)
+HISTOGRAM_BINS = int(os.getenv("HEATMAP_BINS", "64"))
+DEFAULT_PERCENTILES = [50.0, 90.0]
+# Sessions agrégées au plus par une carte multi-sessions (les plus récentes)
+MAX_SESSIONS = int(os.getenv("HEATMAP_MAX_SESSIONS", "50"))
+
+# Clés de cellule : (ix + OFFSET) * SPAN + (iy + OFFSET), soit ±2^20 cellules par axe
+OFFSET = 1 << 20
+SPAN = 1 << 21
+
+
+def parse_percentiles(percentiles: Optional[str]) -> List[float]:
+    """"50,90,99" -> [50.0, 90.0, 99.0] ; ValueError hors de ]0, 100]"""
+    if not percentiles:
+        return DEFAULT_PERCENTILES
+    values = [float(value) for value in percentiles.split(',') if value.strip()]
+    if any(not 0 < value <= 100 for value in values):
+        raise ValueError("Les centiles doivent être dans ]0, 100]")
+    return values
+
+
+def metric_columns(metric: str) -> List[str]:
+    return TRAJECTORY_COLUMNS if metric == 'steering_angle' else KINEMATICS_COLUMNS
+
+
+def metric_values(metric: str, arrays: dict) -> np.ndarray:
+    """Valeur de la métrique pour chaque ligne de `arrays`"""
+    if metric == 'steering_angle':
+        return arrays['steering_angle']
+    derived = derive(arrays)
+    if metric == 'braking':
+        # Intensité de freinage : décélération longitudinale, 0 hors freinage
+        return np.maximum(-derived['long_accel'], 0.0)
+    return derived[metric]
+
+
+class HeatmapGrid:
+    """Grille creuse : seules les cellules visitées sont stockées"""
+
+    __slots__ = ('metric', 'cell_size', 'keys', 'count', 'total', 'maximum', 'histogram')
+
+    def __init__(self, metric: str, cell_size: float, keys: np.ndarray, count: np.ndarray,
+                 total: np.ndarray, maximum: np.ndarray, histogram: np.ndarray):
+        self.metric = metric
+        self.cell_size = cell_size
+        self.keys = keys
+        self.count = count
+        self.total = total
+        self.maximum = maximum
+        self.histogram = histogram
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    @classmethod
+    def empty(cls, metric: str, cell_size: float) -> "HeatmapGrid":
+        return cls(metric, cell_size, np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64),
+                   np.empty(0), np.empty(0), np.empty((0, HISTOGRAM_BINS), dtype=np.int32))
+
+    @classmethod
+    def from_points(cls, metric: str, cell_size: float, x: np.ndarray, y: np.ndarray,
+                    values: np.ndarray) -> "HeatmapGrid":
+        present = ~(np.isnan(x) | np.isnan(y) | np.isnan(values))
+        x, y, values = x[present], y[present], values[present]
+        if len(values) == 0:
+            return cls.empty(metric, cell_size)
+
+        ix = np.floor(x / cell_size).astype(np.int64)
+        iy = np.floor(y / cell_size).astype(np.int64)
+        keys, cell = np.unique((ix + OFFSET) * SPAN + (iy + OFFSET), return_inverse=True)
+        n = len(keys)
+
+        maximum = np.full(n, -np.inf)
+        np.maximum.at(maximum, cell, values)
+        lo, hi = METRIC_RANGES[metric]
+        bins = np.clip(((values - lo) / (hi - lo) * HISTOGRAM_BINS).astype(np.int64), 0, HISTOGRAM_BINS - 1)
+        histogram = np.bincount(cell * HISTOGRAM_BINS + bins, minlength=n * HISTOGRAM_BINS)
+        return cls(metric, cell_size, keys, np.bincount(cell, minlength=n),
+                   np.bincount(cell, weights=values, minlength=n), maximum,
+                   histogram.reshape(n, HISTOGRAM_BINS).astype(np.int32))
+
+    @classmethod
+    def merge(cls, grids: List["HeatmapGrid"], metric: str, cell_size: float) -> "HeatmapGrid":
+        """Somme de grilles partielles, cellule par cellule"""
+        grids = [grid for grid in grids if len(grid)]
+        if not grids:
+            return cls.empty(metric, cell_size)
+        if len(grids) == 1:
+            return grids[0]
+        keys, cell = np.unique(np.concatenate([grid.keys for grid in grids]), return_inverse=True)
+        n = len(keys)
+        count = np.zeros(n, dtype=np.int64)
+        total = np.zeros(n)
+        maximum = np.full(n, -np.inf)
+        histogram = np.zeros((n, HISTOGRAM_BINS), dtype=np.int32)
+        np.add.at(count, cell, np.concatenate([grid.count for grid in grids]))
+        np.add.at(total, cell, np.concatenate([grid.total for grid in grids]))
+        np.maximum.at(maximum, cell, np.concatenate([grid.maximum for grid in grids]))
+        np.add.at(histogram, cell, np.concatenate([grid.histogram for grid in grids]))
+        return cls(metric, cell_size, keys, count, total, maximum, histogram)
+
+    def percentile(self, q: float) -> np.ndarray:
+        """Centile par cellule, interpolé linéairement dans la classe qui le contient"""
+        lo, hi = METRIC_RANGES[self.metric]
+        width = (hi - lo) / HISTOGRAM_BINS
+        cumulative = np.cumsum(self.histogram, axis=1)
+        target = q / 100.0 * self.count
+        bins = np.minimum(np.count_nonzero(cumulative < target[:, None], axis=1), HISTOGRAM_BINS - 1)
+        rows = np.arange(len(self))
+        before = np.where(bins > 0, cumulative[rows, bins - 1], 0)
+        fraction = (target - before) / np.maximum(self.histogram[rows, bins], 1)
+        return np.minimum(lo + (bins + fraction) * width, self.maximum)
+
+    def to_columns(self, percentiles: List[float]) -> Dict[str, np.ndarray]:
+        """Colonnes par cellule : centre (x, y), effectif, moyenne, max, centiles"""
+        ix, iy = np.divmod(self.keys, SPAN)
+        columns = {
+            'x': (ix - OFFSET + 0.5) * self.cell_size,
+            'y': (iy - OFFSET + 0.5) * self.cell_size,
+            'count': self.count,
+            'mean': self.total / np.maximum(self.count, 1),
+            'max': self.maximum,
+        }
+        for q in percentiles:
+            columns[f"p{q:g}"] = self.percentile(q)
+        return columns
+
+    def to_cells(self, percentiles: List[float]) -> List[dict]:
+        columns = self.to_columns(percentiles)
+        names = [f"p{q:g}" for q in percentiles]
+        values = [columns[name].tolist() for name in names]
+        return [
+            {"x": x, "y": y, "count": count, "mean": mean, "max": maximum,
+             "percentiles": dict(zip(names, quantiles))}
+            for x, y, count, mean, maximum, *quantiles in zip(
+                columns['x'].tolist(), columns['y'].tolist(), columns['count'].tolist(),
+                columns['mean'].tolist(), columns['max'].tolist(), *values)
+        ]
+
+
+async def session_grid(client, session_id: str, metric: str, cell_size: float) -> HeatmapGrid:
+    """Grille partielle d'une session, gardée dans le store matérialisé une fois la session terminée"""
+    params = (metric, cell_size)
+    grid = materialized.get('heatmap', session_id, params)
+    if grid is not None:
+        return grid
+
+    finished = await is_finished(client, session_id)
+    arrays = await fetch_arrays(client, session_id, metric_columns(metric))
+    if arrays is None:
+        grid = HeatmapGrid.empty(metric, cell_size)
+    else:
+        grid = HeatmapGrid.from_points(metric, cell_size, arrays['uwb_x'], arrays['uwb_y'],
+                                       metric_values(metric, arrays))
+    if finished:
+        materialized.put('heatmap', session_id, grid, params)
+    return grid
+
+
+async def matching_sessions(client, user_id: Optional[str] = None, vehicle_model: Optional[str] = None,
+                            limit: int = MAX_SESSIONS) -> List[str]:
+    """Identifiants des sessions les plus récentes d'un utilisateur et/ou d'un véhicule"""
+    query = client.table('sessions').select('id')
+    if user_id is not None:
+        query = query.eq('user_id', user_id)
+    if vehicle_model is not None:
+        query = query.eq('vehicle_model', vehicle_model)
+    response = await supabase_config.execute(query.order('created_at', desc=True).limit(limit))
+    return [row['id'] for row in response.data or []]
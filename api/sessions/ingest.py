@@ -0,0 +1,140 @@
+import asyncio
+import os
+from typing import Iterator, List
+
+from pydantic import TypeAdapter
+
+from config.database import supabase_config
+from models.session import SensorData, ChunkResult
+from sessions.aggregates import aggregate_store
+from sessions.archive import session_archive
+from sessions.cache import result_cache
+from sessions.laps import lap_trackers
+from sessions.live import live_hub
+from sessions.materialize import materialized
+from sessions.codec import (
+    COLUMNAR_MEDIA_TYPE, MSGPACK_MEDIA_TYPE, CodecError,
+    decode_columns, decode_msgpack, columns_to_rows
+)
+
+# Nombre maximal de lignes acceptées par appel batch
+MAX_BATCH_ROWS = int(os.getenv("SENSOR_BATCH_MAX_ROWS", "10000"))
+# Taille d'un INSERT multi-lignes envoyé à Supabase
+CHUNK_SIZE = int(os.getenv("SENSOR_BATCH_CHUNK_SIZE", "500"))
+
+
+_batch_adapter = TypeAdapter(List[SensorData])
+# Colonnes acceptées dans un lot binaire (session_id vient de l'URL)
+BINARY_COLUMNS = [name for name in SensorData.model_fields if name != 'session_id']
+# Type attendu de chaque colonne binaire : int64 pour timestamp, float32 pour les mesures
+BINARY_KINDS = {name: 'i' if SensorData.model_fields[name].annotation is int else 'f' for name in BINARY_COLUMNS}
+
+
+class UnsupportedMediaType(Exception):
+    """Content-Type de lot non géré"""
+
+
+class BatchTooLarge(Exception):
+    """Lot dépassant MAX_BATCH_ROWS"""
+
+
+def _check_size(n_rows: int):
+    if n_rows > MAX_BATCH_ROWS:
+        raise BatchTooLarge(f"Lot trop grand (max {MAX_BATCH_ROWS} lignes)")
+
+
+def chunked(rows: List[dict], size: int = CHUNK_SIZE) -> Iterator[tuple[int, List[dict]]]:
+    """Découper les lignes en blocs bornés (start, bloc)"""
+    for start in range(0, len(rows), size):
+        yield start, rows[start:start + size]
+
+
+def prepare_rows(session_id: str, batch: List[SensorData]) -> List[dict]:
+    """Forcer le session_id de l'URL et retirer les champs vides"""
+    rows = []
+    for sensor_data in batch:
+        row = sensor_data.model_dump(exclude_none=True)
+        row['session_id'] = session_id
+        rows.append(row)
+    return rows
+
+
+def msgpack_columns_to_rows(payload: dict) -> List[dict]:
+    """{colonne: [valeurs]} MessagePack en lignes ; colonnes de même longueur exigées"""
+    lengths = set()
+    for name, values in payload.items():
+        if not isinstance(values, list):
+            raise CodecError(f"Colonne {name!r} : liste de valeurs attendue")
+        lengths.add(len(values))
+    if len(lengths) > 1:
+        raise CodecError(f"Colonnes de longueurs différentes : {sorted(lengths)}")
+    n_rows = lengths.pop() if lengths else 0
+    _check_size(n_rows)
+    return [dict(zip(payload, values)) for values in zip(*payload.values())]
+
+
+def parse_batch(session_id: str, content_type: str, body: bytes) -> List[dict]:
+    """Décoder un lot selon son Content-Type en lignes prêtes à insérer
+
+    - JSON : liste de SensorData, validée directement depuis les octets
+    - colonnaire : décodé sans copie, types garantis par le format
+    - MessagePack : liste de lignes ou {colonne: [valeurs]}
+    Lève CodecError / ValidationError si le contenu est invalide, BatchTooLarge
+    au-delà de MAX_BATCH_ROWS.
+    """
+    media_type = (content_type or 'application/json').split(';')[0].strip()
+    if media_type == COLUMNAR_MEDIA_TYPE:
+        n_rows, columns = decode_columns(body)
+        _check_size(n_rows)
+        return columns_to_rows(session_id, n_rows, columns, BINARY_KINDS)
+    if media_type == MSGPACK_MEDIA_TYPE:
+        payload = decode_msgpack(body)
+        if isinstance(payload, dict):
+            payload = msgpack_columns_to_rows(payload)
+        if not isinstance(payload, list):
+            raise CodecError("Lot MessagePack invalide")
+        _check_size(len(payload))
+        for row in payload:
+            if isinstance(row, dict):
+                row['session_id'] = session_id
+        return prepare_rows(session_id, _batch_adapter.validate_python(payload))
+    if media_type == 'application/json':
+        batch = _batch_adapter.validate_json(body)
+        _check_size(len(batch))
+        return prepare_rows(session_id, batch)
+    raise UnsupportedMediaType(media_type)
+
+
+async def insert_chunk(client, index: int, start: int, chunk: List[dict]) -> ChunkResult:
+    """Insérer un bloc, l'erreur éventuelle est rapportée plutôt que levée"""
+    try:
+        await supabase_config.execute(client.table('sensor_data').insert(chunk, returning='minimal'))
+        return ChunkResult(index=index, start=start, size=len(chunk), inserted=len(chunk))
+    except Exception as e:
+        return ChunkResult(index=index, start=start, size=len(chunk), inserted=0, error=str(e) or type(e).__name__)
+
+
+async def insert_chunks(client, rows: List[dict], size: int = CHUNK_SIZE) -> List[ChunkResult]:
+    """Insérer les lignes par blocs en parallèle (borné par le pool Supabase),
+    un échec n'interrompt pas les blocs suivants"""
+    return await asyncio.gather(*(
+        insert_chunk(client, index, start, chunk)
+        for index, (start, chunk) in enumerate(chunked(rows, size))
+    ))
+
+
+def on_rows_written(session_id: str, rows: List[dict], publish: bool = True):
+    """Effets de bord d'une écriture réussie : agrégats et tours à jour, direct diffusé,
+    caches de la session invalidés
+
+    `publish=False` quand le direct a déjà reçu les lignes à leur acceptation (spool).
+    """
+    if not rows:
+        return
+    aggregate_store.record(session_id, rows)
+    lap_trackers.record(session_id, rows)
+    if publish:
+        live_hub.publish(session_id, rows)
+    result_cache.invalidate(session_id)
+    materialized.invalidate(session_id)
+    session_archive.invalidate(session_id)
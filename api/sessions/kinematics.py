@@ -0,0 +1,149 @@
+"""Canaux dérivés : vitesse, accélérations longitudinale et latérale, g combiné, lacet
+
+Vitesses et accélérations viennent des positions UWB par différences finies
+sur timestamps irréguliers (np.gradient), lissées par une moyenne glissante
+en temps. Quand l'IMU est présente, ses mesures (imu_ax avant, imu_ay gauche,
+imu_gz) remplacent les valeurs dérivées de l'UWB, plus bruitées.
+Unités : m/s, m/s², g, rad/s.
+"""
+import os
+from typing import AsyncIterator, Dict, List, Optional
+
+import numpy as np
+
+from sessions.trajectory import TRAJECTORY_COLUMNS, Trajectory
+
+KINEMATICS_COLUMNS = TRAJECTORY_COLUMNS + ['imu_ax', 'imu_ay', 'imu_gz']
+DERIVED_CHANNELS = ['speed', 'long_accel', 'lat_accel', 'combined_g', 'yaw_rate']
+
+# Largeur (ms) de la moyenne glissante appliquée aux dérivées
+SMOOTH_MS = float(os.getenv("KINEMATICS_SMOOTH_MS", "200"))
+# En dessous de cette vitesse (m/s) la direction de déplacement n'a pas de sens
+MIN_SPEED = 0.5
+STANDARD_GRAVITY = 9.80665
+
+
+def parse_channels(channels: Optional[str]) -> List[str]:
+    """Liste "speed,lat_accel" -> noms validés ; ValueError si un canal est inconnu"""
+    if not channels:
+        return []
+    names = [name.strip() for name in channels.split(',') if name.strip()]
+    unknown = [name for name in names if name not in DERIVED_CHANNELS]
+    if unknown:
+        raise ValueError(f"Canaux inconnus: {', '.join(unknown)} (disponibles: {', '.join(DERIVED_CHANNELS)})")
+    return list(dict.fromkeys(names))
+
+
+def smooth(t: np.ndarray, values: np.ndarray, width: float) -> np.ndarray:
+    """Moyenne glissante centrée de largeur `width` (mêmes unités que t), NaN ignorés"""
+    if width <= 0 or len(values) == 0:
+        return values
+    present = ~np.isnan(values)
+    sums = np.concatenate(([0.0], np.cumsum(np.where(present, values, 0.0))))
+    counts = np.concatenate(([0], np.cumsum(present)))
+    lo = np.searchsorted(t, t - width / 2, side='left')
+    hi = np.searchsorted(t, t + width / 2, side='right')
+    n = counts[hi] - counts[lo]
+    return np.divide(sums[hi] - sums[lo], n, out=np.full(len(values), np.nan), where=n > 0)
+
+
+def derive(arrays: dict, smooth_ms: float = SMOOTH_MS) -> Dict[str, np.ndarray]:
+    """Tous les canaux dérivés, un par ligne de `arrays` (NaN si indéterminé)"""
+    t = arrays['timestamp'] / 1000.0
+    n = len(t)
+    width = smooth_ms / 1000.0
+    has_fix = ~(np.isnan(arrays['uwb_x']) | np.isnan(arrays['uwb_y']))
+
+    nan = np.full(n, np.nan)
+    vx, vy, ax, ay = nan, nan, nan, nan
+    if np.count_nonzero(has_fix) >= 2:
+        tf = t[has_fix]
+        fvx = smooth(tf, np.gradient(arrays['uwb_x'][has_fix], tf), width)
+        fvy = smooth(tf, np.gradient(arrays['uwb_y'][has_fix], tf), width)
+        fax = smooth(tf, np.gradient(fvx, tf), width)
+        fay = smooth(tf, np.gradient(fvy, tf), width)
+        # Lignes sans fix UWB : interpolation entre les fixes voisins
+        vx, vy = np.interp(t, tf, fvx), np.interp(t, tf, fvy)
+        ax, ay = np.interp(t, tf, fax), np.interp(t, tf, fay)
+
+    speed = np.hypot(vx, vy)
+    moving = speed > MIN_SPEED
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cross = vx * ay - vy * ax
+        uwb_long = np.where(moving, (vx * ax + vy * ay) / speed, np.nan)
+        uwb_lat = np.where(moving, cross / speed, np.nan)
+        uwb_yaw = np.where(moving, cross / (speed * speed), np.nan)
+
+    imu_long = smooth(t, arrays['imu_ax'], width)
+    imu_lat = smooth(t, arrays['imu_ay'], width)
+    imu_yaw = smooth(t, arrays['imu_gz'], width)
+    long_accel = np.where(np.isnan(imu_long), uwb_long, imu_long)
+    lat_accel = np.where(np.isnan(imu_lat), uwb_lat, imu_lat)
+
+    return {
+        'speed': speed,
+        'long_accel': long_accel,
+        'lat_accel': lat_accel,
+        'combined_g': np.hypot(long_accel, lat_accel) / STANDARD_GRAVITY,
+        'yaw_rate': np.where(np.isnan(imu_yaw), uwb_yaw, imu_yaw),
+    }
+
+
+def with_channels(trajectory: Trajectory, arrays: dict) -> Trajectory:
+    """Attacher les canaux dérivés de `arrays` aux points de la trajectoire
+
+    L'alignement se fait par timestamp : la trajectoire peut être brute ou
+    fusionnée, tant que ses points sont des lignes de `arrays`.
+    """
+    derived = derive(arrays)
+    index = np.searchsorted(arrays['timestamp'], trajectory.timestamp)
+    return Trajectory(trajectory.timestamp, trajectory.x, trajectory.y, trajectory.steering_angle,
+                      {name: values[index] for name, values in derived.items()})
+
+
+def _concat(left: Optional[dict], right: dict) -> dict:
+    if left is None:
+        return right
+    return {column: np.concatenate((left[column], right[column])) for column in right}
+
+
+async def derive_pages(pages: AsyncIterator[dict], channels: List[str],
+                       smooth_ms: float = SMOOTH_MS) -> AsyncIterator[List[dict]]:
+    """Points de trajectoire avec canaux, page par page, identiques au calcul sur la session entière
+
+    `pages` produit des tableaux (to_arrays) dans l'ordre des timestamps. Les
+    derniers points d'une page dépendent des premiers de la suivante (dérivées
+    et lissage) : ils sont retenus et émis avec la page suivante, et chaque
+    calcul reprend assez de points déjà émis pour que le lissage soit complet.
+    Le résultat est celui du calcul sur toute la fenêtre tant que les trous
+    UWB restent plus courts que la fenêtre de lissage.
+    """
+    # Les dérivées secondes sont lissées deux fois : une largeur de fenêtre de chaque côté
+    margin = smooth_ms
+    buffer, emitted = None, None
+    async for page in pages:
+        buffer = _concat(buffer, page)
+        t = buffer['timestamp']
+        # Deux échantillons au-delà de la fenêtre pour les différences finies
+        ready = t + margin < (t[-3] if len(t) >= 3 else t[0] - 1)
+        if emitted is not None:
+            ready &= t > emitted
+        if ready.any():
+            rows = _points(buffer, channels, ready, smooth_ms)
+            emitted = int(t[ready][-1])
+            yield rows
+            # Garder le contexte nécessaire aux points pas encore émis, plus deux échantillons
+            pending = np.flatnonzero(t > emitted)
+            start = int(np.searchsorted(t, t[pending[0]] - margin, side='left')) - 3 if len(pending) else len(t) - 3
+            buffer = {column: values[max(start, 0):] for column, values in buffer.items()}
+    if buffer is not None:
+        t = buffer['timestamp']
+        remaining = t > emitted if emitted is not None else np.ones(len(t), dtype=bool)
+        yield _points(buffer, channels, remaining, smooth_ms)
+
+
+def _points(arrays: dict, channels: List[str], mask: np.ndarray, smooth_ms: float) -> List[dict]:
+    derived = derive(arrays, smooth_ms)
+    trajectory = Trajectory.from_arrays({column: values[mask] for column, values in arrays.items()},
+                                        {name: derived[name][mask] for name in channels})
+    return trajectory.to_points()
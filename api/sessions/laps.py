@@ -0,0 +1,177 @@
+import os
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from models.lap import Gate, TrackLayout, LapTime, LapSummary
+from sessions.stats import to_arrays
+
+LAP_COLUMNS = ['timestamp', 'uwb_x', 'uwb_y']
+
+# Deux passages sur une même ligne à moins de MIN_LAP_MS d'écart = bruit UWB
+MIN_LAP_MS = float(os.getenv("LAP_MIN_MS", "5000"))
+# Sessions chronométrées gardées en mémoire ; au-delà, le tracé est à redéclarer
+MAX_SESSIONS = int(os.getenv("LAP_MAX_SESSIONS", "256"))
+
+
+def gate_crossings(gate: Gate, t: np.ndarray, x: np.ndarray, y: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Instants (interpolés) où la trajectoire coupe le segment de la porte, et sens de passage
+
+    Intersection segment/segment vectorisée sur tous les couples de points
+    consécutifs : les extrémités de chaque pas sont de part et d'autre de la
+    droite de la porte, et les extrémités de la porte de part et d'autre du pas.
+    """
+    if len(t) < 2:
+        return np.empty(0), np.empty(0, dtype=np.int8)
+    gx, gy = gate.x2 - gate.x1, gate.y2 - gate.y1
+    side = gx * (y - gate.y1) - gy * (x - gate.x1)
+    d1, d2 = side[:-1], side[1:]
+    straddles = (d1 < 0) != (d2 < 0)
+
+    sx, sy = np.diff(x), np.diff(y)
+    e1 = sx * (gate.y1 - y[:-1]) - sy * (gate.x1 - x[:-1])
+    e2 = sx * (gate.y2 - y[:-1]) - sy * (gate.x2 - x[:-1])
+    within = (e1 < 0) != (e2 < 0)
+
+    idx = np.flatnonzero(straddles & within)
+    fraction = d1[idx] / (d1[idx] - d2[idx])
+    times = t[idx] + fraction * (t[idx + 1] - t[idx])
+    return times, np.sign(d2[idx]).astype(np.int8)
+
+
+class GateTracker:
+    """Passages successifs sur une porte, dans le sens du premier passage"""
+
+    def __init__(self, gate: Gate):
+        self.gate = gate
+        self.direction = 0
+        self.times: List[float] = []
+
+    def add(self, times: np.ndarray, directions: np.ndarray):
+        for time, direction in zip(times.tolist(), directions.tolist()):
+            if not self.direction:
+                self.direction = direction
+            if direction != self.direction:
+                continue
+            if self.times and time - self.times[-1] < MIN_LAP_MS:
+                continue
+            self.times.append(time)
+
+
+class LapTracker:
+    """Chronométrage incrémental d'une session
+
+    Chaque lot de points n'est testé que contre le dernier point déjà vu :
+    le coût d'une ingestion est proportionnel au lot, jamais à la session.
+    """
+
+    def __init__(self, session_id: str, layout: TrackLayout):
+        self.session_id = session_id
+        self.layout = layout
+        self.start_line = GateTracker(layout.start_line)
+        self.sectors = [GateTracker(gate) for gate in layout.sectors]
+        self._last: Optional[tuple[float, float, float]] = None
+
+    def feed_rows(self, rows: List[dict]):
+        if rows:
+            self.feed(to_arrays(rows, LAP_COLUMNS))
+
+    def feed(self, arrays: dict):
+        valid = ~(np.isnan(arrays['uwb_x']) | np.isnan(arrays['uwb_y']))
+        t = arrays['timestamp'][valid].astype(np.float64)
+        x, y = arrays['uwb_x'][valid], arrays['uwb_y'][valid]
+        if self._last is not None:
+            # Les points plus anciens que le dernier vu sont ignorés
+            newer = t > self._last[0]
+            t = np.concatenate(([self._last[0]], t[newer]))
+            x = np.concatenate(([self._last[1]], x[newer]))
+            y = np.concatenate(([self._last[2]], y[newer]))
+        if len(t) == 0:
+            return
+        for tracker in [self.start_line] + self.sectors:
+            tracker.add(*gate_crossings(tracker.gate, t, x, y))
+        self._last = (float(t[-1]), float(x[-1]), float(y[-1]))
+
+    def summary(self) -> LapSummary:
+        starts = self.start_line.times
+        sector_times = [np.asarray(tracker.times) for tracker in self.sectors]
+        laps = []
+        for number, (start, end) in enumerate(zip(starts[:-1], starts[1:]), start=1):
+            splits = None
+            if sector_times:
+                # Premier passage de chaque porte intermédiaire, dans l'ordre, pendant le tour
+                marks, previous = [], start
+                for times in sector_times:
+                    inside = times[(times > previous) & (times < end)]
+                    if len(inside) == 0:
+                        marks = None
+                        break
+                    previous = float(inside[0])
+                    marks.append(previous)
+                if marks is not None:
+                    bounds = [start] + marks + [end]
+                    splits = [b - a for a, b in zip(bounds[:-1], bounds[1:])]
+            laps.append(LapTime(lap=number, start=start, end=end, duration_ms=end - start, sectors=splits))
+        return LapSummary(
+            session_id=self.session_id,
+            laps=laps,
+            best_lap=min(laps, key=lambda lap: lap.duration_ms) if laps else None,
+            current_lap_start=starts[-1] if starts else None
+        )
+
+
+class LapTrackerStore:
+    """Sessions chronométrées en direct (tracé déclaré via PUT /sessions/{id}/track), LRU borné
+
+    Comme pour les agrégats, les lignes ingérées pendant le balayage initial
+    sont gardées de côté puis rejouées sur le nouveau chronométrage.
+    """
+
+    def __init__(self, max_sessions: int = MAX_SESSIONS):
+        self.max_sessions = max_sessions
+        self._trackers: "OrderedDict[str, LapTracker]" = OrderedDict()
+        self._scanning: Dict[str, List[List[dict]]] = {}
+
+    def get(self, session_id: str) -> Optional[LapTracker]:
+        tracker = self._trackers.get(session_id)
+        if tracker is not None:
+            self._trackers.move_to_end(session_id)
+        return tracker
+
+    def put(self, tracker: LapTracker):
+        self._trackers[tracker.session_id] = tracker
+        self._trackers.move_to_end(tracker.session_id)
+        while len(self._trackers) > self.max_sessions:
+            self._trackers.popitem(last=False)
+
+    def record(self, session_id: str, rows: List[dict]):
+        """Appelé par l'ingestion : alimente le chronométrage et les balayages en cours"""
+        for buffer in self._scanning.get(session_id, ()):
+            buffer.extend(rows)
+        tracker = self.get(session_id)
+        if tracker is not None:
+            tracker.feed_rows(rows)
+
+    def begin_scan(self, session_id: str) -> List[dict]:
+        """Tampon des lignes ingérées jusqu'à end_scan, à passer à install"""
+        buffer: List[dict] = []
+        self._scanning.setdefault(session_id, []).append(buffer)
+        return buffer
+
+    def end_scan(self, session_id: str, buffer: List[dict]):
+        buffers = self._scanning.get(session_id)
+        if buffers is None:
+            return
+        buffers[:] = [pending for pending in buffers if pending is not buffer]
+        if not buffers:
+            del self._scanning[session_id]
+
+    def install(self, tracker: LapTracker, buffer: List[dict]):
+        """Installer un chronométrage balayé ; les points déjà vus par le balayage sont ignorés"""
+        if buffer:
+            tracker.feed_rows(sorted(buffer, key=lambda row: row['timestamp']))
+        self.put(tracker)
+
+
+lap_trackers = LapTrackerStore()
@@ -0,0 +1,31 @@
+from config.database import supabase_config
+from sessions.archive import session_archive
+
+# Sessions connues comme terminées : état définitif, jamais retiré
+_finished: set = set()
+
+
+def mark_finished(session_id: str):
+    _finished.add(session_id)
+
+
+async def is_finished(client, session_id: str) -> bool:
+    """Une session est terminée quand `sessions.ended_at` est renseigné
+
+    La colonne vient de migrations/001_sessions_ended_at.sql ; si elle manque
+    ou si la requête échoue, la session est traitée comme en cours.
+    """
+    if session_id in _finished or session_archive.has(session_id):
+        return True
+    if client is None:
+        # Hors ligne : seule l'archive fait foi
+        return False
+    try:
+        response = await supabase_config.execute(client.table('sessions').select('ended_at').eq('id', session_id).limit(1))
+    except Exception as e:
+        print(f"⚠️ État de fin de la session {session_id} inconnu: {e}")
+        return False
+    if response.data and response.data[0].get('ended_at'):
+        mark_finished(session_id)
+        return True
+    return False
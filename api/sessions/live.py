@@ -0,0 +1,308 @@
+"""Diffusion en direct des points d'une session aux spectateurs (WebSocket, SSE)
+
+Les lignes acceptées par l'ingestion sont publiées dans un hub en mémoire,
+sans relecture en base : chaque publication devient un delta de points de
+trajectoire, encodé une seule fois et partagé par tous les abonnés qui le
+reçoivent tel quel. Chaque abonné a une file bornée (en points) : un
+spectateur lent perd les points les plus anciens (drop-oldest) ou reçoit les
+deltas en attente fusionnés et éclaircis (conflate), sans jamais ralentir
+l'ingestion ni les autres spectateurs. Un flux sous-échantillonné garde au
+plus un point par intervalle de temps de la session.
+
+Le hub vit dans la boucle d'événements du worker : publish() est appelé
+depuis les handlers d'ingestion, jamais depuis un thread.
+"""
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, List, Optional, Set
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from config.metrics import registry
+from sessions.streaming import trajectory_rows
+
+# Points en attente au plus par abonné
+LIVE_QUEUE_POINTS = int(os.getenv("LIVE_QUEUE_POINTS", "1024"))
+# Derniers points gardés par session, envoyés à un spectateur qui arrive
+LIVE_BACKLOG_POINTS = int(os.getenv("LIVE_BACKLOG_POINTS", "200"))
+# Historique d'une session sans publication depuis LIVE_IDLE_TTL secondes libéré
+# (session jamais terminée, ou terminée sur un autre worker), et au plus LIVE_MAX_SESSIONS
+LIVE_IDLE_TTL = float(os.getenv("LIVE_IDLE_TTL", "600"))
+LIVE_MAX_SESSIONS = int(os.getenv("LIVE_MAX_SESSIONS", "1024"))
+# Intervalle (s) des messages de maintien de connexion
+LIVE_HEARTBEAT = float(os.getenv("LIVE_HEARTBEAT", "15"))
+POLICIES = ('drop-oldest', 'conflate')
+
+_encode = json.JSONEncoder(separators=(',', ':')).encode
+SSE_MEDIA_TYPE = "text/event-stream"
+
+live_subscribers = registry.gauge("mokart_live_subscribers", "Spectateurs connectés au direct")
+live_points = registry.counter("mokart_live_points_published_total", "Points publiés sur le direct")
+live_dropped = registry.counter("mokart_live_points_dropped_total",
+                                "Points non envoyés à un spectateur trop lent", ("policy",))
+
+
+def thin_points(points: List[dict], interval_ms: Optional[float], previous_ts: Optional[int]) -> List[dict]:
+    """Premier point de chaque intervalle de `interval_ms` (grille ancrée sur t=0)
+
+    Le résultat ne dépend que du delta et du dernier timestamp publié avant
+    lui : tous les abonnés au même intervalle reçoivent le même flux.
+    """
+    if not interval_ms:
+        return points
+    kept = []
+    last = previous_ts // interval_ms if previous_ts is not None else None
+    for point in points:
+        bucket = point['timestamp'] // interval_ms
+        if bucket != last:
+            kept.append(point)
+            last = bucket
+    return kept
+
+
+class Delta:
+    """Points d'une publication, avec encodages mis en cache par intervalle"""
+
+    __slots__ = ('session_id', 'points', 'previous_ts', '_thinned', '_encoded')
+
+    def __init__(self, session_id: str, points: List[dict], previous_ts: Optional[int]):
+        self.session_id = session_id
+        self.points = points
+        self.previous_ts = previous_ts
+        self._thinned: Dict[Optional[float], List[dict]] = {}
+        self._encoded: Dict[Optional[float], str] = {}
+
+    def thinned(self, interval_ms: Optional[float]) -> List[dict]:
+        points = self._thinned.get(interval_ms)
+        if points is None:
+            points = self._thinned[interval_ms] = thin_points(self.points, interval_ms, self.previous_ts)
+        return points
+
+    def encoded(self, interval_ms: Optional[float]) -> str:
+        message = self._encoded.get(interval_ms)
+        if message is None:
+            message = self._encoded[interval_ms] = encode_message(self.session_id, self.thinned(interval_ms), 0)
+        return message
+
+
+def encode_message(session_id: str, points: List[dict], dropped: int) -> str:
+    return _encode({"type": "delta", "session_id": session_id, "points": points, "dropped": dropped})
+
+
+class Subscriber:
+    """File bornée d'un spectateur ; next_message() attend le prochain message à envoyer"""
+
+    def __init__(self, session_id: str, interval_ms: Optional[float] = None, policy: str = 'drop-oldest',
+                 max_points: int = LIVE_QUEUE_POINTS):
+        self.session_id = session_id
+        self.interval_ms = interval_ms
+        self.policy = policy
+        self.max_points = max_points
+        self._pending: Deque[Delta] = deque()
+        self._pending_points = 0
+        self._ready = asyncio.Event()
+        self.dropped = 0
+        self.closed = False
+
+    def push(self, delta: Delta):
+        size = len(delta.thinned(self.interval_ms))
+        if size == 0:
+            return
+        self._pending.append(delta)
+        self._pending_points += size
+        if self._pending_points > self.max_points:
+            if self.policy == 'conflate':
+                # Les deltas en attente deviennent un seul, éclairci à la taille de la file
+                self._pending = deque([Delta(self.session_id, self._drain(), None)])
+                self._pending_points = len(self._pending[0].points)
+            else:
+                # Retirer des deltas entiers tant qu'il en reste un plus récent
+                while self._pending_points > self.max_points and len(self._pending) > 1:
+                    lost = len(self._pending.popleft().thinned(self.interval_ms))
+                    self._pending_points -= lost
+                    self._count_dropped(lost)
+        self._ready.set()
+
+    def close(self):
+        self.closed = True
+        self._ready.set()
+
+    def _count_dropped(self, n: int):
+        if n:
+            self.dropped += n
+            live_dropped.inc(n, policy=self.policy)
+
+    def _drain(self) -> List[dict]:
+        """Vider la file : points en attente, réduits à max_points selon la politique"""
+        points = [point for delta in self._pending for point in delta.thinned(self.interval_ms)]
+        self._pending.clear()
+        self._pending_points = 0
+        if len(points) <= self.max_points:
+            return points
+        if self.policy == 'conflate':
+            # Un point sur k sur toute la durée en attente, le plus récent compris
+            step = -(-len(points) // self.max_points)
+            kept = points[::-1][::step][::-1]
+        else:
+            kept = points[-self.max_points:]
+        self._count_dropped(len(points) - len(kept))
+        return kept
+
+    async def next_message(self, timeout: Optional[float] = None) -> Optional[str]:
+        """Prochain message JSON ; None si la session est close, "" si rien avant `timeout`"""
+        if not self._pending and not self.closed:
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return ""
+        self._ready.clear()
+        if not self._pending:
+            return None if self.closed else ""
+
+        if len(self._pending) == 1 and not self.dropped and self._pending_points <= self.max_points:
+            # Cas courant : le message déjà encodé pour les autres spectateurs
+            delta = self._pending.popleft()
+            self._pending_points = 0
+            return delta.encoded(self.interval_ms)
+
+        points = self._drain()
+        dropped, self.dropped = self.dropped, 0
+        return encode_message(self.session_id, points, dropped)
+
+
+class LiveHub:
+    def __init__(self, backlog_points: int = LIVE_BACKLOG_POINTS, idle_ttl: float = LIVE_IDLE_TTL,
+                 max_sessions: int = LIVE_MAX_SESSIONS):
+        self.backlog_points = backlog_points
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        self._subscribers: Dict[str, Set[Subscriber]] = {}
+        self._backlog: Dict[str, Deque[dict]] = {}
+        self._last_ts: Dict[str, int] = {}
+        # Session -> dernière publication, de la plus ancienne à la plus récente
+        self._published_at: "OrderedDict[str, float]" = OrderedDict()
+
+    def subscribe(self, session_id: str, interval_ms: Optional[float] = None, policy: str = 'drop-oldest',
+                  max_points: int = LIVE_QUEUE_POINTS) -> Subscriber:
+        self._evict(time.monotonic())
+        subscriber = Subscriber(session_id, interval_ms, policy, max_points)
+        self._subscribers.setdefault(session_id, set()).add(subscriber)
+        live_subscribers.inc()
+        backlog = self._backlog.get(session_id)
+        if backlog:
+            subscriber.push(Delta(session_id, list(backlog), None))
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        subscribers = self._subscribers.get(subscriber.session_id)
+        if subscribers is not None and subscriber in subscribers:
+            subscribers.discard(subscriber)
+            live_subscribers.dec()
+            if not subscribers:
+                del self._subscribers[subscriber.session_id]
+
+    def publish(self, session_id: str, rows: List[dict]):
+        """Diffuser des lignes sensor_data écrites : O(abonnés) sans copie des points
+
+        Appelé après une écriture réussie : un échec de diffusion est journalisé,
+        jamais propagé (la requête échouerait alors que les lignes sont stockées).
+        """
+        try:
+            self._publish(session_id, rows)
+        except Exception as e:
+            print(f"⚠️ Diffusion en direct de la session {session_id} impossible: {e}")
+
+    def _publish(self, session_id: str, rows: List[dict]):
+        points = trajectory_rows(rows)
+        if not points:
+            return
+        live_points.inc(len(points))
+        delta = Delta(session_id, points, self._last_ts.get(session_id))
+        self._last_ts[session_id] = points[-1]['timestamp']
+        self._published_at[session_id] = now = time.monotonic()
+        self._published_at.move_to_end(session_id)
+        self._evict(now)
+        if self.backlog_points:
+            backlog = self._backlog.get(session_id)
+            if backlog is None:
+                backlog = self._backlog[session_id] = deque(maxlen=self.backlog_points)
+            backlog.extend(points)
+        for subscriber in self._subscribers.get(session_id, ()):
+            subscriber.push(delta)
+
+    def _evict(self, now: float):
+        """Libérer l'historique des sessions inactives, puis des plus anciennes au-delà de max_sessions"""
+        while self._published_at:
+            session_id, published_at = next(iter(self._published_at.items()))
+            if now - published_at <= self.idle_ttl and len(self._published_at) <= self.max_sessions:
+                break
+            self._forget(session_id)
+
+    def _forget(self, session_id: str):
+        self._backlog.pop(session_id, None)
+        self._last_ts.pop(session_id, None)
+        self._published_at.pop(session_id, None)
+
+    def close(self, session_id: str):
+        """Session terminée : les abonnés reçoivent la fin du flux, l'historique est libéré"""
+        for subscriber in self._subscribers.get(session_id, ()):
+            subscriber.close()
+        self._forget(session_id)
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self._subscribers),
+            "subscribers": sum(len(subscribers) for subscribers in self._subscribers.values()),
+            "backlog_sessions": len(self._backlog),
+        }
+
+
+live_hub = LiveHub()
+
+
+async def sse_events(subscriber: Subscriber):
+    """Flux Server-Sent Events d'un abonné : un évènement `delta` par message, `end` à la fin"""
+    try:
+        while True:
+            message = await subscriber.next_message(LIVE_HEARTBEAT)
+            if message is None:
+                yield b"event: end\ndata: {}\n\n"
+                return
+            if not message:
+                # Commentaire SSE : garde la connexion ouverte à travers les proxys
+                yield b": keep-alive\n\n"
+                continue
+            yield b"event: delta\ndata: " + message.encode() + b"\n\n"
+    finally:
+        live_hub.unsubscribe(subscriber)
+
+
+async def serve_websocket(websocket: WebSocket, subscriber: Subscriber):
+    """Pousser les messages d'un abonné sur un WebSocket jusqu'à la déconnexion ou la fin de session"""
+
+    async def watch():
+        # Le spectateur n'envoie rien : la lecture ne sert qu'à voir la déconnexion
+        try:
+            while (await websocket.receive())['type'] != 'websocket.disconnect':
+                pass
+        finally:
+            subscriber.close()
+
+    watcher = asyncio.create_task(watch())
+    try:
+        while True:
+            message = await subscriber.next_message()
+            if message is None:
+                break
+            await websocket.send_text(message)
+        if not watcher.done():
+            await websocket.send_text(_encode({"type": "end", "session_id": subscriber.session_id}))
+            await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        watcher.cancel()
+        live_hub.unsubscribe(subscriber)
@@ -0,0 +1,86 @@
+from typing import Dict
+
+import numpy as np
+
+# Niveaux de la pyramide LOD : LOD_MIN_POINTS, x2, x4... jusqu'à LOD_MAX_POINTS
+LOD_MIN_POINTS = 256
+LOD_MAX_POINTS = 16384
+
+
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets : indices des points conservés
+
+    Le premier et le dernier point sont toujours gardés ; dans chaque seau on
+    garde le point formant le plus grand triangle avec le point retenu
+    précédent et la moyenne du seau suivant.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    # Moyenne de chaque seau, calculée d'un coup par sommes cumulées
+    cx, cy = np.concatenate(([0.0], np.cumsum(x))), np.concatenate(([0.0], np.cumsum(y)))
+    counts = np.maximum(edges[1:] - edges[:-1], 1)
+    avg_x = (cx[edges[1:]] - cx[edges[:-1]]) / counts
+    avg_y = (cy[edges[1:]] - cy[edges[:-1]]) / counts
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, stop = edges[i], max(edges[i + 1], edges[i] + 1)
+        # Seau suivant : moyenne du seau, ou dernier point pour le dernier seau
+        if i + 1 < len(avg_x):
+            next_x, next_y = avg_x[i + 1], avg_y[i + 1]
+        else:
+            next_x, next_y = x[-1], y[-1]
+        ax, ay = x[a], y[a]
+        area = np.abs((ax - next_x) * (y[start:stop] - ay) - (ax - x[start:stop]) * (next_y - ay))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def rdp(x: np.ndarray, y: np.ndarray, tolerance: float) -> np.ndarray:
+    """Ramer–Douglas–Peucker : indices des sommets à moins de `tolerance` de la forme"""
+    n = len(x)
+    if n < 3:
+        return np.arange(n)
+
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        dx, dy = x[end] - x[start], y[end] - y[start]
+        px, py = x[start + 1:end] - x[start], y[start + 1:end] - y[start]
+        norm = np.hypot(dx, dy)
+        if norm > 0:
+            distances = np.abs(dx * py - dy * px) / norm
+        else:
+            distances = np.hypot(px, py)
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance:
+            index = start + 1 + farthest
+            keep[index] = True
+            stack.append((start, index))
+            stack.append((index, end))
+    return np.flatnonzero(keep)
+
+
+def build_pyramid(x: np.ndarray, y: np.ndarray) -> Dict[int, np.ndarray]:
+    """Niveaux LTTB précalculés, chaque niveau est calculé depuis le suivant plus fin"""
+    levels = {}
+    size = LOD_MIN_POINTS
+    while size < len(x) and size <= LOD_MAX_POINTS:
+        levels[size] = None
+        size *= 2
+
+    base = np.arange(len(x))
+    for size in sorted(levels, reverse=True):
+        levels[size] = base[lttb(x[base], y[base], size)]
+        base = levels[size]
+    return levels
@@ -0,0 +1,40 @@
+import os
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+# Nombre d'objets dérivés (pyramides LOD, index...) gardés en mémoire
+MAX_ENTRIES = int(os.getenv("MATERIALIZED_MAX_ENTRIES", "256"))
+
+
+class MaterializedStore:
+    """Résultats dérivés des sessions terminées, calculés une fois puis réutilisés
+
+    Les clés sont (type, session_id, paramètres). Une session terminée ne reçoit
+    plus de données, les entrées n'expirent donc que par éviction LRU ou par
+    invalidation explicite de la session.
+    """
+
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, Any]" = OrderedDict()
+
+    def get(self, kind: str, session_id: str, params: Hashable = None) -> Optional[Any]:
+        key = (kind, session_id, params)
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+        return value
+
+    def put(self, kind: str, session_id: str, value: Any, params: Hashable = None):
+        key = (kind, session_id, params)
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, session_id: str):
+        for key in [key for key in self._entries if key[1] == session_id]:
+            del self._entries[key]
+
+
+materialized = MaterializedStore()
@@ -0,0 +1,92 @@
+import os
+from typing import AsyncIterator, List, Optional
+
+from config.database import supabase_config
+from models.session import SensorData
+from sessions.archive import session_archive
+from sessions.frame import SessionFrame
+
+# Taille de page par défaut et maximale. MAX_PAGE_SIZE ne doit pas dépasser le
+# max-rows de PostgREST (1000 chez Supabase) : une page tronquée par le serveur
+# serait prise pour la dernière.
+PAGE_SIZE = int(os.getenv("SENSOR_PAGE_SIZE", "1000"))
+MAX_PAGE_SIZE = int(os.getenv("SENSOR_MAX_PAGE_SIZE", "1000"))
+
+# Toutes les colonnes de SensorData, dans l'ordre du modèle
+SENSOR_COLUMNS = list(SensorData.model_fields)
+
+
+def sensor_query(client, session_id: str, columns: List[str], from_ts: Optional[int] = None,
+                 to_ts: Optional[int] = None, after: Optional[int] = None, limit: int = PAGE_SIZE):
+    """Requête sensor_data fenêtrée [from_ts, to_ts], triée par timestamp
+
+    La pagination est par clé (keyset) : `after` est le dernier timestamp déjà
+    reçu. Les timestamps sont supposés uniques au sein d'une session.
+    """
+    if 'timestamp' not in columns:
+        columns = ['timestamp'] + list(columns)
+    query = client.table('sensor_data').select(', '.join(columns)).eq('session_id', session_id)
+    if from_ts is not None:
+        query = query.gte('timestamp', from_ts)
+    if to_ts is not None:
+        query = query.lte('timestamp', to_ts)
+    if after is not None:
+        query = query.gt('timestamp', after)
+    return query.order('timestamp').limit(limit)
+
+
+async def upstream_page(client, session_id: str, columns: List[str], from_ts: Optional[int] = None,
+                        to_ts: Optional[int] = None, cursor: Optional[int] = None,
+                        limit: int = PAGE_SIZE) -> tuple[List[dict], Optional[int]]:
+    """Une page lue dans Supabase, même si la session est archivée localement"""
+    response = await supabase_config.execute(sensor_query(client, session_id, columns, from_ts, to_ts, cursor, limit))
+    rows = response.data or []
+    next_cursor = rows[-1]['timestamp'] if len(rows) == limit else None
+    return rows, next_cursor
+
+
+async def fetch_page(client, session_id: str, columns: List[str], from_ts: Optional[int] = None,
+                     to_ts: Optional[int] = None, cursor: Optional[int] = None,
+                     limit: int = PAGE_SIZE) -> tuple[List[dict], Optional[int]]:
+    """Une page de lignes et le curseur de la suivante (None à la fin)
+
+    Une session copiée dans l'archive locale est lue sur disque.
+    """
+    if session_archive.serves(session_id):
+        return await session_archive.page(session_id, columns, from_ts, to_ts, cursor, limit)
+    return await upstream_page(client, session_id, columns, from_ts, to_ts, cursor, limit)
+
+
+async def iter_pages(client, session_id: str, columns: List[str], from_ts: Optional[int] = None,
+                     to_ts: Optional[int] = None, page_size: int = PAGE_SIZE,
+                     fetch=fetch_page) -> AsyncIterator[List[dict]]:
+    """Parcourir une session de longueur quelconque page par page, en mémoire bornée"""
+    cursor = None
+    while True:
+        rows, cursor = await fetch(client, session_id, columns, from_ts, to_ts, cursor, page_size)
+        if rows:
+            yield rows
+        if cursor is None:
+            return
+
+
+def upstream_pages(client, session_id: str, columns: List[str]) -> AsyncIterator[List[dict]]:
+    """Toute la session lue dans Supabase (copie vers l'archive locale)"""
+    return iter_pages(client, session_id, columns, fetch=upstream_page)
+
+
+async def fetch_arrays(client, session_id: str, columns: List[str], from_ts: Optional[int] = None,
+                       to_ts: Optional[int] = None) -> Optional[SessionFrame]:
+    """Toute la fenêtre en colonnes typées (SessionFrame), None si elle est vide
+
+    Chaque page est convertie dès réception : seules les colonnes typées
+    s'accumulent, jamais la liste complète des dicts. Une session archivée est
+    lue en une seule requête locale, sans passer par des dicts.
+    """
+    if session_archive.serves(session_id):
+        return await session_archive.frame(session_id, columns, from_ts, to_ts)
+    pages = [SessionFrame.from_rows(rows, columns, session_id)
+             async for rows in iter_pages(client, session_id, columns, from_ts, to_ts)]
+    if not pages:
+        return None
+    return SessionFrame.concat(pages)
@@ -1,118 +1,703 @@
-from fastapi import APIRouter, HTTPException
-from config.database import supabase_config
-from models.session import Session, SensorData, TrajectoryPoint
+import asyncio
+from datetime import datetime, timezone
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, WebSocket
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from config.database import supabase_config, UpstreamTimeout
+from config.metrics import span
+from auth.dependencies import check_session_owner, optional_user, session_owner_guard
+from models.auth import AuthUser
+from models.session import Session, SensorData, SensorDataPage, TrajectoryPoint, BatchIngestResult
+from models.lap import TrackLayout, LapSummary
+from models.compare import ComparisonRequest, ComparisonResult
+from models.heatmap import Heatmap
+from sessions.ingest import BINARY_COLUMNS, BatchTooLarge, UnsupportedMediaType, parse_batch, insert_chunks, on_rows_written
+from sessions.codec import COLUMNAR_MEDIA_TYPE, MSGPACK_MEDIA_TYPE, CodecError, negotiate, encode_columns, encode_msgpack
+from sessions.stats import STATS_COLUMNS, compute_stats, to_arrays
+from sessions.paging import PAGE_SIZE, MAX_PAGE_SIZE, SENSOR_COLUMNS, fetch_page, fetch_arrays, iter_pages
+from sessions.streaming import stream_pages, trajectory_rows
+from sessions.aggregates import AGGREGATE_COLUMNS, SessionAggregate, aggregate_store
+from sessions.lifecycle import is_finished, mark_finished
+from sessions.materialize import materialized
+from sessions.cache import CacheEntry, cache_key, encode_json, result_cache
+from sessions.trajectory import TRAJECTORY_COLUMNS, Trajectory, TrajectoryLOD
+from sessions.fusion import FUSION_COLUMNS, fuse
+from sessions.laps import LAP_COLUMNS, LapTracker, lap_trackers
+from sessions.compare import compare_selection, reference_line
+from sessions.tiles import parse_bbox
+from sessions.heatmap import METRICS, HeatmapGrid, matching_sessions, parse_percentiles, session_grid
+from sessions.kinematics import KINEMATICS_COLUMNS, DERIVED_CHANNELS, parse_channels, with_channels, derive_pages
+from sessions.live import SSE_MEDIA_TYPE, live_hub, serve_websocket, sse_events
+from sessions.spool import SpoolFull, ingest_spool
+from sessions.archive import session_archive
+from sessions.export import EXPORT_FORMATS, export_frames, make_exporter, parse_columns, parse_sessions, stream_export
 
 router = APIRouter(prefix="/sessions", tags=["sessions"])
 
+def read_client():
+    """Client Supabase des lectures sensor_data ; None hors ligne (archive locale seule)"""
+    client = supabase_config.get_client()
+    if not client and not supabase_config.offline:
+        raise HTTPException(status_code=500, detail="Supabase non connecté")
+    return client
+
+def columns_response(columns: dict, wire: str, headers: Optional[dict] = None) -> Response:
+    """Réponse binaire (colonnaire ou MessagePack) négociée via Accept"""
+    with span("sérialisation"):
+        content = encode_columns(columns) if wire == COLUMNAR_MEDIA_TYPE else encode_msgpack(columns)
+    return Response(content=content, media_type=wire, headers=headers)
+
+def heatmap_response(request: Request, grid: HeatmapGrid, session_ids: list[str], percentiles: Optional[str]):
+    """Cellules de la carte en JSON, ou en colonnes binaires selon Accept"""
+    try:
+        quantiles = parse_percentiles(percentiles)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    wire = negotiate(request.headers.get('accept'))
+    if wire is not None:
+        return columns_response(grid.to_columns(quantiles), wire)
+    return Heatmap(metric=grid.metric, cell_size=grid.cell_size, sessions=session_ids, cells=grid.to_cells(quantiles))
+
+def encode_trajectory(trajectory: Trajectory, wire: Optional[str]) -> tuple[bytes, str]:
+    """Corps et type de la réponse trajectoire selon le format négocié"""
+    with span("sérialisation"):
+        if wire is None:
+            return encode_json(trajectory.to_points()), "application/json"
+        columns = trajectory.to_columns()
+        return (encode_columns(columns) if wire == COLUMNAR_MEDIA_TYPE else encode_msgpack(columns)), wire
+
 @router.get("/", response_model=list[Session])
-async def get_sessions():
-    """Récupérer toutes les sessions"""
+async def get_sessions(user: Optional[AuthUser] = Depends(optional_user)):
+    """Récupérer les sessions (celles de l'utilisateur si un token Bearer est fourni)"""
     client = supabase_config.get_client()
     if not client:
         raise HTTPException(status_code=500, detail="Supabase non connecté")
 
     try:
-        response = client.table('sessions').select('*').execute()
+        query = client.table('sessions').select('*')
+        if user is not None:
+            query = query.eq('user_id', user.id)
+        response = await supabase_config.execute(query)
         return response.data or []
+    except HTTPException:
+        raise
+    except UpstreamTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/cache")
+async def get_cache_stats():
+    """Compteurs du cache de réponses (hits, misses, évictions)"""
+    return result_cache.stats()
+
+@router.post("/compare", response_model=ComparisonResult)
+async def compare_sessions(comparison: ComparisonRequest, user: Optional[AuthUser] = Depends(optional_user)):
+    """Comparer des trajectoires (sessions, tours ou fenêtres) à une référence
+
+    Pour chaque point : distance le long de la référence, écart latéral signé
+    et delta de temps cumulé. `lap` vaut un numéro de tour ou "best" et
+    suppose un tracé déclaré (PUT /sessions/{id}/track).
+    """
+    client = read_client()
+    if not comparison.sessions:
+        raise HTTPException(status_code=400, detail="Aucune trajectoire à comparer")
+    await check_session_owner([comparison.reference.session_id] + [selection.session_id for selection in comparison.sessions], user)
+
+    try:
+        reference = await reference_line(client, comparison.reference)
+        comparisons = await asyncio.gather(*[
+            compare_selection(client, reference, selection, comparison.max_points)
+            for selection in comparison.sessions
+        ])
+        return ComparisonResult(reference=comparison.reference, reference_length=reference.length, comparisons=comparisons)
+    except HTTPException:
+        raise
+    except UpstreamTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/{session_id}/stats")
-async def get_session_stats(session_id: str):
-    """Récupérer les statistiques d'une session"""
+@router.get("/heatmap", response_model=Heatmap)
+async def get_heatmap(
+    request: Request,
+    metric: Literal[tuple(METRICS)] = Query("speed", description="Métrique agrégée par cellule"),
+    cell_size: float = Query(1.0, ge=0.1, le=100, description="Côté des cellules (mètres)"),
+    user_id: Optional[str] = Query(None, description="Sessions de cet utilisateur"),
+    vehicle_model: Optional[str] = Query(None, description="Sessions de ce véhicule"),
+    percentiles: Optional[str] = Query(None, description="Centiles séparés par des virgules (défaut 50,90)"),
+    user: Optional[AuthUser] = Depends(optional_user)
+):
+    """Carte de chaleur multi-sessions, fusionnée à partir des grilles partielles de chaque session
+
+    Sans user_id ni vehicle_model, ce sont les sessions de l'utilisateur du token Bearer.
+    """
     client = supabase_config.get_client()
     if not client:
         raise HTTPException(status_code=500, detail="Supabase non connecté")
+    if user_id is None and vehicle_model is None and user is not None:
+        user_id = user.id
+    if user_id is None and vehicle_model is None:
+        raise HTTPException(status_code=400, detail="Préciser user_id et/ou vehicle_model")
 
     try:
-        # Récupérer tous les points de la session
-        response = client.table('sensor_data').select('*').eq('session_id', session_id).execute()
+        session_ids = await matching_sessions(client, user_id, vehicle_model)
+        grids = await asyncio.gather(*[session_grid(client, session_id, metric, cell_size) for session_id in session_ids])
+        return heatmap_response(request, HeatmapGrid.merge(grids, metric, cell_size), session_ids, percentiles)
+    except HTTPException:
+        raise
+    except UpstreamTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
-        if not response.data:
+@router.get("/export")
+async def export_sessions(
+    sessions: str = Query(..., description="Identifiants de sessions séparés par des virgules"),
+    format: Literal[tuple(EXPORT_FORMATS)] = Query("csv", description="CSV, Parquet ou flux Arrow IPC"),
+    columns: Optional[str] = Query(None, description="Colonnes exportées séparées par des virgules (défaut : toutes)"),
+    compression: Optional[str] = Query(None, description='Codec ("gzip", "zstd"...), ou "zstd,uwb_x:snappy" par colonne en Parquet'),
+    from_ts: Optional[int] = Query(None, description="Début de fenêtre (inclus)"),
+    to_ts: Optional[int] = Query(None, description="Fin de fenêtre (incluse)"),
+    user: Optional[AuthUser] = Depends(optional_user)
+):
+    """Exporter sensor_data d'une ou plusieurs sessions en un fichier, streamé en mémoire bornée
+
+    Les sessions se suivent dans l'ordre demandé, chacune triée par timestamp ;
+    les pages des sessions suivantes sont récupérées en parallèle.
+    """
+    client = read_client()
+
+    try:
+        try:
+            session_ids = parse_sessions(sessions)
+            exporter = make_exporter(format, parse_columns(columns), compression)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        await check_session_owner(session_ids, user)
+        frames = export_frames(client, session_ids, exporter.columns, from_ts, to_ts)
+        filename = session_ids[0] if len(session_ids) == 1 else "mokart-export"
+        return await stream_export(frames, exporter, filename)
+    except HTTPException:
+        raise
+    except UpstreamTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/{session_id}/heatmap", response_model=Heatmap, dependencies=[Depends(session_owner_guard)])
+async def get_session_heatmap(
+    session_id: str,
+    request: Request,
+    metric: Literal[tuple(METRICS)] = Query("speed", description="Métrique agrégée par cellule"),
+    cell_size: float = Query(1.0, ge=0.1, le=100, description="Côté des cellules (mètres)"),
+    percentiles: Optional[str] = Query(None, description="Centiles séparés par des virgules (défaut 50,90)")
+):
+    """Carte de chaleur d'une session : effectif, moyenne, max et centiles par cellule"""
+    client = read_client()
+
+    try:
+        grid = await session_grid(client, session_id, metric, cell_size)
+        if not len(grid):
+            raise HTTPException(status_code=404, detail="Session non trouvée")
+        return heatmap_response(request, grid, [session_id], percentiles)
+    except HTTPException:
+        raise
+    except UpstreamTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/{session_id}/stats", dependencies=[Depends(session_owner_guard)])
+async def get_session_stats(session_id: str, request: Request):
+    """Récupérer les statistiques d'une session (ETag, 304 si inchangées)"""
+    client = read_client()
+
+    try:
+        key = cache_key(request, session_id)
+        entry = result_cache.get(key)
+        if entry is not None:
+            return entry.respond(request)
+
+        # Récupérer uniquement les colonnes utiles au calcul, page par page
+        arrays = await fetch_arrays(client, session_id, STATS_COLUMNS)
+
+        if arrays is None:
+            raise HTTPException(status_code=404, detail="Session non trouvée")
+
+        # Calculer les statistiques en une passe vectorisée
+        stats = compute_stats(session_id, arrays)
+
+        finished = await is_finished(client, session_id)
+        with span("sérialisation"):
+            body = encode_json(stats)
+        entry = CacheEntry(session_id, body, "application/json", finished)
+        return result_cache.put(key, entry).respond(request)
+    except HTTPException:
+        raise
+    except UpstreamTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def rebuild_aggregates(client, session_id: str) -> SessionAggregate:
+    """Recalculer les agrégats courants depuis sensor_data"""
+    buffer = aggregate_store.begin_rebuild(session_id)
+    try:
+        arrays = await fetch_arrays(client, session_id, AGGREGATE_COLUMNS)
+        if arrays is None:
             raise HTTPException(status_code=404, detail="Session non trouvée")
+        return aggregate_store.rebuild(session_id, arrays, buffer)
+    finally:
+        aggregate_store.end_rebuild(session_id, buffer)
+
+@router.get("/{session_id}/stats/live", dependencies=[Depends(session_owner_guard)])
+async def get_session_live_stats(session_id: str):
+    """Statistiques courantes en O(1), maintenues par l'ingestion"""
+    client = read_client()
+
+    try:
+        aggregate = aggregate_store.get(session_id)
+        # Une session créée sur ce worker a un agrégat vide : statistiques à zéro, sans relecture
+        if aggregate is None:
+            aggregate = await rebuild_aggregates(client, session_id)
+        return aggregate.to_stats()
+    except HTTPException:
+        raise
+    except UpstreamTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/{session_id}/stats/rebuild", dependencies=[Depends(session_owner_guard)])
+async def rebuild_session_stats(session_id: str):
+    """Reconstruire les agrégats courants depuis les données brutes"""
+    client = read_client()
+
+    try:
+        aggregate = await rebuild_aggregates(client, session_id)
+        return aggregate.to_stats()
+    except HTTPException:
+        raise
+    except UpstreamTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/{session_id}/trajectory", response_model=list[TrajectoryPoint], dependencies=[Depends(session_owner_guard)])
+async def get_session_trajectory(
+    session_id: str,
+    request: Request,
+    from_ts: Optional[int] = Query(None, description="Début de fenêtre (inclus)"),
+    to_ts: Optional[int] = Query(None, description="Fin de fenêtre (incluse)"),
+    cursor: Optional[int] = Query(None, description="Dernier timestamp reçu (en-tête X-Next-Cursor)"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Taille de page"),
+    max_points: Optional[int] = Query(None, ge=3, description="Sous-échantillonnage LTTB à N points"),
+    tolerance: Optional[float] = Query(None, gt=0, description="Simplification Douglas-Peucker (mètres)"),
+    fused: bool = Query(False, description="Trajectoire fusionnée IMU+UWB, lissée et sans trous"),
+    channels: Optional[str] = Query(None, description=f"Canaux dérivés séparés par des virgules ({', '.join(DERIVED_CHANNELS)})"),
+    bbox: Optional[str] = Query(None, description="Fenêtre d'affichage min_x,min_y,max_x,max_y (mètres)")
+):
+    """Récupérer la trajectoire d'une session, triée par timestamp
+
+    Avec `limit` ou `cursor`, une seule page est renvoyée et le curseur de la
+    suivante est dans l'en-tête `X-Next-Cursor`. Sinon toute la fenêtre est
+    renvoyée, éventuellement simplifiée. `Accept: application/vnd.mokart.columnar`
+    ou `application/msgpack` renvoie des colonnes binaires au lieu du JSON.
+    Avec `fused=true`, la fenêtre est filtrée (Kalman + RTS) et n'est pas paginée.
+    `channels` ajoute des canaux dérivés à chaque point ; pour une session
+    terminée ils sont calculés une fois sur toute la session.
+    `bbox` ne renvoie que les points du rectangle visible : pleine résolution
+    si `max_points` le permet, sinon un niveau de la pyramide LOD. Pour une
+    session terminée la requête passe par un index de tuiles.
+    """
+    client = read_client()
+
+    try:
+        wire = negotiate(request.headers.get('accept'))
+        key = cache_key(request, session_id, wire or '')
+        entry = result_cache.get(key)
+        if entry is not None:
+            return entry.respond(request)
+
+        try:
+            selected = parse_channels(channels)
+            viewport = parse_bbox(bbox)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        downsampling = max_points is not None or tolerance is not None
+        paging = limit is not None or cursor is not None
+        if viewport is not None and paging:
+            raise HTTPException(status_code=400, detail="bbox ne se combine pas avec limit/cursor")
+        if fused and paging:
+            raise HTTPException(status_code=400, detail="La trajectoire fusionnée se fenêtre avec from_ts/to_ts, sans limit/cursor")
+
+        finished = await is_finished(client, session_id)
+        headers = {}
+
+        if not downsampling and paging:
+            columns = KINEMATICS_COLUMNS if selected else TRAJECTORY_COLUMNS
+            rows, next_cursor = await fetch_page(client, session_id, columns, from_ts, to_ts, cursor, limit or PAGE_SIZE)
+            if next_cursor is not None:
+                headers["X-Next-Cursor"] = str(next_cursor)
+            if selected:
+                # Canaux calculés sur la page seule : les bords de page sont moins lissés
+                arrays = to_arrays(rows, columns)
+                trajectory = with_channels(Trajectory.from_arrays(arrays), arrays)
+            else:
+                trajectory = Trajectory.from_rows(rows)
+        else:
+            kind = ('lod-fused' if fused else 'lod') + ('-kinematics' if selected else '')
+            lod = materialized.get(kind, session_id) if finished else None
+            if lod is None:
+                # Session terminée : on charge tout une fois pour la pyramide, puis on fenêtre en mémoire
+                window = (None, None) if finished else (from_ts, to_ts)
+                columns = FUSION_COLUMNS if fused else KINEMATICS_COLUMNS if selected else TRAJECTORY_COLUMNS
+                arrays = await fetch_arrays(client, session_id, columns, *window)
+
+                if arrays is None:
+                    raise HTTPException(status_code=404, detail="Session non trouvée")
+
+                trajectory = (fuse(arrays) if fused else None) or Trajectory.from_arrays(arrays)
+                if selected:
+                    trajectory = with_channels(trajectory, arrays)
+                lod = TrajectoryLOD(trajectory, pyramid=finished)
+                if finished:
+                    materialized.put(kind, session_id, lod)
+                    trajectory = lod.downsample(max_points, tolerance, from_ts, to_ts, viewport)
+                else:
+                    trajectory = lod.downsample(max_points, tolerance, bbox=viewport)
+            else:
+                trajectory = lod.downsample(max_points, tolerance, from_ts, to_ts, viewport)
+
+        if selected:
+            trajectory = trajectory.select(selected)
+        body, media_type = encode_trajectory(trajectory, wire)
+        entry = CacheEntry(session_id, body, media_type, finished, headers)
+        return result_cache.put(key, entry).respond(request)
+    except HTTPException:
+        raise
+    except UpstreamTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/{session_id}/sensor-data", response_model=SensorDataPage, dependencies=[Depends(session_owner_guard)])
+async def get_sensor_data(
+    session_id: str,
+    request: Request,
+    from_ts: Optional[int] = Query(None, description="Début de fenêtre (inclus)"),
+    to_ts: Optional[int] = Query(None, description="Fin de fenêtre (incluse)"),
+    cursor: Optional[int] = Query(None, description="Dernier timestamp reçu (next_cursor)"),
+    limit: int = Query(PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE, description="Taille de page")
+):
+    """Récupérer une page de données brutes, triée par timestamp (JSON ou binaire selon Accept)"""
+    client = read_client()
+
+    try:
+        rows, next_cursor = await fetch_page(client, session_id, SENSOR_COLUMNS, from_ts, to_ts, cursor, limit)
+        wire = negotiate(request.headers.get('accept'))
+        if wire is not None:
+            headers = {"X-Next-Cursor": str(next_cursor)} if next_cursor is not None else None
+            return columns_response(to_arrays(rows, BINARY_COLUMNS), wire, headers)
+        return SensorDataPage(data=rows, next_cursor=next_cursor)
+    except HTTPException:
+        raise
+    except UpstreamTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/{session_id}/trajectory/stream", dependencies=[Depends(session_owner_guard)])
+async def stream_session_trajectory(
+    session_id: str,
+    from_ts: Optional[int] = Query(None, description="Début de fenêtre (inclus)"),
+    to_ts: Optional[int] = Query(None, description="Fin de fenêtre (incluse)"),
+    format: Literal["ndjson", "json"] = Query("ndjson", description="NDJSON ou tableau JSON en chunks"),
+    channels: Optional[str] = Query(None, description=f"Canaux dérivés séparés par des virgules ({', '.join(DERIVED_CHANNELS)})")
+):
+    """Trajectoire streamée au fil des pages, sans validation pydantic par point
+
+    Avec `channels`, les canaux dérivés sont calculés au fil des pages avec
+    le contexte des pages voisines, comme sur la fenêtre entière.
+    """
+    client = read_client()
+
+    try:
+        try:
+            selected = parse_channels(channels)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if selected:
+            pages = iter_pages(client, session_id, KINEMATICS_COLUMNS, from_ts, to_ts)
+            arrays = (to_arrays(rows, KINEMATICS_COLUMNS) async for rows in pages)
+            return await stream_pages(derive_pages(arrays, selected), format)
+        pages = iter_pages(client, session_id, TRAJECTORY_COLUMNS, from_ts, to_ts)
+        return await stream_pages(pages, format, transform=trajectory_rows)
+    except HTTPException:
+        raise
+    except UpstreamTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/{session_id}/sensor-data/stream", dependencies=[Depends(session_owner_guard)])
+async def stream_sensor_data(
+    session_id: str,
+    from_ts: Optional[int] = Query(None, description="Début de fenêtre (inclus)"),
+    to_ts: Optional[int] = Query(None, description="Fin de fenêtre (incluse)"),
+    format: Literal["ndjson", "json"] = Query("ndjson", description="NDJSON ou tableau JSON en chunks")
+):
+    """Données brutes streamées au fil des pages, triées par timestamp"""
+    client = read_client()
+
+    try:
+        pages = iter_pages(client, session_id, SENSOR_COLUMNS, from_ts, to_ts)
+        return await stream_pages(pages, format)
+    except HTTPException:
+        raise
+    except UpstreamTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+LivePolicy = Literal["drop-oldest", "conflate"]
 
-        data = response.data
+async def live_subscriber(session_id: str, interval_ms: Optional[float], policy: str):
+    """Abonné au direct ; une session déjà terminée donne tout de suite la fin du flux"""
+    finished = await is_finished(supabase_config.get_client(), session_id)
+    subscriber = live_hub.subscribe(session_id, interval_ms, policy)
+    if finished:
+        subscriber.close()
+    return subscriber
 
-        # Calculer les statistiques
-        stats = {
-            "session_id": session_id,
-            "total_points": len(data),
-            "duration_ms": data[-1]['timestamp'] - data[0]['timestamp'] if len(data) > 1 else 0,
-            "uwb_coverage": len([d for d in data if d['uwb_x'] is not None]) / len(data) * 100,
-            "imu_coverage": len([d for d in data if d['imu_ax'] is not None]) / len(data) * 100,
-            "steering_coverage": len([d for d in data if d['steering_angle'] is not None]) / len(data) * 100,
-            "bounds": {
-                "min_x": min(d['uwb_x'] for d in data if d['uwb_x'] is not None),
-                "max_x": max(d['uwb_x'] for d in data if d['uwb_x'] is not None),
-                "min_y": min(d['uwb_y'] for d in data if d['uwb_y'] is not None),
-                "max_y": max(d['uwb_y'] for d in data if d['uwb_y'] is not None)
-            }
-        }
+@router.get("/{session_id}/live", dependencies=[Depends(session_owner_guard)])
+async def live_session_events(
+    session_id: str,
+    interval_ms: Optional[float] = Query(None, gt=0, description="Au plus un point par intervalle (ms de session)"),
+    policy: LivePolicy = Query("drop-oldest", description="Spectateur lent : perdre les plus anciens ou fusionner en éclaircissant")
+):
+    """Direct d'une session en Server-Sent Events : nouveaux points au fil de l'ingestion
 
-        return stats
+    Les points ne sont pas relus en base : ils viennent du hub alimenté par
+    l'ingestion de ce worker, précédés des derniers points reçus. Seul l'état
+    de fin de session est consulté, pour terminer aussitôt le flux d'une
+    session déjà close.
+    """
+    subscriber = await live_subscriber(session_id, interval_ms, policy)
+    return StreamingResponse(sse_events(subscriber), media_type=SSE_MEDIA_TYPE,
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@router.websocket("/{session_id}/live/ws", dependencies=[Depends(session_owner_guard)])
+async def live_session_websocket(
+    websocket: WebSocket,
+    session_id: str,
+    interval_ms: Optional[float] = Query(None, gt=0),
+    policy: LivePolicy = Query("drop-oldest")
+):
+    """Direct d'une session sur WebSocket : mêmes messages JSON que /live"""
+    await websocket.accept()
+    await serve_websocket(websocket, await live_subscriber(session_id, interval_ms, policy))
+
+async def scan_laps(client, session_id: str, layout: TrackLayout) -> LapTracker:
+    """Chronométrer toute la session existante"""
+    tracker = LapTracker(session_id, layout)
+    async for rows in iter_pages(client, session_id, LAP_COLUMNS):
+        tracker.feed_rows(rows)
+    return tracker
+
+@router.put("/{session_id}/track", response_model=LapSummary, dependencies=[Depends(session_owner_guard)])
+async def set_session_track(session_id: str, layout: TrackLayout):
+    """Déclarer la ligne de départ/arrivée et les secteurs : les tours sont ensuite suivis à l'ingestion"""
+    client = read_client()
+
+    buffer = lap_trackers.begin_scan(session_id)
+    try:
+        tracker = await scan_laps(client, session_id, layout)
+        lap_trackers.install(tracker, buffer)
+        return tracker.summary()
+    except HTTPException:
+        raise
+    except UpstreamTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        lap_trackers.end_scan(session_id, buffer)
+
+@router.get("/{session_id}/laps", response_model=LapSummary, dependencies=[Depends(session_owner_guard)])
+async def get_session_laps(session_id: str):
+    """Temps au tour, secteurs et meilleur tour, maintenus en direct"""
+    tracker = lap_trackers.get(session_id)
+    if tracker is None:
+        raise HTTPException(status_code=404, detail="Aucun tracé déclaré pour cette session (PUT /track)")
+    return tracker.summary()
+
+@router.post("/{session_id}/laps", response_model=LapSummary, dependencies=[Depends(session_owner_guard)])
+async def compute_session_laps(session_id: str, layout: TrackLayout):
+    """Chronométrer une session avec un tracé donné, sans l'enregistrer"""
+    client = read_client()
+
+    try:
+        tracker = await scan_laps(client, session_id, layout)
+        return tracker.summary()
+    except HTTPException:
+        raise
+    except UpstreamTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/{session_id}/trajectory", response_model=list[TrajectoryPoint])
-async def get_session_trajectory(session_id: str):
-    """Récupérer la trajectoire d'une session"""
+@router.post("/{session_id}/finish", response_model=Session, dependencies=[Depends(session_owner_guard)])
+async def finish_session(session_id: str):
+    """Marquer une session comme terminée : ses données ne changeront plus"""
     client = supabase_config.get_client()
     if not client:
         raise HTTPException(status_code=500, detail="Supabase non connecté")
 
     try:
-        # Récupérer les données UWB de la session
-        response = client.table('sensor_data').select('timestamp, uwb_x, uwb_y, steering_angle').eq('session_id', session_id).execute()
-
+        ended_at = datetime.now(timezone.utc).isoformat()
+        response = await supabase_config.execute(client.table('sessions').update({"ended_at": ended_at}).eq('id', session_id))
         if not response.data:
             raise HTTPException(status_code=404, detail="Session non trouvée")
-
-        # Filtrer les points valides et convertir en TrajectoryPoint
-        trajectory = []
-        for point in response.data:
-            if point['uwb_x'] is not None and point['uwb_y'] is not None:
-                trajectory.append(TrajectoryPoint(
-                    x=point['uwb_x'],
-                    y=point['uwb_y'],
-                    timestamp=point['timestamp'],
-                    steering_angle=point.get('steering_angle')
-                ))
-
-        return trajectory
+        mark_finished(session_id)
+        live_hub.close(session_id)
+        session_archive.schedule(session_id)
+        # Les réponses en cache portaient un Cache-Control de session en cours
+        result_cache.invalidate(session_id)
+        return response.data[0]
+    except HTTPException:
+        raise
+    except UpstreamTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.post("/", response_model=Session)
-async def create_session(session: Session):
-    """Créer une nouvelle session"""
+async def create_session(session: Session, user: Optional[AuthUser] = Depends(optional_user)):
+    """Créer une nouvelle session (rattachée à l'utilisateur du token Bearer s'il y en a un)"""
     client = supabase_config.get_client()
     if not client:
         raise HTTPException(status_code=500, detail="Supabase non connecté")
 
     try:
-        response = client.table('sessions').insert(session.model_dump(exclude_none=True)).execute()
+        if user is not None:
+            session.user_id = user.id
+        response = await supabase_config.execute(client.table('sessions').insert(session.model_dump(exclude_none=True)))
         if response.data:
+            # Session neuve : ses agrégats sont vides et exacts dès maintenant
+            if response.data[0].get('id'):
+                aggregate_store.put(SessionAggregate(response.data[0]['id']))
             return response.data[0]
         else:
             raise HTTPException(status_code=400, detail="Erreur lors de la création de la session")
+    except HTTPException:
+        raise
+    except UpstreamTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.post("/{session_id}/sensor-data", response_model=SensorData)
-async def add_sensor_data(session_id: str, sensor_data: SensorData):
-    """Ajouter des données de capteur à une session"""
+async def spool_rows(session_id: str, rows: list[dict], response: Response):
+    """Ajouter au spool durable et diffuser en direct ; 202, l'insertion se fait en fond"""
+    try:
+        await ingest_spool.append(session_id, rows)
+    except SpoolFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except OSError as e:
+        raise HTTPException(status_code=503, detail=f"Spool indisponible: {e}")
+    live_hub.publish(session_id, rows)
+    response.status_code = 202
+
+@router.post("/{session_id}/sensor-data", response_model=SensorData, dependencies=[Depends(session_owner_guard)])
+async def add_sensor_data(session_id: str, sensor_data: SensorData, response: Response):
+    """Ajouter des données de capteur à une session
+
+    Avec le spool activé (INGEST_SPOOL_DIR), la ligne est acquittée (202) dès
+    qu'elle est sur disque et insérée en fond.
+    """
+    # S'assurer que le session_id correspond
+    sensor_data.session_id = session_id
+    if ingest_spool.enabled:
+        row = sensor_data.model_dump(exclude_none=True)
+        await spool_rows(session_id, [row], response)
+        return row
+
     client = supabase_config.get_client()
     if not client:
         raise HTTPException(status_code=500, detail="Supabase non connecté")
 
     try:
-        # S'assurer que le session_id correspond
-        sensor_data.session_id = session_id
-        
-        response = client.table('sensor_data').insert(sensor_data.model_dump(exclude_none=True)).execute()
-        if response.data:
-            return response.data[0]
+        result = await supabase_config.execute(client.table('sensor_data').insert(sensor_data.model_dump(exclude_none=True)))
+        if result.data:
+            on_rows_written(session_id, result.data)
+            return result.data[0]
         else:
             raise HTTPException(status_code=400, detail="Erreur lors de l'ajout des données")
+    except HTTPException:
+        raise
+    except UpstreamTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.post(
+    "/{session_id}/sensor-data/batch",
+    response_model=BatchIngestResult,
+    dependencies=[Depends(session_owner_guard)],
+    openapi_extra={"requestBody": {"required": True, "content": {
+        "application/json": {"schema": {"type": "array", "items": {"$ref": "#/components/schemas/SensorData"}}},
+        COLUMNAR_MEDIA_TYPE: {"schema": {"type": "string", "format": "binary"}},
+        MSGPACK_MEDIA_TYPE: {"schema": {"type": "string", "format": "binary"}},
+    }}}
+)
+async def add_sensor_data_batch(session_id: str, request: Request, response: Response):
+    """Ajouter un lot de données de capteur, inséré par blocs multi-lignes
+
+    Le corps est du JSON, du colonnaire binaire ou du MessagePack selon le Content-Type.
+    Avec le spool activé, le lot est acquitté (202, `spooled`) dès qu'il est sur disque.
+    """
+    client = None
+    if not ingest_spool.enabled:
+        client = supabase_config.get_client()
+        if not client:
+            raise HTTPException(status_code=500, detail="Supabase non connecté")
+
+    try:
+        body = await request.body()
+        with span("validation"):
+            rows = parse_batch(session_id, request.headers.get('content-type'), body)
+    except UnsupportedMediaType as e:
+        raise HTTPException(status_code=415, detail=f"Content-Type non supporté: {e}")
+    except BatchTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False, include_context=False))
+    except (CodecError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Lot invalide: {e}")
+
+    if not rows:
+        raise HTTPException(status_code=400, detail="Lot vide")
+    if ingest_spool.enabled:
+        await spool_rows(session_id, rows, response)
+        return BatchIngestResult(session_id=session_id, received=len(rows), inserted=0, failed=0,
+                                 spooled=len(rows), chunks=[])
+    chunks = await insert_chunks(client, rows)
+    inserted = sum(chunk.inserted for chunk in chunks)
+    on_rows_written(session_id, [
+        row for chunk in chunks if not chunk.error
+        for row in rows[chunk.start:chunk.start + chunk.size]
+    ])
+
+    # 207 si une partie des blocs a échoué, le détail est dans `chunks`
+    if inserted < len(rows):
+        response.status_code = 207 if inserted else 502
+
+    return BatchIngestResult(
+        session_id=session_id,
+        received=len(rows),
+        inserted=inserted,
+        failed=len(rows) - inserted,
+        chunks=chunks
+    )
@@ -0,0 +1,553 @@
+"""Spool d'ingestion durable : accusé de réception local, insertion Supabase en fond
+
+Activé par INGEST_SPOOL_DIR. Les lignes acceptées sont ajoutées à un journal
+en ajout seul (segments `segment-<seq>.log`) et la requête est acquittée dès
+que l'enregistrement est sur disque ; Supabase lent ou injoignable ne bloque
+plus le kart. Un flusher en tâche de fond regroupe les enregistrements par
+session en INSERT d'au plus CHUNK_SIZE lignes, dès SPOOL_BATCH_ROWS lignes en
+attente ou SPOOL_FLUSH_INTERVAL secondes, et réessaie les échecs avec un
+backoff exponentiel. Un refus du contenu lui-même (contrainte, type, colonne
+inconnue...) ou SPOOL_MAX_ATTEMPTS échecs envoient l'enregistrement dans
+`dead-letter.log` : un lot rejeté ne bloque pas le spool. Une clé refusée
+(expirée, droits insuffisants) n'est pas la faute des lignes : elles sont
+retentées avec backoff jusqu'à ce qu'elle soit corrigée.
+
+Le point de reprise (dernier enregistrement traité sans trou avant lui) est
+écrit dans `checkpoint` ; les enregistrements traités au-delà sont notés
+dans `done`. Au redémarrage, seuls les enregistrements ni avant le point de
+reprise ni dans `done` sont réinsérés. Livraison au moins une fois : un
+INSERT réussi dont la réponse (ou la note dans `done`) s'est perdue est rejoué.
+
+Enregistrement : longueur, crc32, seq, horodatage d'ajout, puis MessagePack
+{"s": session_id, "r": lignes}. Une fin de segment tronquée (arrêt pendant
+une écriture) est ignorée et coupée à la relecture.
+
+Hors démarrage, les fsync et les écritures de `checkpoint`, `done` et
+`dead-letter.log` passent par le pool de threads, jamais par la boucle.
+"""
+import asyncio
+import fcntl
+import os
+import random
+import struct
+import time
+import zlib
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import msgpack
+from postgrest.exceptions import APIError
+
+from config.database import supabase_config
+from config.metrics import registry
+from sessions.ingest import CHUNK_SIZE, chunked, on_rows_written
+
+SPOOL_DIR = os.getenv("INGEST_SPOOL_DIR")
+# "always" : fsync (groupé) avant l'accusé ; "interval" : fsync à chaque tour du flusher ; "never"
+SPOOL_FSYNC = os.getenv("INGEST_SPOOL_FSYNC", "always")
+SPOOL_SEGMENT_BYTES = int(os.getenv("INGEST_SPOOL_SEGMENT_BYTES", str(16 * 1024 * 1024)))
+# Au-delà, les nouvelles lignes sont refusées (503) jusqu'à ce que le flush rattrape
+SPOOL_MAX_BYTES = int(os.getenv("INGEST_SPOOL_MAX_BYTES", str(512 * 1024 * 1024)))
+SPOOL_BATCH_ROWS = int(os.getenv("INGEST_SPOOL_BATCH_ROWS", str(CHUNK_SIZE)))
+SPOOL_FLUSH_INTERVAL = float(os.getenv("INGEST_SPOOL_FLUSH_INTERVAL", "0.5"))
+SPOOL_BACKOFF_MIN = float(os.getenv("INGEST_SPOOL_BACKOFF_MIN", "0.5"))
+SPOOL_BACKOFF_MAX = float(os.getenv("INGEST_SPOOL_BACKOFF_MAX", "60"))
+# Tentatives avant mise à l'écart dans dead-letter.log (0 : réessayer indéfiniment)
+SPOOL_MAX_ATTEMPTS = int(os.getenv("INGEST_SPOOL_MAX_ATTEMPTS", "20"))
+
+HEADER = struct.Struct('<IIQd')
+DONE_ENTRY = struct.Struct('<Q')
+# Refus du contenu : données invalides (22), contraintes (23), colonne inconnue ou de mauvais type
+DATA_ERROR_SQLSTATES = ('22', '23', '42703', '42804')
+# PGRST1xx : requête invalide (corps, paramètres) ; PGRST2xx : colonne ou relation inconnue
+DATA_ERROR_PGRST = ('PGRST1', 'PGRST2')
+DATA_ERROR_STATUSES = (400, 409, 413, 422)
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".log"
+
+spool_pending_rows = registry.gauge("mokart_spool_pending_rows", "Lignes du spool pas encore insérées")
+spool_pending_bytes = registry.gauge("mokart_spool_pending_bytes", "Octets du spool pas encore insérés")
+spool_flush_lag = registry.gauge("mokart_spool_flush_lag_seconds", "Âge de la plus ancienne ligne pas encore insérée")
+spool_flushed_rows = registry.counter("mokart_spool_flushed_rows_total", "Lignes du spool insérées dans Supabase")
+spool_flush_failures = registry.counter("mokart_spool_flush_failures_total", "INSERT du spool en échec")
+spool_dead_rows = registry.counter("mokart_spool_dead_letter_rows_total", "Lignes mises à l'écart après trop d'échecs")
+
+
+class SpoolFull(Exception):
+    """Spool au-delà de SPOOL_MAX_BYTES : Supabase ne suit pas"""
+
+
+def _error_code(error: Exception):
+    return error.code if isinstance(error, APIError) else None
+
+
+def permanent_error(error: Exception) -> bool:
+    """Le serveur a refusé le contenu du lot : le réessayer donnerait le même refus
+
+    Les erreurs PostgREST portent un SQLSTATE ("23503"), un code PGRST ou, sans
+    corps JSON, le statut HTTP. Timeouts et erreurs réseau ne sont pas des APIError.
+    """
+    code = _error_code(error)
+    if isinstance(code, int) or (isinstance(code, str) and code.isdigit() and len(code) == 3):
+        return int(code) in DATA_ERROR_STATUSES
+    if not code:
+        return False
+    if code.startswith('PGRST'):
+        return code.startswith(DATA_ERROR_PGRST)
+    return code.startswith(DATA_ERROR_SQLSTATES)
+
+
+def denied_error(error: Exception) -> bool:
+    """Clé de service expirée ou sans les droits (401/403, JWT PGRST3xx, 42501 dont RLS)"""
+    code = _error_code(error)
+    if isinstance(code, int) or (isinstance(code, str) and code.isdigit() and len(code) == 3):
+        return int(code) in (401, 403)
+    return isinstance(code, str) and (code.startswith('PGRST3') or code == '42501')
+
+
+class Record:
+    __slots__ = ('seq', 'session_id', 'rows', 'size', 'appended_at', 'attempts', 'not_before', 'isolated')
+
+    def __init__(self, seq: int, session_id: str, rows: List[dict], size: int, appended_at: float):
+        self.seq = seq
+        self.session_id = session_id
+        self.rows = rows
+        self.size = size
+        self.appended_at = appended_at
+        self.attempts = 0
+        self.not_before = 0.0
+        # Inséré seul après le refus définitif d'un lot groupé
+        self.isolated = False
+
+
+def encode_record(seq: int, session_id: str, rows: List[dict], appended_at: float) -> bytes:
+    payload = msgpack.packb({"s": session_id, "r": rows})
+    return HEADER.pack(len(payload), zlib.crc32(payload), seq, appended_at) + payload
+
+
+def read_segment(path: str) -> tuple[List[Record], int]:
+    """Enregistrements valides d'un segment et la taille de la partie saine du fichier"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    records, offset = [], 0
+    while offset + HEADER.size <= len(data):
+        length, crc, seq, appended_at = HEADER.unpack_from(data, offset)
+        payload = data[offset + HEADER.size:offset + HEADER.size + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            break
+        body = msgpack.unpackb(payload)
+        records.append(Record(seq, body['s'], body['r'], HEADER.size + length, appended_at))
+        offset += HEADER.size + length
+    return records, offset
+
+
+def close_segment(f):
+    """Segment plein ou arrêt : rendu durable puis fermé (toujours fsync, quel que soit SPOOL_FSYNC)"""
+    f.flush()
+    os.fsync(f.fileno())
+    f.close()
+
+
+class IngestSpool:
+    def __init__(self, directory: Optional[str] = SPOOL_DIR, fsync: str = SPOOL_FSYNC,
+                 segment_bytes: int = SPOOL_SEGMENT_BYTES, max_bytes: int = SPOOL_MAX_BYTES):
+        self.directory = directory
+        self.fsync = fsync
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.enabled = False
+        self._pending: "OrderedDict[int, Record]" = OrderedDict()
+        self._pending_bytes = 0
+        self._pending_rows = 0
+        self._done: set = set()
+        # Enregistrements traités pas encore notés dans le fichier `done`
+        self._unsaved_done: List[int] = []
+        # Enregistrements mis à l'écart pas encore écrits dans dead-letter.log
+        self._unsaved_dead: List[bytes] = []
+        self._done_file = None
+        self._next_seq = 1
+        self._checkpoint = 0
+        # Segments : seq du premier enregistrement -> chemin
+        self._segments: "OrderedDict[int, str]" = OrderedDict()
+        self._file = None
+        self._file_bytes = 0
+        self._written_seq = 0
+        self._synced_seq = 0
+        self._syncing: Optional[asyncio.Future] = None
+        self._rotation: Optional[asyncio.Lock] = None
+        self._lock_file = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self.dead_rows = 0
+
+    # Démarrage, relecture
+
+    def open(self):
+        """Verrouiller le répertoire, relire le spool existant (sans réseau)"""
+        if not self.directory or self.enabled:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock_file = open(os.path.join(self.directory, "lock"), 'w')
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            print(f"⚠️ Spool {self.directory} déjà utilisé par un autre processus : ingestion directe")
+            self._lock_file.close()
+            self._lock_file = None
+            return
+
+        self._checkpoint = self._read_checkpoint()
+        self._next_seq = self._checkpoint + 1
+        self._done = {seq for seq in self._read_done() if seq > self._checkpoint}
+        replayed = 0
+        for name in sorted(os.listdir(self.directory)):
+            if not (name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)):
+                continue
+            path = os.path.join(self.directory, name)
+            records, valid = read_segment(path)
+            if valid < os.path.getsize(path):
+                print(f"⚠️ Segment {name} tronqué à {valid} octets (écriture interrompue)")
+                os.truncate(path, valid)
+            self._segments[int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])] = path
+            for record in records:
+                self._next_seq = max(self._next_seq, record.seq + 1)
+                if record.seq > self._checkpoint and record.seq not in self._done:
+                    self._add_pending(record)
+                    replayed += 1
+        self._written_seq = self._synced_seq = self._next_seq - 1
+        if self._advance_checkpoint():
+            self._write_checkpoint(self._checkpoint)
+        self._rewrite_done(self._done_entries(sorted(self._done)))
+        self._remove_segments(self._collect_segments())
+        self._rotation = asyncio.Lock()
+        self.enabled = True
+        if replayed:
+            print(f"🔁 Spool : {replayed} enregistrements ({self._pending_rows} lignes) à réinsérer")
+
+    def _read_checkpoint(self) -> int:
+        try:
+            with open(os.path.join(self.directory, "checkpoint")) as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def _read_done(self) -> List[int]:
+        try:
+            with open(os.path.join(self.directory, "done"), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return []
+        # Une entrée tronquée (arrêt pendant l'écriture) est ignorée
+        usable = len(data) - len(data) % DONE_ENTRY.size
+        return [seq for (seq,) in DONE_ENTRY.iter_unpack(data[:usable])]
+
+    # Écritures d'état (au démarrage, puis dans le pool de threads)
+
+    def _sync(self, f):
+        f.flush()
+        if self.fsync != "never":
+            os.fsync(f.fileno())
+
+    def _write_atomic(self, name: str, data: bytes):
+        path = os.path.join(self.directory, name)
+        with open(path + ".tmp", 'wb') as f:
+            f.write(data)
+            self._sync(f)
+        os.replace(path + ".tmp", path)
+
+    @staticmethod
+    def _done_entries(seqs) -> bytes:
+        return b''.join(DONE_ENTRY.pack(seq) for seq in seqs)
+
+    def _write_checkpoint(self, checkpoint: int):
+        self._write_atomic("checkpoint", str(checkpoint).encode())
+
+    def _rewrite_done(self, entries: bytes):
+        """Remplacer `done` (seuls les enregistrements traités au-delà du point de reprise)"""
+        if self._done_file is not None:
+            self._done_file.close()
+        self._write_atomic("done", entries)
+        self._done_file = open(os.path.join(self.directory, "done"), 'ab')
+
+    def _remove_segments(self, paths: List[str]):
+        for path in paths:
+            os.remove(path)
+
+    def _write_state(self, dead: bytes, checkpoint: Optional[int], done: bytes, segments: List[str]):
+        """Fin de tour de flush, dans l'ordre qui garde le spool cohérent après un arrêt :
+        mises à l'écart, point de reprise et `done`, puis seulement suppression des segments"""
+        if dead:
+            with open(os.path.join(self.directory, "dead-letter.log"), 'ab') as f:
+                f.write(dead)
+                self._sync(f)
+        if checkpoint is not None:
+            self._write_checkpoint(checkpoint)
+            self._rewrite_done(done)
+        elif done:
+            self._done_file.write(done)
+            self._sync(self._done_file)
+        self._remove_segments(segments)
+
+    async def _persist(self):
+        """Noter les enregistrements traités depuis le dernier appel (au plus deux fsync, hors de la boucle)"""
+        dead = b''.join(self._unsaved_dead)
+        self._unsaved_dead.clear()
+        if self._advance_checkpoint():
+            checkpoint, done = self._checkpoint, self._done_entries(sorted(self._done))
+        else:
+            checkpoint, done = None, self._done_entries(self._unsaved_done)
+        self._unsaved_done.clear()
+        segments = self._collect_segments()
+        if dead or checkpoint is not None or done or segments:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self._write_state, dead, checkpoint, done, segments)
+
+    def start(self):
+        self.open()
+        if self.enabled and self._task is None:
+            self._stopping = False
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float = 5.0):
+        """Dernier flush (borné par `timeout`), puis fermeture ; le reste sera rejoué au démarrage"""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            print(f"⚠️ Flush final du spool incomplet : {self._pending_rows} lignes seront rejouées")
+        self._task = None
+        loop = asyncio.get_running_loop()
+        if self._file is not None:
+            await loop.run_in_executor(None, close_segment, self._file)
+            self._file = None
+        await self._persist()
+        self._done_file.close()
+        self._done_file = None
+        self._lock_file.close()
+        self._lock_file = None
+        self.enabled = False
+
+    # Ajout
+
+    def _add_pending(self, record: Record):
+        self._pending[record.seq] = record
+        self._pending_bytes += record.size
+        self._pending_rows += len(record.rows)
+
+    async def _segment_file(self):
+        async with self._rotation:
+            loop = asyncio.get_running_loop()
+            if self._file is not None and self._file_bytes >= self.segment_bytes and self._syncing is None:
+                # Rotation (jamais pendant un fsync en cours) : le segment plein est rendu durable
+                # puis fermé dans le pool ; les ajouts qui attendent leur fsync attendent celui-ci
+                target, full = self._written_seq, self._file
+                self._file = None
+                self._syncing = loop.run_in_executor(None, close_segment, full)
+                try:
+                    await self._syncing
+                    self._synced_seq = max(self._synced_seq, target)
+                finally:
+                    self._syncing = None
+            if self._file is None:
+                path = os.path.join(self.directory, f"{SEGMENT_PREFIX}{self._next_seq:016d}{SEGMENT_SUFFIX}")
+                self._segments[self._next_seq] = path
+                self._file = await loop.run_in_executor(None, open, path, 'ab')
+                self._file_bytes = 0
+            return self._file
+
+    async def append(self, session_id: str, rows: List[dict]):
+        """Ajouter des lignes au spool ; retourne une fois durables selon SPOOL_FSYNC
+
+        Les lots sont découpés en enregistrements d'au plus CHUNK_SIZE lignes :
+        chacun est inséré par un seul INSERT, donc tout ou rien.
+        """
+        if self._pending_bytes >= self.max_bytes:
+            raise SpoolFull(f"Spool plein ({self._pending_bytes} octets en attente)")
+        f = await self._segment_file()
+        now = time.time()
+        for _, chunk in chunked(rows, CHUNK_SIZE):
+            seq = self._next_seq
+            self._next_seq += 1
+            data = encode_record(seq, session_id, chunk, now)
+            f.write(data)
+            self._file_bytes += len(data)
+            self._add_pending(Record(seq, session_id, chunk, len(data), now))
+        f.flush()
+        self._written_seq = self._next_seq - 1
+        if self._pending_rows >= SPOOL_BATCH_ROWS and self._wakeup is not None:
+            self._wakeup.set()
+        if self.fsync == "always":
+            await self._durable(self._written_seq)
+
+    async def _durable(self, seq: int):
+        """fsync groupé : les ajouts simultanés attendent le même appel"""
+        while self._synced_seq < seq:
+            if self._syncing is None:
+                target, fileno = self._written_seq, self._file.fileno()
+                loop = asyncio.get_running_loop()
+                self._syncing = loop.run_in_executor(None, os.fsync, fileno)
+                try:
+                    await self._syncing
+                    self._synced_seq = max(self._synced_seq, target)
+                finally:
+                    self._syncing = None
+            else:
+                try:
+                    await asyncio.shield(self._syncing)
+                except Exception:
+                    pass
+
+    # Flush
+
+    def _due_batches(self, now: float) -> List[List[Record]]:
+        """Enregistrements prêts, groupés par session en lots d'au plus CHUNK_SIZE lignes"""
+        batches: List[List[Record]] = []
+        # Session -> (lot en cours, lignes du lot)
+        open_batches: Dict[str, tuple] = {}
+        for record in self._pending.values():
+            if record.not_before > now:
+                continue
+            if record.isolated:
+                batches.append([record])
+                continue
+            batch, size = open_batches.get(record.session_id, (None, 0))
+            if batch is None or size + len(record.rows) > CHUNK_SIZE:
+                batch, size = [], 0
+                batches.append(batch)
+            batch.append(record)
+            open_batches[record.session_id] = (batch, size + len(record.rows))
+        return batches
+
+    async def _insert(self, client, batch: List[Record]):
+        rows = [row for record in batch for row in record.rows]
+        session_id = batch[0].session_id
+        try:
+            await supabase_config.execute(client.table('sensor_data').insert(rows, returning='minimal'))
+        except Exception as e:
+            spool_flush_failures.inc()
+            self._retry_later(batch, e)
+            return
+        for record in batch:
+            self._release(record)
+        spool_flushed_rows.inc(len(rows))
+        on_rows_written(session_id, rows, publish=False)
+
+    def _retry_later(self, batch: List[Record], error: Exception):
+        denied = denied_error(error)
+        if not denied and permanent_error(error):
+            if len(batch) > 1:
+                # Refus d'un lot groupé : chaque enregistrement est retenté seul pour isoler le fautif
+                for record in batch:
+                    record.isolated = True
+                print(f"⚠️ Spool : lot de {len(batch)} enregistrements refusé, retenté un par un : {error}")
+            else:
+                self._dead_letter(batch[0], error)
+            return
+        for record in batch:
+            record.attempts += 1
+            # Clé refusée : rien à reprocher aux lignes, elles attendent que la clé soit corrigée
+            if SPOOL_MAX_ATTEMPTS and record.attempts >= SPOOL_MAX_ATTEMPTS and not denied:
+                self._dead_letter(record, error)
+                continue
+            # Backoff exponentiel avec gigue, pour ne pas réessayer tous en même temps
+            delay = min(SPOOL_BACKOFF_MIN * 2 ** (record.attempts - 1), SPOOL_BACKOFF_MAX)
+            record.not_before = time.monotonic() + delay * random.uniform(0.5, 1.0)
+        print(f"⚠️ Spool : INSERT de {sum(len(r.rows) for r in batch)} lignes en échec "
+              f"(tentative {batch[0].attempts}) : {error}")
+
+    def _dead_letter(self, record: Record, error: Exception):
+        # Écrit avec `done` à la fin du tour de flush
+        self._unsaved_dead.append(encode_record(record.seq, record.session_id, record.rows, record.appended_at))
+        self.dead_rows += len(record.rows)
+        spool_dead_rows.inc(len(record.rows))
+        print(f"❌ Spool : {len(record.rows)} lignes de {record.session_id} mises à l'écart : {error}")
+        self._release(record)
+
+    def _release(self, record: Record):
+        if self._pending.pop(record.seq, None) is None:
+            return
+        self._pending_bytes -= record.size
+        self._pending_rows -= len(record.rows)
+        self._done.add(record.seq)
+        self._unsaved_done.append(record.seq)
+
+    def _advance_checkpoint(self) -> bool:
+        """Avancer le point de reprise sur les enregistrements insérés sans trou (en mémoire)"""
+        checkpoint = self._checkpoint
+        while checkpoint + 1 in self._done:
+            checkpoint += 1
+            self._done.discard(checkpoint)
+        if checkpoint == self._checkpoint:
+            return False
+        self._checkpoint = checkpoint
+        return True
+
+    def _collect_segments(self) -> List[str]:
+        """Retirer les segments entièrement traités (jamais le segment courant) ; chemins à supprimer
+
+        Y compris au-delà du point de reprise : un enregistrement en attente ne
+        garde sur disque que son propre segment.
+        """
+        collected = []
+        firsts = list(self._segments)
+        for first, following in zip(firsts, firsts[1:]):
+            if all(seq <= self._checkpoint or seq in self._done for seq in range(first, following)):
+                collected.append(self._segments.pop(first))
+        return collected
+
+    async def flush(self):
+        """Insérer tout ce qui est dû maintenant"""
+        client = supabase_config.get_client()
+        if client is None:
+            return
+        batches = self._due_batches(time.monotonic())
+        if not batches:
+            return
+        await asyncio.gather(*(self._insert(client, batch) for batch in batches))
+        await self._persist()
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), SPOOL_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self.fsync == "interval" and self._file is not None and self._synced_seq < self._written_seq:
+                await self._durable(self._written_seq)
+            try:
+                # get_client() peut créer le client (import du SDK) : hors de la boucle la première fois
+                if supabase_config.client is None:
+                    await supabase_config.run(supabase_config.get_client)
+                await self.flush()
+            except Exception as e:
+                print(f"⚠️ Flush du spool impossible: {e}")
+
+    def stats(self) -> dict:
+        oldest = next(iter(self._pending.values()), None)
+        return {
+            "enabled": self.enabled,
+            "pending_records": len(self._pending),
+            "pending_rows": self._pending_rows,
+            "pending_bytes": self._pending_bytes,
+            "flush_lag_s": time.time() - oldest.appended_at if oldest else 0.0,
+            "checkpoint": self._checkpoint,
+            "segments": len(self._segments),
+            "dead_letter_rows": self.dead_rows,
+        }
+
+
+ingest_spool = IngestSpool()
+
+
+@registry.collector
+def collect_spool():
+    stats = ingest_spool.stats()
+    spool_pending_rows.set(stats["pending_rows"])
+    spool_pending_bytes.set(stats["pending_bytes"])
+    spool_flush_lag.set(stats["flush_lag_s"])
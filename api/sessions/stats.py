@@ -0,0 +1,100 @@
+from typing import List, Optional
+
+import numpy as np
+
+from sessions.frame import SessionFrame
+
+# Colonnes nécessaires au calcul des statistiques (jamais de select('*'))
+STATS_COLUMNS = ['timestamp', 'uwb_x', 'uwb_y', 'imu_ax', 'steering_angle']
+
+# Un écart entre deux échantillons est un trou s'il dépasse GAP_FACTOR x la période médiane
+GAP_FACTOR = 3.0
+MAX_REPORTED_GAPS = 20
+SPEED_PERCENTILES = [50, 90, 95, 99]
+
+
+def to_arrays(rows: List[dict], columns: List[str]) -> SessionFrame:
+    """Convertir une page PostgREST en colonnes typées triées par timestamp
+
+    `timestamp` devient un int64, les autres colonnes des float64 où None vaut NaN.
+    """
+    return SessionFrame.from_rows(rows, columns)
+
+
+def _coverage(frame: SessionFrame, column: str) -> float:
+    return (1 - frame.null_count(column) / frame.n_rows) * 100
+
+
+def _bound(values: np.ndarray, reducer) -> Optional[float]:
+    valid = values[~np.isnan(values)]
+    return float(reducer(valid)) if len(valid) else None
+
+
+def _sampling(timestamps: np.ndarray) -> dict:
+    dt = np.diff(timestamps)
+    if len(dt) == 0:
+        return {"median_interval_ms": None, "rate_hz": None, "jitter_ms": None, "max_interval_ms": None}
+    median = float(np.median(dt))
+    return {
+        "median_interval_ms": median,
+        "rate_hz": 1000.0 / median if median > 0 else None,
+        "jitter_ms": float(np.std(dt)),
+        "max_interval_ms": int(dt.max()),
+    }
+
+
+def _gaps(timestamps: np.ndarray) -> dict:
+    dt = np.diff(timestamps)
+    if len(dt) == 0:
+        return {"count": 0, "total_ms": 0, "max_ms": 0, "items": []}
+    threshold = GAP_FACTOR * max(float(np.median(dt)), 1.0)
+    idx = np.flatnonzero(dt > threshold)
+    return {
+        "count": int(len(idx)),
+        "total_ms": int(dt[idx].sum()),
+        "max_ms": int(dt[idx].max()) if len(idx) else 0,
+        "items": [
+            {"start": int(timestamps[i]), "end": int(timestamps[i + 1]), "duration_ms": int(dt[i])}
+            for i in idx[:MAX_REPORTED_GAPS]
+        ],
+    }
+
+
+def _speed(timestamps: np.ndarray, x: np.ndarray, y: np.ndarray, valid: np.ndarray) -> dict:
+    """Vitesse (m/s) entre points UWB valides consécutifs, timestamps en ms"""
+    t, x, y = timestamps[valid], x[valid], y[valid]
+    dt = np.diff(t) / 1000.0
+    moving = dt > 0
+    if not np.any(moving):
+        return {"mean": None, "max": None, **{f"p{q}": None for q in SPEED_PERCENTILES}}
+    speed = np.hypot(np.diff(x), np.diff(y))[moving] / dt[moving]
+    percentiles = np.percentile(speed, SPEED_PERCENTILES)
+    return {
+        "mean": float(speed.mean()),
+        "max": float(speed.max()),
+        **{f"p{q}": float(value) for q, value in zip(SPEED_PERCENTILES, percentiles)},
+    }
+
+
+def compute_stats(session_id: str, frame: SessionFrame) -> dict:
+    """Calculer toutes les statistiques d'une session à partir de ses colonnes triées"""
+    timestamps = frame['timestamp']
+    uwb_x, uwb_y = frame['uwb_x'], frame['uwb_y']
+    has_fix = frame.valid('uwb_x') & frame.valid('uwb_y')
+    return {
+        "session_id": session_id,
+        "total_points": int(len(timestamps)),
+        "duration_ms": int(timestamps[-1] - timestamps[0]) if len(timestamps) > 1 else 0,
+        "uwb_coverage": _coverage(frame, 'uwb_x'),
+        "imu_coverage": _coverage(frame, 'imu_ax'),
+        "steering_coverage": _coverage(frame, 'steering_angle'),
+        "bounds": {
+            "min_x": _bound(uwb_x, np.min),
+            "max_x": _bound(uwb_x, np.max),
+            "min_y": _bound(uwb_y, np.min),
+            "max_y": _bound(uwb_y, np.max)
+        },
+        "speed": _speed(timestamps, uwb_x, uwb_y, has_fix),
+        "sampling": _sampling(timestamps),
+        "gaps": _gaps(timestamps),
+    }
@@ -0,0 +1,62 @@
+import json
+from typing import AsyncIterator, Callable, List, Optional
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+_encode = json.JSONEncoder(separators=(',', ':')).encode
+
+
+def trajectory_rows(rows: List[dict]) -> List[dict]:
+    """Lignes sensor_data -> points de trajectoire, sans passer par TrajectoryPoint"""
+    return [
+        {"x": row['uwb_x'], "y": row['uwb_y'], "timestamp": row['timestamp'], "steering_angle": row.get('steering_angle')}
+        for row in rows
+        # Les lignes ingérées omettent les champs nuls (IMU seule, sans fix UWB)
+        if row.get('uwb_x') is not None and row.get('uwb_y') is not None
+    ]
+
+
+def _encode_ndjson(rows: List[dict]) -> bytes:
+    return ''.join(_encode(row) + '\n' for row in rows).encode()
+
+
+def _encode_json_items(rows: List[dict], first: bool) -> bytes:
+    body = ','.join(_encode(row) for row in rows)
+    return (body if first or not body else ',' + body).encode()
+
+
+async def stream_pages(pages: AsyncIterator[List[dict]], format: str = "ndjson",
+                       transform: Optional[Callable[[List[dict]], List[dict]]] = None) -> StreamingResponse:
+    """Réponse streamée au fil des pages : une page en mémoire à la fois
+
+    La première page est lue avant de répondre pour pouvoir encore renvoyer un
+    404 ; ensuite les erreurs amont ne peuvent plus qu'interrompre le flux.
+    `format` vaut "ndjson" (une ligne JSON par point) ou "json" (un tableau
+    JSON envoyé en chunks).
+    """
+    first_page = await anext(pages, None)
+    if first_page is None:
+        raise HTTPException(status_code=404, detail="Session non trouvée")
+
+    async def ndjson_body():
+        page = first_page
+        while page is not None:
+            yield _encode_ndjson(transform(page) if transform else page)
+            page = await anext(pages, None)
+
+    async def json_body():
+        yield b'['
+        page, first = first_page, True
+        while page is not None:
+            rows = transform(page) if transform else page
+            yield _encode_json_items(rows, first)
+            first = first and not rows
+            page = await anext(pages, None)
+        yield b']'
+
+    if format == "json":
+        return StreamingResponse(json_body(), media_type="application/json")
+    return StreamingResponse(ndjson_body(), media_type=NDJSON_MEDIA_TYPE)
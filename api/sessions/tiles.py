@@ -0,0 +1,124 @@
+"""Index spatial par tuiles pour les requêtes de fenêtre d'affichage (bbox)
+
+Les points sont regroupés par tuile carrée (stockage CSR : indices des points
+triés par tuile, début de chaque tuile). Une requête ne lit que les tuiles qui
+recoupent le rectangle : son coût suit la taille du résultat, pas celle de la
+session.
+"""
+import math
+import os
+from typing import Optional, Tuple
+
+import numpy as np
+
+# Nombre moyen de points visé par tuile occupée
+TILE_POINTS = int(os.getenv("TILE_POINTS", "64"))
+
+# Clés de tuile : (ix + OFFSET) * SPAN + (iy + OFFSET)
+OFFSET = 1 << 20
+SPAN = 1 << 21
+
+BBox = Tuple[float, float, float, float]
+
+
+def parse_bbox(bbox: Optional[str]) -> Optional[BBox]:
+    """"min_x,min_y,max_x,max_y" -> tuple ; ValueError si le rectangle est invalide"""
+    if not bbox:
+        return None
+    values = [float(value) for value in bbox.split(',')]
+    if len(values) != 4:
+        raise ValueError("bbox attend min_x,min_y,max_x,max_y")
+    if not all(math.isfinite(value) for value in values):
+        raise ValueError("bbox attend des coordonnées finies")
+    min_x, min_y, max_x, max_y = values
+    if min_x > max_x or min_y > max_y:
+        raise ValueError("bbox vide : min_x > max_x ou min_y > max_y")
+    return min_x, min_y, max_x, max_y
+
+
+def bbox_mask(x: np.ndarray, y: np.ndarray, bbox: BBox) -> np.ndarray:
+    min_x, min_y, max_x, max_y = bbox
+    return (x >= min_x) & (x <= max_x) & (y >= min_y) & (y <= max_y)
+
+
+def with_neighbours(indices: np.ndarray, n: int) -> np.ndarray:
+    """Ajouter le point précédent et le suivant de chaque point retenu
+
+    Les segments qui entrent dans le rectangle ou en sortent restent tracés
+    jusqu'au bord de l'écran.
+    """
+    if len(indices) == 0:
+        return indices
+    if 8 * len(indices) > n:
+        keep = np.zeros(n, dtype=bool)
+        keep[indices] = True
+        keep[indices[indices > 0] - 1] = True
+        keep[indices[indices < n - 1] + 1] = True
+        return np.flatnonzero(keep)
+    padded = np.concatenate((indices - 1, indices, indices + 1))
+    return np.unique(padded[(padded >= 0) & (padded < n)])
+
+
+class TileIndex:
+    """Tuiles creuses sur un nuage de points, taille de tuile adaptée à la densité"""
+
+    def __init__(self, x: np.ndarray, y: np.ndarray, tile_size: Optional[float] = None):
+        self.x, self.y = x, y
+        n = len(x)
+        if tile_size is None:
+            # Une trajectoire est une courbe : une tuile de côté égal au déplacement
+            # typique sur TILE_POINTS échantillons en contient environ TILE_POINTS
+            # par passage (mesuré sur TILE_POINTS pas, insensible au bruit UWB)
+            step = min(TILE_POINTS, n - 1)
+            travel = float(np.median(np.hypot(x[step:] - x[:-step], y[step:] - y[:-step]))) if step > 0 else 0.0
+            extent = max(float(np.ptp(x)) if n else 0.0, float(np.ptp(y)) if n else 0.0)
+            tile_size = max(travel, extent / OFFSET, 1e-6)
+        self.tile_size = tile_size
+
+        ix = np.floor(x / tile_size).astype(np.int64)
+        iy = np.floor(y / tile_size).astype(np.int64)
+        point_keys = (ix + OFFSET) * SPAN + (iy + OFFSET)
+        self.order = np.argsort(point_keys, kind='stable')
+        self.keys, self.start = np.unique(point_keys[self.order], return_index=True)
+        self.start = np.append(self.start, n)
+
+    def _tiles(self, bbox: BBox) -> np.ndarray:
+        """Positions (dans self.keys) des tuiles occupées qui recoupent le rectangle"""
+        min_x, min_y, max_x, max_y = bbox
+        lo_x, hi_x = int(np.floor(min_x / self.tile_size)), int(np.floor(max_x / self.tile_size))
+        lo_y, hi_y = int(np.floor(min_y / self.tile_size)), int(np.floor(max_y / self.tile_size))
+        lo_x, lo_y = max(lo_x, -OFFSET), max(lo_y, -OFFSET)
+        hi_x, hi_y = min(hi_x, OFFSET - 1), min(hi_y, OFFSET - 1)
+        if hi_x < lo_x or hi_y < lo_y:
+            return np.empty(0, dtype=np.int64)
+
+        if (hi_x - lo_x + 1) * (hi_y - lo_y + 1) > len(self.keys):
+            # Rectangle plus grand que l'ensemble des tuiles occupées : filtrer celles-ci
+            tx, ty = np.divmod(self.keys, SPAN)
+            tx, ty = tx - OFFSET, ty - OFFSET
+            return np.flatnonzero((tx >= lo_x) & (tx <= hi_x) & (ty >= lo_y) & (ty <= hi_y))
+
+        # Sinon une recherche dichotomique par colonne de tuiles
+        bases = (np.arange(lo_x, hi_x + 1) + OFFSET) * SPAN + OFFSET
+        first = np.searchsorted(self.keys, bases + lo_y, side='left')
+        last = np.searchsorted(self.keys, bases + hi_y, side='right')
+        counts = last - first
+        return np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts - first, counts)
+
+    def count(self, bbox: BBox) -> int:
+        """Majorant du nombre de points dans le rectangle (points des tuiles recoupées)"""
+        tiles = self._tiles(bbox)
+        return int((self.start[tiles + 1] - self.start[tiles]).sum())
+
+    def query(self, bbox: BBox) -> np.ndarray:
+        """Indices (croissants) des points dans le rectangle"""
+        tiles = self._tiles(bbox)
+        counts = self.start[tiles + 1] - self.start[tiles]
+        total = int(counts.sum())
+        if total == 0:
+            return np.empty(0, dtype=np.int64)
+        group_start = np.cumsum(counts) - counts
+        flat = np.arange(total) - np.repeat(group_start - self.start[tiles], counts)
+        candidates = self.order[flat]
+        inside = bbox_mask(self.x[candidates], self.y[candidates], bbox)
+        return np.sort(candidates[inside])
@@ -0,0 +1,172 @@
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from sessions.lod import build_pyramid, lttb, rdp
+from sessions.stats import to_arrays
+from sessions.tiles import BBox, TileIndex, bbox_mask, with_neighbours
+
+TRAJECTORY_COLUMNS = ['timestamp', 'uwb_x', 'uwb_y', 'steering_angle']
+
+# Tolérances RDP mémorisées par session terminée
+MAX_RDP_ENTRIES = 8
+
+
+class Trajectory:
+    """Trajectoire UWB triée par timestamp, sans les points sans position
+
+    `channels` porte d'éventuels canaux dérivés (vitesse, accélérations...)
+    alignés point à point, conservés par window() et take().
+    """
+
+    def __init__(self, timestamp: np.ndarray, x: np.ndarray, y: np.ndarray, steering_angle: np.ndarray,
+                 channels: Optional[Dict[str, np.ndarray]] = None):
+        self.timestamp = timestamp
+        self.x = x
+        self.y = y
+        self.steering_angle = steering_angle
+        self.channels = channels or {}
+
+    @classmethod
+    def from_rows(cls, rows: List[dict]) -> "Trajectory":
+        return cls.from_arrays(to_arrays(rows, TRAJECTORY_COLUMNS))
+
+    @classmethod
+    def from_arrays(cls, arrays: dict, channels: Optional[Dict[str, np.ndarray]] = None) -> "Trajectory":
+        """`channels` est aligné sur les lignes de `arrays`, filtré comme elles"""
+        valid = ~(np.isnan(arrays['uwb_x']) | np.isnan(arrays['uwb_y']))
+        return cls(arrays['timestamp'][valid], arrays['uwb_x'][valid], arrays['uwb_y'][valid], arrays['steering_angle'][valid],
+                   {name: values[valid] for name, values in (channels or {}).items()})
+
+    def __len__(self) -> int:
+        return len(self.timestamp)
+
+    def window(self, from_ts: Optional[int] = None, to_ts: Optional[int] = None) -> "Trajectory":
+        """Points dont le timestamp est dans [from_ts, to_ts], par recherche dichotomique"""
+        start = 0 if from_ts is None else int(np.searchsorted(self.timestamp, from_ts, side='left'))
+        stop = len(self) if to_ts is None else int(np.searchsorted(self.timestamp, to_ts, side='right'))
+        return self.take(slice(start, stop))
+
+    def take(self, indices: np.ndarray) -> "Trajectory":
+        """Sous-trajectoire : l'angle volant et les canaux suivent les sommets conservés"""
+        return Trajectory(self.timestamp[indices], self.x[indices], self.y[indices], self.steering_angle[indices],
+                          {name: values[indices] for name, values in self.channels.items()})
+
+    def select(self, channels: List[str]) -> "Trajectory":
+        """Même trajectoire, limitée aux canaux dérivés demandés"""
+        return Trajectory(self.timestamp, self.x, self.y, self.steering_angle,
+                          {name: self.channels[name] for name in channels})
+
+    def to_columns(self) -> Dict[str, np.ndarray]:
+        return {"timestamp": self.timestamp, "x": self.x, "y": self.y, "steering_angle": self.steering_angle, **self.channels}
+
+    def to_points(self) -> List[dict]:
+        columns = {"steering_angle": self.steering_angle, **self.channels}
+        names = list(columns)
+        values = [[None if value != value else value for value in column.tolist()] for column in columns.values()]
+        return [
+            {"x": x, "y": y, "timestamp": timestamp, **dict(zip(names, extra))}
+            for x, y, timestamp, *extra in zip(self.x.tolist(), self.y.tolist(), self.timestamp.tolist(), *values)
+        ]
+
+
+class TrajectoryLOD:
+    """Trajectoire complète et ses niveaux de détail
+
+    Pour une session terminée l'objet est gardé dans le store matérialisé :
+    la pyramide LTTB, les résultats RDP et les index de tuiles (un par niveau)
+    ne sont calculés qu'une fois.
+    """
+
+    def __init__(self, trajectory: Trajectory, pyramid: bool = False):
+        self.trajectory = trajectory
+        self.pyramid = pyramid
+        self._levels: Optional[Dict[int, np.ndarray]] = None
+        self._rdp: Dict[float, np.ndarray] = {}
+        self._tiles: Dict[Optional[int], TileIndex] = {}
+
+    @property
+    def levels(self) -> Dict[int, np.ndarray]:
+        if self._levels is None:
+            self._levels = build_pyramid(self.trajectory.x, self.trajectory.y)
+        return self._levels
+
+    def _lttb_indices(self, max_points: int) -> np.ndarray:
+        if self.pyramid:
+            # Le niveau de pyramide convient s'il a au moins la moitié des points demandés
+            fitting = [size for size in self.levels if size <= max_points]
+            if fitting and max_points < 2 * max(fitting):
+                return self.levels[max(fitting)]
+        return lttb(self.trajectory.x, self.trajectory.y, max_points)
+
+    def _rdp_indices(self, tolerance: float) -> np.ndarray:
+        indices = self._rdp.get(tolerance)
+        if indices is None:
+            indices = rdp(self.trajectory.x, self.trajectory.y, tolerance)
+            if len(self._rdp) >= MAX_RDP_ENTRIES:
+                self._rdp.pop(next(iter(self._rdp)))
+            self._rdp[tolerance] = indices
+        return indices
+
+    def _tile_index(self, level: Optional[int] = None) -> TileIndex:
+        """Index de tuiles de la trajectoire complète (level None) ou d'un niveau de pyramide"""
+        index = self._tiles.get(level)
+        if index is None:
+            points = slice(None) if level is None else self.levels[level]
+            index = TileIndex(self.trajectory.x[points], self.trajectory.y[points])
+            self._tiles[level] = index
+        return index
+
+    def viewport(self, bbox: BBox, max_points: Optional[int] = None) -> Trajectory:
+        """Points dans le rectangle, par les index de tuiles
+
+        Si le rectangle contient peu de points (vue zoomée), ils sont tous
+        renvoyés ; sinon on interroge le niveau de pyramide dont la part dans
+        le rectangle tient dans `max_points` (vue d'ensemble). Le coût suit la
+        taille du résultat.
+        """
+        n = len(self.trajectory)
+        full = self._tile_index()
+        estimated = full.count(bbox)
+        if max_points is None or estimated <= max_points or not self.levels:
+            indices = with_neighbours(full.query(bbox), n)
+        else:
+            fitting = [size for size in self.levels if size * estimated / n <= max_points]
+            level = max(fitting) if fitting else min(self.levels)
+            base = self.levels[level]
+            indices = base[with_neighbours(self._tile_index(level).query(bbox), len(base))]
+
+        trajectory = self.trajectory.take(indices)
+        if max_points is not None and len(trajectory) > max_points:
+            trajectory = trajectory.take(lttb(trajectory.x, trajectory.y, max_points))
+        return trajectory
+
+    def downsample(self, max_points: Optional[int] = None, tolerance: Optional[float] = None,
+                   from_ts: Optional[int] = None, to_ts: Optional[int] = None,
+                   bbox: Optional[BBox] = None) -> Trajectory:
+        """RDP si `tolerance` est donnée, puis LTTB si le résultat dépasse `max_points`
+
+        Sur une fenêtre temporelle, la pyramide (calculée sur toute la session)
+        ne s'applique pas : la fenêtre est simplifiée directement. `bbox` limite
+        le résultat aux points d'un rectangle (plus leurs voisins immédiats).
+        """
+        if from_ts is not None or to_ts is not None:
+            return TrajectoryLOD(self.trajectory.window(from_ts, to_ts)).downsample(max_points, tolerance, bbox=bbox)
+
+        if bbox is not None:
+            if self.pyramid and tolerance is None:
+                return self.viewport(bbox, max_points)
+            # Session en cours ou simplification RDP : filtrage direct
+            inside = np.flatnonzero(bbox_mask(self.trajectory.x, self.trajectory.y, bbox))
+            clipped = self.trajectory.take(with_neighbours(inside, len(self.trajectory)))
+            return TrajectoryLOD(clipped).downsample(max_points, tolerance)
+
+        trajectory = self.trajectory
+        if tolerance is not None:
+            trajectory = trajectory.take(self._rdp_indices(tolerance))
+            if max_points is not None and len(trajectory) > max_points:
+                trajectory = trajectory.take(lttb(trajectory.x, trajectory.y, max_points))
+            return trajectory
+        if max_points is not None and len(trajectory) > max_points:
+            return trajectory.take(self._lttb_indices(max_points))
+        return trajectory